@@ -25,6 +25,7 @@ from flask import (
     redirect,
     url_for,
     send_file,
+    Response,
 )
 from werkzeug.utils import secure_filename
 from PIL import Image
@@ -33,13 +34,25 @@ from PIL import Image
 from dmScreen.cache_worker import (
     init_cache_system,
     shutdown_cache_system,
-    queue_image_for_caching,
+    notify_image_viewed,
+    set_active_folder,
     is_image_cached
 )
 
 
 
 from dmScreen.updater import check_for_update
+from dmScreen.imaging import (
+    image_hash, cache_path_for, render_to_cache, ingest_image, make_thumbnail, make_placeholder, has_transformation,
+    rendered_size, stored_size
+)
+from dmScreen.thumbnail_jobs import ThumbnailRegeneration, thumbnail_signature
+from dmScreen.importer import DirectoryImport, is_importable_path
+from dmScreen.events import EventBus, coalesce, format_event
+from dmScreen import asgi, wsgi
+from dmScreen.admission import decode_budget, image_pixels, BudgetExhausted, FOREGROUND_WAIT
+from dmScreen.uploads import UploadSessions, UploadError, save_stream, CHUNK_SIZE as UPLOAD_CHUNK_SIZE
+from dmScreen import load_monitor
 
 # Update check is now called conditionally in main() based on --disable-networking flag
 
@@ -53,6 +66,8 @@ from dmScreen.wifi import (
     disconnect_and_forget_current,
     set_target_wifi,
     set_change_callback,
+    set_state_callback,
+    fake_network_manager,
     check_adhoc_network,
     check_wifi_connection,
     run_cmd,
@@ -60,6 +75,7 @@ from dmScreen.wifi import (
     get_lan_ip,
     list_known_networks,
     forget_and_remove_known,
+    command_metrics,
 )
 
 # Global variables
@@ -68,7 +84,8 @@ last_network_change = 0  # Track when network configuration last changed
 wifi_reconcile_event = threading.Event()  # Event-driven monitor trigger
 DISABLE_NETWORKING = False  # Flag to disable all network-related functions
 
-# Cached network status to avoid frequent system calls on polling endpoints
+# Network status snapshot, replaced as a whole by recompute_network_status();
+# requests only read it and never run nmcli themselves
 NETWORK_STATUS_CACHE = {
     'connected': False,
     'ssid': None,
@@ -76,9 +93,17 @@ NETWORK_STATUS_CACHE = {
     'admin_url': None,
 }
 
-# Long polling support - condition variable to notify waiting clients
-update_condition = threading.Condition()
-processing_condition = threading.Condition()
+# Event log of all changes: streamed by /api/events, long polled by /api/updates
+event_bus = EventBus(SERVER_INSTANCE_ID)
+EVENTS_HEARTBEAT_INTERVAL = 15  # Seconds between keep-alive comments on an idle stream
+LONG_POLL_TIMEOUT = 30.0  # Seconds a long poll waits for a change
+# HTTP servers main() can run the app with (--server / DM_SERVER)
+SERVER_MODES = ('dev', 'asgi', 'waitress')
+# Set when the server drains on shutdown; event streams and long polls end
+server_stopping = threading.Event()
+# Seconds between background recomputations of the network status
+NETWORK_STATUS_INTERVAL = float(os.getenv('DM_NETWORK_STATUS_INTERVAL', '10'))
+network_refresh_requested = threading.Event()  # Wakes network_status_refresher() early
 
 # Cache for view.html to avoid reading from SD-card on every request (Fix #9)
 _view_html_cache = None
@@ -91,21 +116,40 @@ image_processing_queue = queue.Queue()
 processing_worker_threads = []
 processing_shutdown_event = threading.Event()
 processing_lock = threading.Lock()
+processing_min_workers = 1
+processing_max_workers = 1
+# Failed processing is retried with exponential backoff up to this many attempts
+PROCESSING_MAX_ATTEMPTS = int(os.getenv('DM_PROCESSING_MAX_ATTEMPTS', '3'))
+PROCESSING_RETRY_DELAY = 5  # Seconds before the first retry, doubled for each further attempt
+# Striped locks serializing registration, processing results and deletion of uploads with the same content
+content_locks = [threading.Lock() for _ in range(64)]
+
+# Long-poll endpoints mostly sit idle and are not counted as request load
+IDLE_ENDPOINTS = {'check_updates', 'stream_events', 'get_processing_status', 'get_thumbnail_regeneration',
+                  'get_import_status'}
 
 
 def recompute_network_status():
-    """Recompute and cache network status: connected, ssid, adhoc_active, and admin_url."""
+    """Recompute and cache network status: connected, ssid, adhoc_active, and admin_url.
+
+    Runs in network_status_refresher() (and once at startup), as it calls
+    nmcli. Clients are notified with a 'network' event if the status changed.
+    """
+    global NETWORK_STATUS_CACHE
+    previous = NETWORK_STATUS_CACHE
     # Skip network status recomputation if networking is disabled
     if DISABLE_NETWORKING:
         port = int(os.getenv('PORT', '80'))
         port_part = '' if port == 80 else f':{port}'
-        NETWORK_STATUS_CACHE.update({
+        NETWORK_STATUS_CACHE = {
             'connected': False,
             'ssid': None,
             'adhoc_active': False,
             'admin_url': f"http://127.0.0.1{port_part}/admin",
             'scanned_ssids': []
-        })
+        }
+        if NETWORK_STATUS_CACHE != previous:
+            event_bus.publish('network', client_status())
         return
     
     ssid = None
@@ -124,21 +168,53 @@ def recompute_network_status():
     port = int(os.getenv('PORT', '80'))
     port_part = '' if port == 80 else f':{port}'
     admin_url = f"http://{ip_address}{port_part}/admin"
-    NETWORK_STATUS_CACHE.update({
+    NETWORK_STATUS_CACHE = {
         'connected': connected,
         'ssid': ssid,
         'adhoc_active': adhoc_active,
         'admin_url': admin_url,
-        'scanned_ssids': get_scanned_ssids()
-    })
+        'scanned_ssids': list(get_scanned_ssids())
+    }
+    if NETWORK_STATUS_CACHE != previous:
+        event_bus.publish('network', client_status())
+
+def network_status_refresher():
+    """Recompute the network status every NETWORK_STATUS_INTERVAL seconds, or early when requested."""
+    while True:
+        network_refresh_requested.wait(NETWORK_STATUS_INTERVAL)
+        network_refresh_requested.clear()
+        try:
+            recompute_network_status()
+        except Exception as e:
+            print(f"Error refreshing network status: {e}")
+
+def request_network_refresh():
+    """Have network_status_refresher() recompute the network status now, e.g. after a WiFi change."""
+    network_refresh_requested.set()
+
+def client_status():
+    """Return the server and network status shown by the clients (from the cached network status)."""
+    cache = NETWORK_STATUS_CACHE
+    return {
+        'instance_id': SERVER_INSTANCE_ID,
+        'admin_connected': admin_connected,
+        'ip': cache.get('admin_url'),
+        'wifi_connected': cache.get('connected'),
+        'scanned_ssids': cache.get('scanned_ssids'),
+        'ssid': cache.get('ssid'),
+        'adhoc_active': cache.get('adhoc_active'),
+        'adhoc_ssid': 'dmscreen' if cache.get('adhoc_active') else None,
+        'adhoc_password': 'dmscreen' if cache.get('adhoc_active') else None
+    }
 
 def reset_admin_connection():
     """Reset the admin_connected flag when network configuration changes"""
     global admin_connected, last_network_change
     admin_connected = False
     last_network_change = time.time()
+    request_network_refresh()
     try:
-        update_timestamp()
+        update_timestamp('network', client_status())
     except Exception:
         pass
 
@@ -151,14 +227,23 @@ def configure_wifi_wrapper(ssid, password):
     return result
 
 # Image processing worker system
-def init_image_processing(num_workers=2):
-    """Initialize the image processing worker system."""
-    global processing_worker_threads
+def init_image_processing(min_workers=1, max_workers=None):
+    """Initialize the image processing worker system.
+
+    One thread is started per possible worker; how many of them take jobs at a
+    time is decided by load_monitor.recommended_workers().
+    """
+    global processing_worker_threads, processing_min_workers, processing_max_workers
+    
+    if max_workers is None:
+        max_workers = load_monitor.cpu_count()
+    processing_min_workers = min_workers
+    processing_max_workers = max(min_workers, max_workers)
     
-    print(f"Starting image processing system with {num_workers} workers")
+    print(f"Starting image processing system with {processing_min_workers}-{processing_max_workers} workers")
     
-    for i in range(num_workers):
-        worker = threading.Thread(target=image_processing_worker, daemon=True, name=f"ImageProcessor-{i}")
+    for i in range(processing_max_workers):
+        worker = threading.Thread(target=image_processing_worker, args=(i,), daemon=True, name=f"ImageProcessor-{i}")
         worker.start()
         processing_worker_threads.append(worker)
     
@@ -179,99 +264,232 @@ def shutdown_image_processing():
     
     print("Image processing system shut down")
 
-def image_processing_worker():
+def content_lock(key):
+    """Return the lock guarding the files of one content hash (or image id for older uploads)."""
+    return content_locks[hash(key) % len(content_locks)]
+
+def schedule_processing_job(job, delay=0):
+    """Put a processing job on the queue, after delay seconds if given."""
+    if delay <= 0:
+        image_processing_queue.put(job)
+        return
+    timer = threading.Timer(delay, image_processing_queue.put, args=(job,))
+    timer.daemon = True
+    timer.start()
+
+def refresh_placeholders(image_path, transformed_only=False):
+    """Recompute the placeholder previews of all images showing an image file.
+
+    Each distinct transformation is rendered once, from the thumbnail.
+
+    Args:
+        image_path: Path of the image file
+        transformed_only: Only update rotated, mirrored or cropped images; the
+            placeholder made at ingest already fits the others
+    """
+    placeholders = {}
+    rendered = {}
+    for image in db.get_database()['images']:
+        if image['path'] != image_path or not image.get('thumb_path'):
+            continue
+        if transformed_only and not has_transformation(image):
+            continue
+        key = image_hash(image)
+        if key not in rendered:
+            try:
+                rendered[key] = make_placeholder(os.path.join(UPLOAD_FOLDER, image['thumb_path']), image)
+            except Exception as e:
+                print(f"Error creating placeholder for {image_path}: {e}")
+                rendered[key] = None
+        if rendered[key]:
+            placeholders[image['id']] = rendered[key]
+    db.set_image_placeholders(placeholders)
+
+def backfill_placeholders():
+    """Create placeholders for images uploaded before they were made at ingest (runs in a thread)."""
+    paths = {img['path'] for img in db.get_database().get('images', [])
+             if img.get('thumb_path') and 'placeholder' not in img
+             and img.get('processing_status', 'completed') == 'completed'}
+    for path in paths:
+        refresh_placeholders(path)
+    if paths:
+        print(f"Created placeholders for {len(paths)} images")
+        update_timestamp()
+
+def resume_image_processing():
+    """Re-enqueue images whose processing did not finish before the last shutdown.
+
+    Images still marked "processing" were interrupted mid-way; that counts as
+    an attempt, so an image that keeps crashing the server ends up "failed"
+    instead of being retried forever.
+    """
+    quality = db.get_setting('image_quality', 85)
+    resumed = 0
+    scheduled_hashes = set()
+    
+    for image in db.get_database().get('images', []):
+        status = image.get('processing_status', 'completed')
+        if status not in ('pending', 'processing'):
+            continue
+        # Images sharing a file are processed once
+        if image.get('content_hash') in scheduled_hashes:
+            continue
+        
+        attempts = image.get('processing_attempts', 0)
+        filepath = os.path.join(UPLOAD_FOLDER, image['path'])
+        if not os.path.exists(filepath):
+            db.update_image_processing_status(image['id'], 'failed', error='Uploaded file is missing')
+            continue
+        if status == 'processing' and attempts >= PROCESSING_MAX_ATTEMPTS:
+            db.update_image_processing_status(image['id'], 'failed', error='Processing was interrupted too often')
+            continue
+        
+        if status == 'processing':
+            db.update_image_processing_status(image['id'], 'pending', error='Processing was interrupted')
+        next_attempt = image.get('processing_next_attempt') or 0
+        schedule_processing_job({
+            'image_id': image['id'],
+            'filepath': filepath,
+            'filename': image['path'],
+            'quality': quality,
+            'attempts': attempts,
+            'content_hash': image.get('content_hash')
+        }, delay=next_attempt - time.time())
+        if image.get('content_hash'):
+            scheduled_hashes.add(image['content_hash'])
+        resumed += 1
+    
+    if resumed:
+        print(f"Resumed processing of {resumed} images")
+
+def regenerate_thumbnail(job):
+    """Regenerate one thumbnail of a thumbnail regeneration run (a 'thumbnail' processing job)."""
+    run_id = job['run_id']
+    path = job['path']
+    if not thumbnail_regeneration.is_current(run_id):
+        return
+    
+    try:
+        thumb_path = f"thumb_{os.path.splitext(path)[0]}.webp"
+        original_file_path = os.path.join(UPLOAD_FOLDER, path)
+        make_thumbnail(original_file_path, os.path.join(UPLOAD_FOLDER, thumb_path), job['quality'], (500, 500))
+        db.set_image_thumbnail(path, thumb_path, thumbnail_signature(original_file_path, job['quality']))
+        refresh_placeholders(path)
+        thumbnail_regeneration.item_done(run_id, path)
+    except Exception as e:
+        print(f"Error regenerating thumbnail for {path}: {e}")
+        thumbnail_regeneration.item_done(run_id, path, error=True)
+    
+    if not thumbnail_regeneration.is_current(run_id):
+        # Run finished: notify clients so they reload the gallery
+        update_timestamp()
+
+def resume_thumbnail_regeneration():
+    """Re-enqueue the rest of a thumbnail regeneration run interrupted by the last shutdown."""
+    run = thumbnail_regeneration.resume()
+    if run is None:
+        return
+    for path in run['pending']:
+        schedule_processing_job({'type': 'thumbnail', 'run_id': run['run_id'], 'path': path, 'quality': run['quality']})
+    print(f"Resumed thumbnail regeneration: {len(run['pending'])} of {run['total']} thumbnails left")
+
+def image_processing_worker(worker_index=0):
     """Worker thread that processes images from the queue."""
     while not processing_shutdown_event.is_set():
+        if worker_index >= load_monitor.recommended_workers(processing_min_workers, processing_max_workers):
+            processing_shutdown_event.wait(0.5)
+            continue
+
         try:
             # Get a job from the queue with a timeout
             job = image_processing_queue.get(timeout=1.0)
             
+            if job.get('type') == 'thumbnail':
+                try:
+                    regenerate_thumbnail(job)
+                finally:
+                    image_processing_queue.task_done()
+                continue
+            
             try:
                 image_id = job['image_id']
                 filepath = job['filepath']
                 filename = job['filename']
                 quality = job['quality']
+                attempts = job.get('attempts', 0) + 1
                 
-                print(f"Processing image: {filename}")
+                print(f"Processing image: {filename} (attempt {attempts})")
                 
                 # Update status to "processing"
-                db.update_image_processing_status(image_id, 'processing')
+                db.update_image_processing_status(image_id, 'processing', attempts=attempts)
                 # Notify long polling clients
-                with processing_condition:
-                    processing_condition.notify_all()
-                
-                thumb_filename = filename
+                notify_processing(image_id)
                 
                 try:
-                    # Open image and process it
-                    with Image.open(filepath) as img:
-                        # Convert to RGB if necessary
-                        if img.mode in ('RGBA', 'LA', 'P'):
-                            rgb_img = Image.new('RGB', img.size, (255, 255, 255))
-                            if img.mode == 'P':
-                                img = img.convert('RGBA')
-                            rgb_img.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-                            img = rgb_img
-                        
-                        # Save the main image as WebP
-                        if filepath.lower().endswith('.webp'):
-                            img.save(filepath, format="WebP", quality=quality, method=6)
-                        else:
-                            # Get the filename without extension
-                            base_name = os.path.splitext(filepath)[0]
-                            new_filepath = f"{base_name}.webp"
-                            img.save(new_filepath, format="WebP", quality=quality, method=6)
-                            # Update the filepath and filename
-                            os.remove(filepath)
-                            filepath = new_filepath
-                            filename = os.path.basename(new_filepath)
-                        
-                        # Create thumbnail
-                        thumb_filename = f"thumb_{filename}"
-                        thumb_filepath = os.path.join(os.path.dirname(filepath), thumb_filename)
-                        
-                        # Create a copy for thumbnail
-                        thumb_img = img.copy()
-                        
-                        # Resize to maximum Full HD first (if larger)
-                        if thumb_img.size[0] > 1920 or thumb_img.size[1] > 1080:
-                            if thumb_img.size[0] > 1920:
-                                new_height = int(1920 / (thumb_img.size[0]/thumb_img.size[1]))
-                                fullhd_thumb = thumb_img.resize((1920, new_height), Image.BILINEAR)
-                                thumb_img.close()
-                                thumb_img = fullhd_thumb
-                            if thumb_img.size[1] > 1080:
-                                new_width = int(1080 * (thumb_img.size[0]/thumb_img.size[1]))
-                                fullhd_thumb = thumb_img.resize((new_width, 1080), Image.BILINEAR)
-                                thumb_img.close()
-                                thumb_img = fullhd_thumb
-                        
-                        thumb_img.thumbnail((250, 250), Image.BILINEAR)
-                        
-                        if thumb_filepath.lower().endswith('.webp'):
-                            thumb_img.save(thumb_filepath, format="WebP", quality=quality, method=6)
-                        else:
-                            base_name = os.path.splitext(thumb_filepath)[0]
-                            new_thumb_filepath = f"{base_name}.webp"
-                            thumb_img.save(new_thumb_filepath, format="WebP", quality=quality, method=6)
-                            thumb_filename = os.path.basename(new_thumb_filepath)
-                        
-                        thumb_img.close()
+                    # Convert the upload to WebP and create its thumbnail with bounded memory.
+                    # The result is written under a temporary name and the original is kept
+                    # until the database points to it, so an interrupted run can be repeated.
+                    original_filepath = filepath
+                    new_filepath = f"{os.path.splitext(filepath)[0]}.webp"
+                    tmp_filepath = f"{new_filepath}.tmp"
+                    filename = os.path.basename(new_filepath)
+                    thumb_filename = f"thumb_{filename}"
+                    thumb_filepath = os.path.join(os.path.dirname(new_filepath), thumb_filename)
+                    
+                    stats = ingest_image(original_filepath, tmp_filepath, thumb_filepath, quality)
+                    os.replace(tmp_filepath, new_filepath)
+                    filepath = new_filepath
+                    
+                    if stats['size'][0] * stats['size'][1] < stats['original_size'][0] * stats['original_size'][1]:
+                        print(f"Downsampled {filename} from {stats['original_size'][0]}x{stats['original_size'][1]} "
+                              f"to {stats['size'][0]}x{stats['size'][1]}")
+                    peak_rss = load_monitor.peak_rss_mb()
+                    print(f"Ingest of {filename}: peak image memory {stats['peak_memory'] / (1024 * 1024):.1f} MB"
+                          + (f", process peak RSS {peak_rss:.0f} MB" if peak_rss is not None else ''))
                     
                     # Update database with processed image info and status "completed"
-                    db.update_image_after_processing(image_id, filename, thumb_filename, 'completed')
+                    with content_lock(job.get('content_hash') or image_id):
+                        db.update_image_after_processing(image_id, filename, thumb_filename, 'completed', {
+                            # Geometry of the stored (upright) image, so renders can be planned without opening it
+                            'width': stats['size'][0],
+                            'height': stats['size'][1],
+                            'aspect_ratio': round(stats['size'][0] / stats['size'][1], 4),
+                            'mode': stats['mode'],
+                            'file_size': os.path.getsize(filepath),
+                            'animated': stats.get('frame_count', 1) > 1,
+                            'frame_count': stats.get('frame_count', 1),
+                            'duration': stats.get('duration', 0),
+                            'placeholder': stats['placeholder'],
+                            'processing_peak_memory': stats['peak_memory'],
+                            'thumb_signature': thumbnail_signature(filepath, quality)
+                        })
+                        if original_filepath != filepath:
+                            # The image is complete; a leftover original must not send it back to a retry
+                            try:
+                                os.remove(original_filepath)
+                            except OSError as e:
+                                print(f"Error removing original upload {original_filepath}: {e}")
+                    # The ingest placeholder shows the whole image; images that were
+                    # rotated or cropped while they were waiting get their own
+                    refresh_placeholders(filename, transformed_only=True)
                     # Notify long polling clients
-                    with processing_condition:
-                        processing_condition.notify_all()
+                    notify_processing(image_id)
                     print(f"Image processing completed: {filename}")
                 
                 except Exception as e:
-                    print(f"Error processing image {filename}: {e}")
-                    # Update status to "failed"
-                    db.update_image_processing_status(image_id, 'failed')
+                    if attempts < PROCESSING_MAX_ATTEMPTS:
+                        delay = PROCESSING_RETRY_DELAY * 2 ** (attempts - 1)
+                        print(f"Error processing image {filename}: {e}, retrying in {delay}s")
+                        # Back to "pending" until the retry
+                        db.update_image_processing_status(image_id, 'pending', error=str(e),
+                                                          next_attempt=time.time() + delay)
+                        schedule_processing_job({**job, 'attempts': attempts}, delay=delay)
+                    else:
+                        print(f"Error processing image {filename}: {e}, giving up after {attempts} attempts")
+                        # Update status to "failed"
+                        db.update_image_processing_status(image_id, 'failed', error=str(e))
                     # Notify long polling clients
-                    with processing_condition:
-                        processing_condition.notify_all()
+                    notify_processing(image_id)
             
             finally:
                 # Mark job as done
@@ -297,6 +515,11 @@ os.makedirs(DATA_FOLDER, exist_ok=True)
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(CACHE_FOLDER, exist_ok=True)
 
+# Partial files of resumable uploads live inside the upload folder (same filesystem for the final move)
+upload_sessions = UploadSessions(os.path.join(UPLOAD_FOLDER, '.partial'))
+thumbnail_regeneration = ThumbnailRegeneration(os.path.join(DATA_FOLDER, 'thumbnail_job.json'))
+directory_import = None  # DirectoryImport, created in main() once the database is open
+
 # Initialize Flask app
 app = Flask(__name__, static_folder=WWW_FOLDER)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
@@ -309,12 +532,85 @@ last_cache_cleanup = time.time()
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def update_timestamp():
+def update_timestamp(event_type='state', data=None):
+    """Notify clients about a change.
+
+    The change is published to the event log as an event of the given type
+    with data; event stream and long polling clients receive it.
+
+    Args:
+        event_type: 'state' (reload everything), 'display' (display_event_data()),
+            'image' (one image record) or 'network' (client_status())
+        data: Payload of the event
+    """
     global last_update_timestamp
     last_update_timestamp = time.time()
-    # Notify all waiting long poll requests
-    with update_condition:
-        update_condition.notify_all()
+    event_bus.publish(event_type, dict(data or {}, timestamp=last_update_timestamp))
+
+def view_image_payload(image):
+    """Return what a player view needs to show an image, or None without an image.
+
+    The display and thumbnail URLs are versioned by image_hash(), so they
+    change whenever the file or the transformation (or the thumbnail)
+    changes; width and height are the size of the display variant.
+    """
+    if image is None:
+        return None
+    version = image_hash(image)[:12]
+    thumb_version = image_hash(image, image.get('thumb_path'))[:12]
+    try:
+        size = rendered_size(stored_size(os.path.join(UPLOAD_FOLDER, image['path']), image), image, None, True)
+    except OSError:
+        size = (None, None)
+    return {
+        'id': image['id'],
+        'name': image['name'],
+        'url': f"/img/by-id/{image['id']}/crop?v={version}",
+        'thumb_url': f"/img/by-id/{image['id']}/thumb?v={thumb_version}",
+        'placeholder': image.get('placeholder'),
+        'width': size[0],
+        'height': size[1],
+        'animated': bool(image.get('animated'))
+    }
+
+def view_data(settings):
+    """Return the image the player view shows (current image, else screensaver) as view_image_payload().
+
+    The image is looked up in the id index, without copying the database.
+    """
+    shown_id = settings.get('current_image') or settings.get('screensaver')
+    return {'image': view_image_payload(db.get_image_by_id(shown_id) if shown_id else None)}
+
+def display_event_data():
+    """Return the payload of a 'display' event: the settings, the records of the images they show and view_data().
+
+    It is prepared once per change and sent as the same serialized message to every client.
+    """
+    database = db.get_database()
+    settings = database['settings']
+    shown = {settings.get('current_image'), settings.get('screensaver')}
+    return {
+        'settings': settings,
+        'images': [img for img in database['images'] if img['id'] in shown],
+        'view': view_data(settings)
+    }
+
+def notify_image_changed(image_id):
+    """Send an 'image' event for a changed image record, and a 'display' event if the image is shown."""
+    update_timestamp('image', {'image': db.get_image_by_id(image_id)})
+    if image_id in (db.get_setting('current_image'), db.get_setting('screensaver')):
+        update_timestamp('display', display_event_data())
+
+def notify_processing(image_id):
+    """Send a 'processing' event for an image; it wakes the processing status long polls."""
+    image = db.get_image_by_id(image_id)
+    if image:
+        event_bus.publish('processing', {
+            'id': image_id,
+            'status': image.get('processing_status', 'completed'),
+            'attempts': image.get('processing_attempts', 0),
+            'error': image.get('processing_error')
+        })
     
 def cleanup_cache(max_age=86400, max_size=150*1024*1024):  # Default: 1 day, 150MB (limit for 300MB total RAM)
     """Clean up old cache files to prevent the cache from growing too large"""
@@ -362,6 +658,18 @@ def cleanup_cache(max_age=86400, max_size=150*1024*1024):  # Default: 1 day, 150
     except Exception as e:
         print(f"Error during cache cleanup: {e}")
 
+# Request load tracking for the adaptive worker pools
+@app.before_request
+def track_request_start():
+    if request.endpoint not in IDLE_ENDPOINTS:
+        request.environ['dmscreen.tracked'] = True
+        load_monitor.request_started()
+
+@app.teardown_request
+def track_request_end(exc):
+    if request.environ.pop('dmscreen.tracked', False):
+        load_monitor.request_finished()
+
 # Routes
 @app.route('/')
 def index():
@@ -372,7 +680,7 @@ def admin():
     global admin_connected
     # Set admin_connected to True when admin page is accessed
     admin_connected = True
-    update_timestamp()
+    update_timestamp('network', client_status())
     
     admin_path = os.path.join(WWW_FOLDER, 'admin.html')
     if os.path.exists(admin_path):
@@ -398,17 +706,60 @@ def view():
 
 
 
+def decode_busy_response(image_meta, is_thumb):
+    """Response for a render that could not get decode budget: the thumbnail if possible, else 503."""
+    thumb_path = image_meta.get('thumb_path') if image_meta and not is_thumb else None
+    if thumb_path and os.path.isfile(os.path.join(UPLOAD_FOLDER, thumb_path)):
+        response = send_from_directory(directory=UPLOAD_FOLDER, path=thumb_path)
+    else:
+        response = jsonify({'error': 'Server busy, try again shortly'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '2'
+    response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
+    response.headers['Pragma'] = 'no-cache'
+    response.headers['Expires'] = '0'
+    return response
+
+def lookup_image_meta(path, image_id=None):
+    """Return the metadata of the image served under path.
+    
+    Several images may share one file with different transformations; the
+    ?id= parameter of the request selects which one is meant.
+    """
+    if image_id:
+        image = db.get_image_by_id(image_id)
+        if image is not None and path in (image.get('path'), image.get('thumb_path')):
+            return image
+    return db.get_image_by_path(path)
+
+# Variants of /img/by-id/<id>/<variant>: (thumbnail, crop)
+IMAGE_VARIANTS = {
+    'crop': (False, True),    # Transformed and cropped, as displayed
+    'full': (False, False),   # The stored image without transformation
+    'thumb': (True, True),    # Thumbnail, transformed and cropped
+}
+
+@app.route('/img/by-id/<image_id>/<variant>')
+def serve_img_by_id(image_id, variant):
+    """Serve a variant of an image given by its id (see IMAGE_VARIANTS), with ?w= as in serve_img.
+
+    The URL stays the same when the image's file or transformation changes,
+    so clients build it themselves instead of asking /api/image/<id>/url.
+    """
+    if variant not in IMAGE_VARIANTS:
+        return jsonify({'error': f"Unknown variant: {variant}"}), 404
+    image = db.get_image_by_id(image_id)
+    if image is None:
+        return jsonify({'error': 'Image not found'}), 404
+    w = request.args.get("w", type=int)
+    if 'w' in request.args and (w is None or w <= 0):
+        return jsonify({'error': 'w must be a positive integer'}), 400
+    thumb, crop = IMAGE_VARIANTS[variant]
+    path = (image.get('thumb_path') or f"thumb_{image['path']}") if thumb else image['path']
+    return send_image_variant(path, w, crop, image_id)
+
 @app.route('/img/<path:path>')
 def serve_img(path):
-    # Run cache cleanup periodically (Fix #8: check every 3 minutes for 300MB RAM limit)
-    global last_cache_cleanup_check
-    current_time = time.time()
-    
-    # Check cleanup every 3 minutes for more aggressive cache monitoring
-    if current_time - last_cache_cleanup_check > 180:  # 180 seconds = 3 minutes
-        last_cache_cleanup_check = current_time
-        cleanup_cache()
-    
     # Get query parameters
     w = request.args.get("w", None)
     if w is not None:
@@ -418,17 +769,35 @@ def serve_img(path):
     if path.startswith('crop_'):
         crop = True
         path = path[5:]
+    return send_image_variant(path, w, crop, request.args.get("id", None))
+
+def send_image_variant(path, w, crop, image_id=None):
+    """Send the file under path in UPLOAD_FOLDER, rendered to width w and cropped if crop, from the cache.
+
+    Args:
+        path: File name of the image or its thumbnail
+        w: Maximum width, or None for full screen width
+        crop: Whether to apply the transformation and crop of the image
+        image_id: Selects the image among those sharing the file
+    """
+    # Run cache cleanup periodically (Fix #8: check every 3 minutes for 300MB RAM limit)
+    global last_cache_cleanup_check
+    current_time = time.time()
+    
+    # Check cleanup every 3 minutes for more aggressive cache monitoring
+    if current_time - last_cache_cleanup_check > 180:  # 180 seconds = 3 minutes
+        last_cache_cleanup_check = current_time
+        cleanup_cache()
+    
     is_thumb = path.startswith('thumb_')
     file_path = os.path.join(UPLOAD_FOLDER, path)
 
     # Use O(1) lookup instead of O(n) linear search
-    image_meta = db.get_image_by_path(path)
-    img_hash = hashlib.md5(json.dumps(image_meta).encode()).hexdigest() if image_meta else 'default'
+    image_meta = lookup_image_meta(path, image_id)
+    img_hash = image_hash(image_meta, path)
     
     # Create a cache key based on the path and width
-    cache_key = f"{path}_{w}_{'crop' if crop else 'nocrop'}_{img_hash}"
-    cache_hash = hashlib.md5(cache_key.encode()).hexdigest()
-    cache_path = os.path.join(CACHE_FOLDER, f"{cache_hash}.webp")
+    cache_path = cache_path_for(CACHE_FOLDER, path, w, crop, img_hash)
     
     # Function to generate thumbnail in a separate thread
     def generate_thumbnail(original_path, file_path):
@@ -437,7 +806,8 @@ def serve_img(path):
             quality = db.get_setting('image_quality', 85)
             
             original_file_path = os.path.join(UPLOAD_FOLDER, original_path)
-            with Image.open(original_file_path) as original_img:
+            with decode_budget.reserve(image_pixels(original_file_path), timeout=FOREGROUND_WAIT), \
+                    Image.open(original_file_path) as original_img:
                 # Always create a copy to avoid modifying the context-managed image
                 img = original_img.copy()
                 
@@ -494,14 +864,9 @@ def serve_img(path):
             # Use cached image
             print(f"Using cached image: {cache_path}")
             
-            # If this is a width-specific request, trigger background caching of other images
-            if w is not None and not is_thumb and not crop:
-                # Start background caching for other images with the same width
-                threading.Thread(
-                    target=queue_image_for_caching,
-                    args=(path, w, crop, db, UPLOAD_FOLDER),
-                    daemon=True
-                ).start()
+            # Width-specific and cropped display requests trigger background caching of related images
+            if not is_thumb and (w is not None or crop):
+                notify_image_viewed(path, w, crop)
             
             response = send_file(
                 cache_path,
@@ -513,150 +878,56 @@ def serve_img(path):
             response.headers['Expires'] = '0'
             return response
             
-        # Check if this is a thumbnail request
-        if is_thumb:
-            # If thumbnail doesn't exist but original image does, generate it
-            original_path = path[6:]  # Remove 'thumb_' prefix
-            original_file_path = os.path.join(UPLOAD_FOLDER, original_path)
-            if not os.path.exists(file_path) and os.path.exists(original_file_path):
-                # Start thumbnail generation in a separate thread
-                # For on-demand thumbnails, we'll wait for the result since we need it immediately
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    future = executor.submit(generate_thumbnail, original_path, file_path)
-                    try:
-                        new_file_path = future.result(timeout=10)  # Wait up to 10 seconds
-                        if new_file_path:
-                            file_path = new_file_path
-                            path = os.path.basename(new_file_path)
-                    except concurrent.futures.TimeoutError:
-                        print("Thumbnail generation timed out")
+        # Rendering competes with the client waiting for it; pause background warming meanwhile
+        with load_monitor.foreground_render():
+            # Check if this is a thumbnail request
+            if is_thumb:
+                # If thumbnail doesn't exist but original image does, generate it
+                original_path = path[6:]  # Remove 'thumb_' prefix
+                original_file_path = os.path.join(UPLOAD_FOLDER, original_path)
+                if not os.path.exists(file_path) and os.path.exists(original_file_path):
+                    # Start thumbnail generation in a separate thread
+                    # For on-demand thumbnails, we'll wait for the result since we need it immediately
+                    with concurrent.futures.ThreadPoolExecutor() as executor:
+                        future = executor.submit(generate_thumbnail, original_path, file_path)
+                        try:
+                            new_file_path = future.result(timeout=10)  # Wait up to 10 seconds
+                            if new_file_path:
+                                file_path = new_file_path
+                                path = os.path.basename(new_file_path)
+                        except concurrent.futures.TimeoutError:
+                            print("Thumbnail generation timed out")
         
-        # Get image metadata with O(1) lookup (path might have changed after thumbnail generation)
-        image_meta = db.get_image_by_path(path)
-
-        if crop:
-            crop_path = os.path.join(UPLOAD_FOLDER, 'crop_'+path)
-            if os.path.exists(crop_path) and os.path.isfile(crop_path):
-                response = send_from_directory(directory=UPLOAD_FOLDER, path='crop_'+path)
-                response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
-                response.headers['Pragma'] = 'no-cache'
-                response.headers['Expires'] = '0'
-                return response
-
-            original_img = Image.open(os.path.join(UPLOAD_FOLDER, path))
-            img = original_img
-
-            if image_meta.get("mirror", None) is not None:
-                if image_meta["mirror"].get("h", False):
-                    transformed_img = img.transpose(Image.FLIP_LEFT_RIGHT)
-                    if img is not original_img:
-                        img.close()
-                    img = transformed_img
-                if image_meta["mirror"].get("v", False):
-                    transformed_img = img.transpose(Image.FLIP_TOP_BOTTOM)
-                    if img is not original_img:
-                        img.close()
-                    img = transformed_img
-
-            flip_wh = False
-            if image_meta.get("rotate", None) is not None:
-                r = image_meta["rotate"]
-                if r == 270:
-                    rotated_img = img.rotate(90, expand=True)
-                    if img is not original_img:
-                        img.close()
-                    img = rotated_img
-                elif r == 180:
-                    rotated_img = img.rotate(180, expand=True)
-                    if img is not original_img:
-                        img.close()
-                    img = rotated_img
-                elif r == 90:
-                    rotated_img = img.rotate(-90, expand=True)
-                    if img is not original_img:
-                        img.close()
-                    img = rotated_img
-
-            screen_size = (1920, 1080)
-            crop_data = image_meta['crop']
-            img_size = img.size
-            img_pos = [0, 0]
-            t_size = [0, 0]
-            scale = 1
-            if img_size[0] / img_size[1] < 16/9:
-                scale = screen_size[1] / img_size[1]
-                tw = img_size[0] * scale
-                th = screen_size[1]
-                t_size = [tw, th]
-                img_pos[0] = int((screen_size[0] - tw) / 2)
-            else:
-                scale = screen_size[0] / img_size[0]
-                th = img_size[1] * scale
-                tw = screen_size[0]
-                t_size = [tw, th]
-                img_pos[1] = int((screen_size[1] - th) / 2)
-
-            c_x = crop_data.get("x")
-            c_y = crop_data.get("y")
-            c_w = crop_data.get("w")
-            c_h = int(c_w / 16 * 9)
-
-            x1 = max(img_pos[0], c_x) - img_pos[0]
-            y1 = max(img_pos[1], c_y) - img_pos[1]
-            x2 = min(img_pos[0] + t_size[0], c_x + c_w) - img_pos[0]
-            y2 = min(img_pos[1] + t_size[1], c_y + c_h) - img_pos[1]
-
-            x1 /= scale
-            y1 /= scale
-            y2 /= scale
-            x2 /= scale
-
-            cropped_img = img.crop((x1, y1, x2, y2))
-            if img is not original_img:
-                img.close()
-            img = cropped_img
-        else:
-            # Create a response with cache control headers to prevent caching
-            original_img = Image.open(os.path.join(UPLOAD_FOLDER, path))
-            img = original_img
+            # Get image metadata with O(1) lookup (path might have changed after thumbnail generation)
+            image_meta = lookup_image_meta(path, image_id)
+
+            if crop:
+                crop_path = os.path.join(UPLOAD_FOLDER, 'crop_'+path)
+                if os.path.exists(crop_path) and os.path.isfile(crop_path):
+                    response = send_from_directory(directory=UPLOAD_FOLDER, path='crop_'+path)
+                    response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
+                    response.headers['Pragma'] = 'no-cache'
+                    response.headers['Expires'] = '0'
+                    return response
 
-        w = w if w is not None else 1920
+            # Get image quality setting from database (Fix #11)
+            quality = db.get_setting('image_quality', 85)
 
-        # Use BILINEAR filter for faster resizing
-        if img.size[0] > w:
-            h = int(w / (img.size[0]/img.size[1]))
-            resized_img = img.resize((w, h), Image.BILINEAR)
-            if img is not original_img:
-                img.close()
-            img = resized_img
-        if img.size[1] > 1080:
-            w = int(1080 * (img.size[0]/img.size[1]))
-            resized_img = img.resize((w, 1080), Image.BILINEAR)
-            if img is not original_img:
-                img.close()
-            img = resized_img
+            # Render the variant into the cache; crop renders are cached as well, the
+            # cache size is bounded by cleanup_cache()
+            try:
+                render_to_cache(os.path.join(UPLOAD_FOLDER, path), image_meta, w, crop, quality, cache_path,
+                                timeout=FOREGROUND_WAIT)
+            except BudgetExhausted:
+                return decode_busy_response(image_meta, is_thumb)
 
-        # Get image quality setting from database (Fix #11)
-        quality = db.get_setting('image_quality', 85)
-        
-        # For crop images, serve directly from memory without caching to prevent RAM buildup
-        # Crop settings are image-specific and caching them creates persistent files that waste resources
-        if crop:
-            from io import BytesIO
-            
-            # Save image to memory buffer instead of disk
-            img_io = BytesIO()
-            img.save(img_io, format="WebP", quality=quality)
-            img_io.seek(0)
-            
-            # Close the final image
-            if img is not original_img:
-                img.close()
-            original_img.close()
-            
-            # Serve directly from memory
+            # Width-specific and cropped display requests trigger background caching of related images
+            if not is_thumb and (w is not None or crop):
+                notify_image_viewed(path, w, crop)
+
+            # Return the image
             response = send_file(
-                img_io,
+                cache_path,
                 mimetype='image/webp',
                 as_attachment=False
             )
@@ -664,34 +935,6 @@ def serve_img(path):
             response.headers['Pragma'] = 'no-cache'
             response.headers['Expires'] = '0'
             return response
-        
-        # For non-crop images, save to cache as normal
-        img.save(cache_path, format="WebP", quality=quality)
-        
-        # Close the final image
-        if img is not original_img:
-            img.close()
-        original_img.close()
-        
-        # If this is a width-specific request, trigger background caching of other images
-        if w is not None and not is_thumb and not crop:
-            # Start background caching for other images with the same width
-            threading.Thread(
-                target=queue_image_for_caching,
-                args=(path, w, crop, db, UPLOAD_FOLDER),
-                daemon=True
-            ).start()
-        
-        # Return the image
-        response = send_file(
-            cache_path,
-            mimetype='image/webp',
-            as_attachment=False
-        )
-        response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
-        response.headers['Pragma'] = 'no-cache'
-        response.headers['Expires'] = '0'
-        return response
     else:
         return f"File not found: {file_path}", 404
 
@@ -707,6 +950,10 @@ def static_files(path):
 @app.route('/api/current_state', methods=['GET'])
 def get_current_state():
     global last_update_timestamp, admin_connected
+    # The admin reports the folder it is browsing; the idle prefetcher warms it
+    if 'folder' in request.args:
+        set_active_folder(request.args.get('folder') or None)
+
     database = db.get_database()
     
     # Sort images alphabetically by name
@@ -723,38 +970,108 @@ def get_current_state():
         'admin_connected': admin_connected
     })
 
+@app.route('/api/view/display', methods=['GET'])
+def get_view_display():
+    """State of the player view in one response: the 'view' part of a 'display' event.
+
+    It holds the image shown (current image, else screensaver) with its
+    display and thumbnail URLs and placeholder, so showing it only needs
+    the image requests themselves.
+    """
+    response = jsonify(dict(view_data(db.get_all_settings()), timestamp=last_update_timestamp))
+    response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
+    return response
+
 @app.route('/api/updates', methods=['GET'])
 def check_updates():
-    global last_update_timestamp, admin_connected, SERVER_INSTANCE_ID, NETWORK_STATUS_CACHE
-    
-    # Get the client's last known timestamp
-    client_timestamp = request.args.get('timestamp', type=float, default=0)
-    
-    # Long polling: wait for updates if client is up-to-date
-    if client_timestamp >= last_update_timestamp:
-        with update_condition:
-            # Wait up to 30 seconds for an update
-            update_condition.wait(timeout=30.0)
+    """Long polling fallback of /api/events.
+
+    With ?since=<cursor of the previous response>, waits up to 30 seconds for
+    events after the cursor and returns them. Without a cursor, or if the
+    events since it are no longer in the log, 'resync' tells the client to
+    reload its state.
+    """
+    wait_while_pending(updates_pending, request.args)
+    return jsonify(updates_response(request.args))
+
+def client_cursor(args):
+    """Return (cursor, resync) of a long polling client from its 'since' argument (an event id)."""
+    since = args.get('since')
+    if not since:
+        return event_bus.last_seq, True
+    return event_bus.resume(since)
+
+def wait_while_pending(pending, args, timeout=LONG_POLL_TIMEOUT):
+    """Block a long poll while pending(args) is True, at most timeout seconds or until the server stops."""
+    deadline = time.monotonic() + timeout
+    while not server_stopping.is_set():
+        # Taken before the check, so an event published in between ends the wait
+        seq = event_bus.last_seq
+        if not pending(args):
+            return
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        event_bus.wait(seq, remaining)
+
+def updates_pending(args):
+    """Return True while there are no events after a /api/updates client's cursor, i.e. its long poll waits."""
+    cursor, resync = client_cursor(args)
+    return not resync and event_bus.events_after(cursor) == []
+
+def updates_response(args):
+    """Return the /api/updates response: client_status() and the events after the client's cursor."""
+    cursor, resync = client_cursor(args)
+    events = event_bus.events_after(cursor)
+    if events is None:
+        # Dropped from the log since the check
+        cursor, resync, events = event_bus.last_seq, True, []
+    if events:
+        cursor = events[-1][0]
+    return dict(
+        client_status(),
+        timestamp=last_update_timestamp,
+        resync=resync,
+        events=[{'type': event_type, 'data': json.loads(payload)} for _, event_type, payload in coalesce(events)],
+        cursor=event_bus.event_id(cursor)
+    )
+
+@app.route('/api/events', methods=['GET'])
+def stream_events():
+    """Server-Sent Events stream of changes; replaces long polling of /api/updates.
+
+    The first event is 'hello' with client_status(). Then 'state', 'display',
+    'image', 'processing' and 'network' events follow as described in
+    update_timestamp(), with comment lines as heartbeats while nothing
+    happens. A client reconnecting with Last-Event-ID receives the events it
+    missed, or 'resync' if they are no longer available and it has to
+    reload its state.
+    """
+    cursor, resync = event_bus.resume(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    
+    def generate(cursor):
+        # Reconnect delay (milliseconds) of the browser's EventSource
+        yield 'retry: 3000\n\n'
+        if resync:
+            yield format_event('resync', '{}', event_bus.event_id(cursor))
+        yield format_event('hello', json.dumps(client_status()))
+        # The browser reconnects (to the restarted server) after the stream ends
+        while not server_stopping.is_set():
+            events = event_bus.wait(cursor, EVENTS_HEARTBEAT_INTERVAL)
+            if events is None:
+                # The client fell behind the event history
+                cursor = event_bus.last_seq
+                yield format_event('resync', '{}', event_bus.event_id(cursor))
+            elif not events:
+                yield ': heartbeat\n\n'
+            else:
+                # A client that is behind only gets the latest display and network state
+                for seq, event_type, payload in coalesce(events):
+                    cursor = seq
+                    yield format_event(event_type, payload, event_bus.event_id(seq))
     
-    # Use cached network status to avoid frequent system calls during steady state
-    try:
-        recompute_network_status()
-        cache = NETWORK_STATUS_CACHE if isinstance(NETWORK_STATUS_CACHE, dict) else {}
-    except Exception:
-        recompute_network_status()
-        cache = NETWORK_STATUS_CACHE
-    return jsonify({
-        'timestamp': last_update_timestamp,
-        'instance_id': SERVER_INSTANCE_ID,
-        'admin_connected': admin_connected,
-        'ip': cache.get('admin_url'),
-        'wifi_connected': cache.get('connected'),
-        'scanned_ssids': cache.get('scanned_ssids'),
-        'ssid': cache.get('ssid'),
-        'adhoc_active': cache.get('adhoc_active'),
-        'adhoc_ssid': 'dmscreen' if cache.get('adhoc_active') else None,
-        'adhoc_password': 'dmscreen' if cache.get('adhoc_active') else None
-    })
+    return Response(generate(cursor), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/api/images', methods=['GET'])
 def get_images():
@@ -899,42 +1216,121 @@ def get_processing_status():
     
     Returns images that are pending/processing, and recently completed images.
     Frontend can poll this endpoint to update placeholders.
-    Long polling: waits up to 30 seconds for status changes.
+    Long polling: with ?since=<cursor of the previous response>, waits up to
+    30 seconds for a 'processing' event after the cursor.
+    """
+    wait_while_pending(processing_status_pending, request.args)
+    return jsonify(processing_status_response(request.args))
+
+def get_current_processing_images():
+    """Return the images that are pending, processing or failed."""
+    db_data = db.get_database()
+    images = db_data.get('images', [])
+    processing_images = []
+    for img in images:
+        status = img.get('processing_status', 'completed')
+        if status in ['pending', 'processing', 'failed']:
+            processing_images.append({
+                'id': img['id'],
+                'status': status,
+                'path': img.get('path'),
+                'thumb_path': img.get('thumb_path'),
+                'name': img.get('name'),
+                'attempts': img.get('processing_attempts', 0),
+                'error': img.get('processing_error')
+            })
+    return processing_images
+
+def processing_status_pending(args):
+    """Return True while there are no 'processing' events after the client's cursor, i.e. its long poll waits."""
+    cursor, resync = client_cursor(args)
+    return not resync and event_bus.events_after(cursor, ('processing',)) == []
+
+def processing_status_response(args):
+    """Return the /api/images/processing-status response with the cursor to poll on from."""
+    # Taken before the images are read, so a change in between is not missed
+    cursor = event_bus.last_seq
+    return {'processing_images': get_current_processing_images(), 'cursor': event_bus.event_id(cursor)}
+
+def content_filename(original_filename, content_hash):
+    """Return the content-addressed filename of an upload: its SHA-256 plus the original extension."""
+    extension = os.path.splitext(secure_filename(original_filename))[1].lower()
+    return f"{content_hash}{extension}"
+
+def register_upload(received_path, original_filename, content_hash, name, folder_id, quality):
+    """Add an uploaded file to the database and queue it for processing.
+    
+    Uploads are stored by content hash. If the same content was uploaded
+    before, the new image shares the existing file, thumbnail and cached
+    renders, and processing is skipped entirely.
+    
+    Args:
+        received_path: Path of the received file; it is moved into place or removed
+        original_filename: Filename the client uploaded the file as
+        content_hash: SHA-256 of the file content
+        name: Display name of the image
+        folder_id: Folder to add the image to (None for the root)
+        quality: WebP quality used for processing
     """
-    # Get the client's last known count of processing images
-    client_count = request.args.get('count', type=int, default=-1)
+    image_id = str(uuid.uuid4())
+    image_data = {
+        'id': image_id,
+        'name': name,
+        'uploaded_at': datetime.now().isoformat(),
+        'parent': folder_id,
+        'content_hash': content_hash
+    }
     
-    # Helper function to get current processing images
-    def get_current_processing_images():
-        db_data = db.get_database()
-        images = db_data.get('images', [])
-        processing_images = []
-        for img in images:
-            status = img.get('processing_status', 'completed')
-            if status in ['pending', 'processing', 'failed']:
-                processing_images.append({
-                    'id': img['id'],
-                    'status': status,
-                    'path': img.get('path'),
-                    'thumb_path': img.get('thumb_path'),
-                    'name': img.get('name')
-                })
-        return processing_images
-    
-    # Get current processing images
-    processing_images = get_current_processing_images()
-    
-    # Long polling: wait if client already knows the current state
-    if client_count >= 0 and len(processing_images) == client_count:
-        with processing_condition:
-            # Wait up to 30 seconds for a change
-            processing_condition.wait(timeout=30.0)
-        # Re-fetch after wait
-        processing_images = get_current_processing_images()
+    with content_lock(content_hash):
+        existing = next((img for img in db.get_images_by_content_hash(content_hash)
+                         if img.get('processing_status', 'completed') != 'failed'), None)
+        if existing is not None:
+            # Duplicate: share the file; a pending original is finished for all images at once
+            os.remove(received_path)
+            image_data['path'] = existing['path']
+            image_data['thumb_path'] = existing.get('thumb_path')
+            image_data['processing_status'] = existing.get('processing_status', 'completed')
+            # Properties of the shared file
+            for field in ('width', 'height', 'aspect_ratio', 'mode', 'file_size', 'animated', 'frame_count', 'duration',
+                          'thumb_signature'):
+                if field in existing:
+                    image_data[field] = existing[field]
+            # The new image is not transformed; the placeholder of a transformed original does not fit
+            if 'placeholder' in existing and not has_transformation(existing):
+                image_data['placeholder'] = existing['placeholder']
+            elif image_data['thumb_path'] and image_data['processing_status'] == 'completed':
+                try:
+                    image_data['placeholder'] = make_placeholder(os.path.join(UPLOAD_FOLDER, image_data['thumb_path']),
+                                                                 None)
+                except Exception as e:
+                    print(f"Error creating placeholder for {existing['path']}: {e}")
+            db.appendImage(image_data)
+            print(f"Duplicate upload of {existing['path']}, sharing the existing file")
+            return image_data
+        
+        filename = content_filename(original_filename, content_hash)
+        filepath = os.path.join(UPLOAD_FOLDER, filename)
+        os.replace(received_path, filepath)
+        
+        # Create image entry with "pending" status
+        image_data['path'] = filename
+        image_data['thumb_path'] = None  # Will be set after processing
+        image_data['processing_status'] = 'pending'
+        
+        # Add to database immediately
+        db.appendImage(image_data)
     
-    return jsonify({
-        'processing_images': processing_images
-    })
+    # Queue for background processing
+    processing_job = {
+        'image_id': image_id,
+        'filepath': filepath,
+        'filename': filename,
+        'quality': quality,
+        'attempts': 0,
+        'content_hash': content_hash
+    }
+    schedule_processing_job(processing_job)
+    return image_data
 
 @app.route('/api/images', methods=['POST'])
 def upload_image():
@@ -966,65 +1362,129 @@ def upload_image():
         if not file or not allowed_file(file.filename):
             continue
             
-        filename = secure_filename(file.filename)
-        # Add timestamp to filename to avoid conflicts
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        filename = f"{timestamp}_{filename}"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        
-        # Save the file immediately
-        file.save(filepath)
+        # Save the file immediately, hashing it on the way to disk
+        received_path = os.path.join(upload_sessions.partial_folder, f"{uuid.uuid4().hex}.upload")
+        content_hash = save_stream(file.stream, received_path)
         
         # Get name from the names list if available, otherwise use filename without extension
         name = names[file_index] if file_index < len(names) else os.path.splitext(file.filename)[0]
         
-        # Create image entry with "pending" status
-        image_id = str(uuid.uuid4())
-        image_data = {
-            'id': image_id,
-            'name': name,
-            'path': filename,
-            'thumb_path': None,  # Will be set after processing
-            'uploaded_at': datetime.now().isoformat(),
-            'parent': folder_id,
-            'processing_status': 'pending'
-        }
-        
-        # Add to database immediately
-        db.appendImage(image_data)
-        uploaded_images.append(image_data)
-        
-        # Queue for background processing
-        processing_job = {
-            'image_id': image_id,
-            'filepath': filepath,
-            'filename': filename,
-            'quality': quality
-        }
-        image_processing_queue.put(processing_job)
+        uploaded_images.append(register_upload(received_path, file.filename, content_hash, name, folder_id, quality))
     
     if uploaded_images:
         return jsonify(uploaded_images), 201
     
     return jsonify({'error': 'No valid files uploaded'}), 400
 
+# Resumable chunked uploads: POST /api/uploads -> PUT chunks -> POST /api/uploads/<id>/finalize
+def upload_error_response(error):
+    return jsonify({'error': str(error), **error.details}), error.status
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload():
+    data = request.get_json() or {}
+    filename = data.get('filename')
+    size = data.get('size')
+
+    if not filename or not allowed_file(filename):
+        return jsonify({'error': 'Invalid file type'}), 400
+    if not isinstance(size, int) or size <= 0 or size > app.config['MAX_CONTENT_LENGTH']:
+        return jsonify({'error': 'Invalid file size'}), 400
+
+    folder_id = data.get('folder') or None
+    if folder_id:
+        folder_exists = any(folder['id'] == folder_id for folder in db.get_database()['folders'])
+        if not folder_exists:
+            return jsonify({'error': 'Folder not found'}), 404
+
+    session = upload_sessions.create(filename, size, data.get('name'), folder_id, data.get('sha256'))
+    return jsonify({'upload_id': session['id'], 'offset': 0, 'chunk_size': UPLOAD_CHUNK_SIZE}), 201
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    """Return how many bytes of an upload have been received, to resume it."""
+    try:
+        session = upload_sessions.get(upload_id)
+    except UploadError as e:
+        return upload_error_response(e)
+    return jsonify({'upload_id': upload_id, 'offset': session['offset'], 'size': session['size']})
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+def put_upload_chunk(upload_id):
+    """Stream one chunk of an upload (raw request body) to disk at ?offset=."""
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({'error': 'Offset is required'}), 400
+    try:
+        new_offset = upload_sessions.write_chunk(upload_id, offset, request.stream)
+    except UploadError as e:
+        return upload_error_response(e)
+    return jsonify({'upload_id': upload_id, 'offset': new_offset})
+
+@app.route('/api/uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_upload(upload_id):
+    """Verify a complete upload and hand it to the processing queue."""
+    data = request.get_json(silent=True) or {}
+    received_path = os.path.join(upload_sessions.partial_folder, f"{upload_id}.upload")
+    try:
+        session = upload_sessions.finalize(upload_id, received_path, data.get('sha256'))
+    except UploadError as e:
+        return upload_error_response(e)
+
+    name = session.get('name') or os.path.splitext(session['filename'])[0]
+    quality = db.get_setting('image_quality', 85)
+    image_data = register_upload(received_path, session['filename'], session['sha256'], name,
+                                 session.get('folder'), quality)
+    return jsonify(image_data), 201
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def abort_upload(upload_id):
+    upload_sessions.discard(upload_id)
+    return jsonify({'success': True})
+
+@app.route('/api/import', methods=['POST'])
+def start_import():
+    """Import all images from a directory on the server (below DM_IMPORT_ROOTS), mirroring its folders."""
+    data = request.get_json() or {}
+    source = data.get('path')
+    folder_id = data.get('folder') or None
+    
+    if not source or not is_importable_path(source):
+        return jsonify({'error': 'Path is not in an importable location'}), 400
+    if folder_id and not any(f['id'] == folder_id for f in db.get_database()['folders']):
+        return jsonify({'error': 'Folder not found'}), 404
+    if directory_import.is_running():
+        return jsonify({'error': 'An import is already running'}), 409
+    
+    try:
+        status = directory_import.start(source, folder_id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(status), 202
+
+@app.route('/api/import', methods=['GET'])
+def get_import_status():
+    return jsonify(directory_import.status())
+
 @app.route('/api/images/<image_id>', methods=['DELETE'])
 def delete_image(image_id):
-    image = db.removeImage(image_id)
+    image = db.get_image_by_id(image_id)
+    if image is None:
+        return jsonify({'error': 'Image not found'}), 404
 
-    if image is not None:
-        # Delete the original file
-        try:
-            os.remove(os.path.join(UPLOAD_FOLDER, image['path']))
-        except OSError:
-            pass  # File might not exist
-            
-        # Delete the thumbnail if it exists
-        if 'thumb_path' in image:
+    with content_lock(image.get('content_hash') or image_id):
+        image = db.removeImage(image_id)
+        if not isinstance(image, dict):
+            return jsonify({'error': 'Image not found'}), 404
+
+        # Files shared with other images (same content) are kept
+        for path in (image['path'], image.get('thumb_path')):
+            if not path or db.get_image_by_path(path) is not None:
+                continue
             try:
-                os.remove(os.path.join(UPLOAD_FOLDER, image['thumb_path']))
+                os.remove(os.path.join(UPLOAD_FOLDER, path))
             except OSError:
-                pass  # Thumbnail might not exist
+                pass  # File might not exist
     
     # Update timestamp to notify clients about changes
     update_timestamp()
@@ -1051,27 +1511,32 @@ def transform_image(image_id):
 
         # Use the updateImageTransform method to update all provided transformation data
         result = db.updateImageTransform(image_id, transform_data, UPLOAD_FOLDER)
-        update_timestamp()
         
         # Check if there was an error
         if isinstance(result, tuple) and len(result) > 1 and 'error' in result[0]:
+            update_timestamp()
             return jsonify(result[0]), result[1]
         
+        # Placeholder of the new transformation, in place before clients are notified
+        if result.get('thumb_path'):
+            try:
+                db.set_image_placeholders({image_id: make_placeholder(
+                    os.path.join(UPLOAD_FOLDER, result['thumb_path']), result)})
+            except Exception as e:
+                print(f"Error creating placeholder for {result['path']}: {e}")
+        notify_image_changed(image_id)
+        
         # Get the image path to trigger cache regeneration
         db_data = db.get_database()
         image = next((img for img in db_data['images'] if img['id'] == image_id), None)
         
         if image and 'path' in image:
             # Trigger background caching for common image sizes
-            # Only cache non-crop versions - crop is image-specific and cached on-demand
-            # This prevents massive RAM usage when saving crop settings
             widths = [None, 250, 500, 1000, 1920]
             for width in widths:
-                threading.Thread(
-                    target=queue_image_for_caching,
-                    args=(image['path'], width, False, db, UPLOAD_FOLDER),
-                    daemon=True
-                ).start()
+                notify_image_viewed(image['path'], width, False)
+            # Crop settings of the neighbours in the folder are warmed as well
+            notify_image_viewed(image['path'], None, True)
         
         return jsonify({'success': True})
     except Exception as e:
@@ -1097,7 +1562,7 @@ def rename_image(image_id):
         db.save_database(db_data)
         
         # Update timestamp to notify clients about changes
-        update_timestamp()
+        notify_image_changed(image_id)
         
         return jsonify({'success': True, 'name': new_name})
     except Exception as e:
@@ -1117,7 +1582,7 @@ def update_settings():
     database = db.get_database()
 
     # Update timestamp to notify clients about changes
-    update_timestamp()
+    update_timestamp('display', display_event_data())
     
     return jsonify(database['settings'])
 
@@ -1128,11 +1593,20 @@ def get_network_status():
 
 @app.route('/api/regenerate-thumbnails', methods=['POST'])
 def regenerate_thumbnails():
-    """Regenerate all thumbnails and clear cache"""
+    """Start regenerating thumbnails in the background.
+    
+    By default only thumbnails whose source file or the quality setting
+    changed are regenerated; with {"full": true} the cache is cleared and all
+    thumbnails are regenerated. Progress is reported by
+    GET /api/regenerate-thumbnails.
+    """
     try:
+        data = request.get_json(silent=True) or {}
+        full = bool(data.get('full', False))
+        
         # Clear the cache directory
         cleared_count = 0
-        if os.path.exists(CACHE_FOLDER):
+        if full and os.path.exists(CACHE_FOLDER):
             for filename in os.listdir(CACHE_FOLDER):
                 file_path = os.path.join(CACHE_FOLDER, filename)
                 if os.path.isfile(file_path):
@@ -1142,92 +1616,52 @@ def regenerate_thumbnails():
                     except Exception as e:
                         print(f"Error removing cache file {file_path}: {e}")
         
-        # Get all images from database
-        database = db.get_database()
-        images = database.get('images', [])
-        
-        regenerated_count = 0
-        error_count = 0
+        # The quality is read once for the whole run
+        quality = db.get_setting('image_quality', 85)
         
-        # Regenerate thumbnails for all images
-        for image in images:
-            original_path = image.get('path')
-            if not original_path:
+        # Images sharing a file share the thumbnail; each file is handled once
+        paths = []
+        seen_paths = set()
+        skipped = 0
+        for image in db.get_database().get('images', []):
+            path = image.get('path')
+            if not path or path in seen_paths or image.get('processing_status', 'completed') != 'completed':
                 continue
-                
-            original_file_path = os.path.join(UPLOAD_FOLDER, original_path)
-            if not os.path.exists(original_file_path):
-                error_count += 1
-                continue
-            
-            # Generate thumbnail path
-            base_name = os.path.splitext(original_path)[0]
-            thumb_path = f"thumb_{base_name}.webp"
-            thumb_file_path = os.path.join(UPLOAD_FOLDER, thumb_path)
-            
-            try:
-                # Get image quality setting from database
-                quality = db.get_setting('image_quality', 85)
-                
-                with Image.open(original_file_path) as original_img:
-                    # Convert to RGB if image has transparency
-                    img = original_img
-                    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
-                        background = Image.new('RGB', img.size, (255, 255, 255))
-                        background.paste(img, mask=img.split()[3] if img.mode == 'RGBA' else None)
-                        img = background
-                    
-                    # Create a copy to avoid modifying the original
-                    if img is original_img:
-                        img = img.copy()
-                    
-                    # Resize to maximum Full HD first (if larger)
-                    # This ensures thumbnails are generated from Full HD version, not original
-                    if img.size[0] > 1920 or img.size[1] > 1080:
-                        # Resize to fit within Full HD bounds while maintaining aspect ratio
-                        if img.size[0] > 1920:
-                            new_height = int(1920 / (img.size[0]/img.size[1]))
-                            fullhd_img = img.resize((1920, new_height), Image.BILINEAR)
-                            if img is not original_img:
-                                img.close()
-                            img = fullhd_img
-                        if img.size[1] > 1080:
-                            new_width = int(1080 * (img.size[0]/img.size[1]))
-                            fullhd_img = img.resize((new_width, 1080), Image.BILINEAR)
-                            if img is not original_img:
-                                img.close()
-                            img = fullhd_img
-                    
-                    # Use PIL's thumbnail() method - more efficient and maintains aspect ratio automatically
-                    img.thumbnail((500, 500), Image.BILINEAR)
-                    
-                    # Save as WebP
-                    img.save(thumb_file_path, format="WebP", quality=quality)
-                    
-                    # Close the final image if it's different from the original
-                    if img is not original_img:
-                        img.close()
-                    
-                    # Update database to include thumb_path
-                    db.updateImageThumbnail(original_path, thumb_path)
-                    regenerated_count += 1
-            except Exception as e:
-                print(f"Error regenerating thumbnail for {original_path}: {e}")
-                error_count += 1
+            seen_paths.add(path)
+            if not full:
+                thumb_path = image.get('thumb_path')
+                original_file_path = os.path.join(UPLOAD_FOLDER, path)
+                try:
+                    up_to_date = (thumb_path and os.path.exists(os.path.join(UPLOAD_FOLDER, thumb_path))
+                                  and image.get('thumb_signature') == thumbnail_signature(original_file_path, quality))
+                except OSError:
+                    up_to_date = False
+                if up_to_date:
+                    skipped += 1
+                    continue
+            paths.append(path)
         
-        # Update timestamp to notify clients about changes
-        update_timestamp()
+        status = thumbnail_regeneration.start(paths, quality, full, skipped)
+        for path in paths:
+            schedule_processing_job({'type': 'thumbnail', 'run_id': status['run_id'], 'path': path, 'quality': quality})
         
-        return jsonify({
-            'success': True,
-            'cache_cleared': cleared_count,
-            'thumbnails_regenerated': regenerated_count,
-            'errors': error_count,
-            'total_images': len(images)
-        })
+        status['cache_cleared'] = cleared_count
+        return jsonify(status), 202
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/regenerate-thumbnails', methods=['GET'])
+def get_thumbnail_regeneration():
+    """Progress of the thumbnail regeneration run.
+    
+    Long polling: with ?done=N, waits up to 30 seconds until more than N
+    thumbnails are finished.
+    """
+    known_done = request.args.get('done', type=int, default=-1)
+    if known_done >= 0:
+        return jsonify(thumbnail_regeneration.wait_for_change(known_done))
+    return jsonify(thumbnail_regeneration.status())
+
 @app.route('/api/display', methods=['POST'])
 def set_display_image():
     data = request.get_json()
@@ -1238,7 +1672,7 @@ def set_display_image():
         return jsonify({'error': str(e)}), 404
     
     # Update timestamp to notify clients about changes
-    update_timestamp()
+    update_timestamp('display', display_event_data())
     
     return jsonify({'success': True})
 
@@ -1251,39 +1685,33 @@ def reset_display():
         return jsonify({'error': str(e)}), 404
     
     # Update timestamp to notify clients about changes
-    update_timestamp()
+    update_timestamp('display', display_event_data())
     
     return jsonify({'success': True})
 
 @app.route('/api/image/<image_id>/url', methods=['GET'])
 def get_image_url(image_id):
-    """Get the URL for an image by its ID"""
+    """Get the URL for an image by its ID
+
+    Clients can build the same /img/by-id/ URL themselves; this remains for
+    older clients.
+    """
     # Get query parameters
     w = request.args.get("w", None)
     crop = request.args.get("crop", "true").lower() == "true"
     thumb = request.args.get("thumb", "false").lower() == "true"
     
-    # Find the image in the database
-    database = db.get_database()
-    image = next((img for img in database['images'] if img['id'] == image_id), None)
+    # Find the image in the id index
+    image = db.get_image_by_id(image_id)
 
     if not image:
         return jsonify({'error': 'Image not found'}), 404
 
-    img_hash = hashlib.md5(json.dumps(image).encode()).hexdigest()
-    # Construct the URL
-    path = image['path']
     if thumb:
-        path = image['thumb_path'] if 'thumb_path' in image else f"thumb_{path}"
-    
-    # Add crop prefix if needed
-    url_prefix = 'crop_' if crop else ''
-    
-    # Construct the base URL
-    base_url = f"/img/{url_prefix}{path}"
-    
-    # Add width parameter if specified
-    url = f"{base_url}?t={int(time.time())}"
+        variant = 'thumb'
+    else:
+        variant = 'crop' if crop else 'full'
+    url = f"/img/by-id/{image['id']}/{variant}?t={int(time.time())}"
     if w:
         url += f"&w={w}"
         
@@ -1291,13 +1719,9 @@ def get_image_url(image_id):
         if not thumb and not crop and w.isdigit():
             w_int = int(w)
             # Check if the image is already cached
-            if not is_image_cached(path, w_int, img_hash, crop, CACHE_FOLDER):
+            if not is_image_cached(image['path'], w_int, image_hash(image), crop, CACHE_FOLDER):
                 # Start background caching for other images with the same width
-                threading.Thread(
-                    target=queue_image_for_caching,
-                    args=(path, w_int, crop, db, UPLOAD_FOLDER),
-                    daemon=True
-                ).start()
+                notify_image_viewed(image['path'], w_int, crop)
     
     return jsonify({
         'url': url,
@@ -1336,6 +1760,11 @@ def register_wifi_api_routes(app):
             _dbg(f"API /api/wifi/known Fehler: {type(e).__name__}: {e}")
             return jsonify({'networks': []}), 200
 
+    @app.route('/api/wifi/commands', methods=['GET'])
+    def api_wifi_command_metrics():
+        """Return how often each nmcli command ran, was answered from the cache, failed or timed out, and its latency."""
+        return jsonify(command_metrics())
+
     @app.route('/api/wifi/known/<ssid>', methods=['DELETE'])
     def api_wifi_known_delete(ssid):
         """Forget an SSID at OS level and remove its credentials from the known list."""
@@ -1417,12 +1846,50 @@ def register_wifi_routes(app, on_change=None):
 
 
 
+def init_directory_import():
+    """Create the directory importer; it feeds the image processing pool."""
+    global directory_import
+    directory_import = DirectoryImport(
+        db,
+        register=register_upload,
+        queue_size=image_processing_queue.qsize,
+        staging_folder=upload_sessions.partial_folder,
+        allowed_file=allowed_file,
+        on_change=update_timestamp
+    )
+
+def stop_waiting_clients():
+    """End open event streams and long polls, so the server can drain on shutdown."""
+    server_stopping.set()
+    event_bus.interrupt()
+
+def create_asgi_app():
+    """Return the ASGI app: the Flask routes, with coroutines for the event stream and the long polls."""
+    return asgi.AsyncApp(
+        app,
+        event_bus,
+        event_stream=asgi.EventStream(
+            hello=client_status,
+            heartbeat_interval=EVENTS_HEARTBEAT_INTERVAL
+        ),
+        long_polls={
+            '/api/updates': asgi.LongPoll(updates_pending, updates_response, LONG_POLL_TIMEOUT),
+            '/api/images/processing-status': asgi.LongPoll(processing_status_pending, processing_status_response,
+                                                           LONG_POLL_TIMEOUT),
+        }
+    )
+
 def main():
     global db, DISABLE_NETWORKING
     # Parse command line arguments
     parser = argparse.ArgumentParser()
     parser.add_argument("--ssid", help="Initial SSID to connect to", required=False)
     parser.add_argument("--disable-networking", action="store_true", help="Disable all network-related functions and GUI elements")
+    parser.add_argument("--import", dest="import_dir", help="Import all images from a local directory (e.g. a USB stick) at startup", required=False)
+    parser.add_argument("--server", choices=SERVER_MODES, default=os.getenv('DM_SERVER', 'dev'),
+                        help="HTTP server: 'dev' (Flask's threaded server), 'asgi' (uvicorn, waiting clients "
+                             "are coroutines; needs the asgi extra) or 'waitress' (production WSGI server with "
+                             "a bounded thread pool and graceful shutdown; needs the waitress extra)")
     args = parser.parse_args()
     
     # Set global flag for networking
@@ -1448,26 +1915,41 @@ def main():
 
     # Initialize background caching system
     print('initializing background caching system')
-    init_cache_system(CACHE_FOLDER, UPLOAD_FOLDER)
+    init_cache_system(CACHE_FOLDER, UPLOAD_FOLDER, db)
 
     # Initialize image processing worker system
     print('initializing image processing system')
-    init_image_processing(num_workers=2)
+    init_image_processing(
+        min_workers=int(os.getenv('DM_PROCESSING_MIN_WORKERS', '1')),
+        max_workers=int(os.getenv('DM_PROCESSING_MAX_WORKERS', str(load_monitor.cpu_count())))
+    )
+    # Continue processing that was interrupted by the last shutdown
+    resume_image_processing()
+    resume_thumbnail_regeneration()
+    threading.Thread(target=backfill_placeholders, name="PlaceholderBackfill", daemon=True).start()
+    
+    init_directory_import()
+    if args.import_dir:
+        print(f'importing images from {args.import_dir}')
+        directory_import.start(args.import_dir)
     
     # Add custom route for WiFi configuration that resets admin connection
 
 
     print('looking if linux')
-    # Start WiFi monitoring in background (only on Raspberry Pi)
+    # Start WiFi monitoring in background (only on Raspberry Pi, or anywhere with DM_WIFI_FAKE)
     if not DISABLE_NETWORKING and hasattr(os, 'uname'):
-        if "Raspbian" in os.uname().version:
-            print('is linux!')
+        if "Raspbian" in os.uname().version or fake_network_manager is not None:
+            print('is linux!' if fake_network_manager is None else 'using the fake NetworkManager')
             # Register WiFi API routes
             register_wifi_api_routes(app)
             
             # Register WiFi routes with on_change callback to reset admin connection
             register_wifi_routes(app, on_change=reset_admin_connection)
 
+            # NetworkManager changes refresh the network status shown to clients at once
+            set_state_callback(request_network_refresh)
+
             # Start monitor thread that waits for GUI-triggered changes
             start_wifi_monitor(ssid=args.ssid)
         else:
@@ -1477,6 +1959,11 @@ def main():
             print('networking disabled, skipping WiFi setup')
         else:
             print('not linux!')
+
+    # Clients read the network status from a snapshot that is refreshed in the background
+    recompute_network_status()
+    if not DISABLE_NETWORKING:
+        threading.Thread(target=network_status_refresher, name="NetworkStatus", daemon=True).start()
     
     try:
         PORT = int(os.getenv('PORT', '80'))
@@ -1492,8 +1979,13 @@ def main():
         if not DISABLE_NETWORKING:
             print(f'Network admin URL: http://{lan_ip}{port_part}/admin')
             print(f'Network view URL: http://{lan_ip}{port_part}/view')
-        print('server listening...')
-        app.run(host='0.0.0.0', port=PORT, debug=False)
+        print(f'server listening ({args.server})...')
+        if args.server == 'asgi':
+            asgi.serve(create_asgi_app(), host='0.0.0.0', port=PORT)
+        elif args.server == 'waitress':
+            wsgi.serve(app, host='0.0.0.0', port=PORT, on_stop=stop_waiting_clients)
+        else:
+            app.run(host='0.0.0.0', port=PORT, debug=False)
     finally:
         # Shutdown image processing system when server stops
         print('shutting down image processing system')
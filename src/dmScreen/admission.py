@@ -0,0 +1,97 @@
+"""
+Admission control for image decodes in dmScreen.
+
+Every render path (request handlers, image processing workers, cache workers
+and thumbnail regeneration) reserves the pixel count of the image it is about
+to decode from one global budget. This bounds how many full-resolution
+images are held in memory at once. Foreground requests are admitted before
+background work: while a foreground decode is waiting, no background decode
+is admitted.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from PIL import Image
+
+# Total pixels that may be decoded at the same time
+DECODE_BUDGET_PIXELS = int(float(os.getenv('DM_DECODE_BUDGET_MP', '64')) * 1000 * 1000)
+# How long a foreground request waits for budget before falling back
+FOREGROUND_WAIT = float(os.getenv('DM_DECODE_WAIT', '10'))
+
+
+class BudgetExhausted(Exception):
+    """Raised when the pixel budget could not be acquired in time."""
+
+
+class PixelBudget:
+    """A counting semaphore measured in pixels, with foreground priority."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.in_use = 0
+        self._condition = threading.Condition()
+        self._foreground_waiting = 0
+
+    def acquire(self, pixels: int, foreground: bool = True, timeout: Optional[float] = None) -> int:
+        """
+        Reserve pixels from the budget.
+
+        An image larger than the whole budget is clamped to the capacity, so it
+        can still be decoded when nothing else is running.
+
+        Args:
+            pixels: Width x height of the image about to be decoded
+            foreground: Whether a client is waiting for the result
+            timeout: Seconds to wait, None waits forever
+
+        Returns:
+            The number of pixels reserved (pass it to release()), or 0 on timeout
+        """
+        pixels = max(1, min(int(pixels), self.capacity))
+        deadline = None if timeout is None else time.time() + timeout
+
+        with self._condition:
+            if foreground:
+                self._foreground_waiting += 1
+            try:
+                while self.in_use + pixels > self.capacity or (not foreground and self._foreground_waiting > 0):
+                    remaining = None if deadline is None else deadline - time.time()
+                    if remaining is not None and remaining <= 0:
+                        return 0
+                    self._condition.wait(remaining)
+                self.in_use += pixels
+                return pixels
+            finally:
+                if foreground:
+                    self._foreground_waiting -= 1
+                    # Background waiters may be admitted now
+                    self._condition.notify_all()
+
+    def release(self, pixels: int):
+        """Return reserved pixels to the budget."""
+        with self._condition:
+            self.in_use = max(0, self.in_use - pixels)
+            self._condition.notify_all()
+
+    @contextmanager
+    def reserve(self, pixels: int, foreground: bool = True, timeout: Optional[float] = None):
+        """Context manager around acquire()/release(); raises BudgetExhausted on timeout."""
+        reserved = self.acquire(pixels, foreground, timeout)
+        if not reserved:
+            raise BudgetExhausted(f"No decode budget for {pixels} pixels")
+        try:
+            yield
+        finally:
+            self.release(reserved)
+
+
+decode_budget = PixelBudget(DECODE_BUDGET_PIXELS)
+
+
+def image_pixels(file_path: str) -> int:
+    """Return width x height of an image file, reading only its header."""
+    with Image.open(file_path) as img:
+        return img.size[0] * img.size[1]
@@ -0,0 +1,337 @@
+"""
+Asynchronous (ASGI) serving mode for dmScreen.
+
+The Flask app is served by an ASGI server (uvicorn). Requests that mostly
+wait, the event stream and the long polls, are answered by coroutines, so
+an idle client costs no thread. All other requests run the unchanged Flask
+routes in a bounded thread pool, where Pillow and file work may block
+without stalling the event loop. Request and response bodies are streamed
+between the event loop and the pool, so uploads are not buffered in memory.
+"""
+import asyncio
+import concurrent.futures
+import json
+import os
+import sys
+from typing import Callable, Dict, Optional
+from urllib.parse import parse_qsl
+
+from dmScreen.events import EventBus, coalesce, format_event
+
+# Threads running the Flask routes
+ASGI_THREADS = int(os.getenv('DM_ASGI_THREADS', '8'))
+
+
+class LongPoll:
+    """A long-poll endpoint answered by a coroutine."""
+
+    def __init__(self, pending: Callable[[dict], bool], respond: Callable[[dict], dict], timeout: float):
+        """
+        Args:
+            pending: Returns True while the client (given its query arguments) is up to date and has to wait
+            respond: Returns the JSON response for the query arguments
+            timeout: Seconds to wait at most
+        """
+        self.pending = pending
+        self.respond = respond
+        self.timeout = timeout
+
+
+class EventStream:
+    """The Server-Sent Events endpoint, answered by a coroutine."""
+
+    def __init__(self, hello: Callable[[], dict], heartbeat_interval: float):
+        """
+        Args:
+            hello: Returns the payload of the first ('hello') event
+            heartbeat_interval: Seconds between keep-alive comments on an idle stream
+        """
+        self.hello = hello
+        self.heartbeat_interval = heartbeat_interval
+
+
+class _Notifier:
+    """
+    Wakes waiting coroutines whenever the event bus publishes, from any thread.
+
+    A coroutine takes the current generation (an asyncio.Event) before it
+    checks its condition and then waits for that generation, so a
+    publication in between is not missed.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.generation = asyncio.Event()
+
+    def notify(self):
+        try:
+            self.loop.call_soon_threadsafe(self._wake)
+        except RuntimeError:
+            pass  # Event loop already closed (shutdown)
+
+    def _wake(self):
+        self.generation.set()
+        self.generation = asyncio.Event()
+
+    async def wait(self, generation: asyncio.Event, timeout: float, stop: Optional[asyncio.Event] = None):
+        """Wait until generation has ended or stop is set, at most timeout seconds."""
+        waiters = [asyncio.ensure_future(generation.wait())]
+        if stop is not None:
+            waiters.append(asyncio.ensure_future(stop.wait()))
+        try:
+            await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+
+
+class _RequestBody:
+    """wsgi.input that reads the ASGI request body on demand from a worker thread."""
+
+    def __init__(self, receive, loop: asyncio.AbstractEventLoop):
+        self.receive = receive
+        self.loop = loop
+        self.buffer = bytearray()
+        self.more = True
+
+    def _fill(self):
+        message = asyncio.run_coroutine_threadsafe(self.receive(), self.loop).result()
+        if message['type'] == 'http.disconnect':
+            self.more = False
+            raise OSError('Client disconnected')
+        self.buffer += message.get('body', b'')
+        self.more = message.get('more_body', False)
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        while self.more and (size is None or size < 0 or len(self.buffer) < size):
+            self._fill()
+        if size is None or size < 0:
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def readline(self, size: Optional[int] = -1) -> bytes:
+        while self.more and b'\n' not in self.buffer and (size is None or size < 0 or len(self.buffer) < size):
+            self._fill()
+        end = self.buffer.find(b'\n') + 1 or len(self.buffer)
+        if size is not None and size >= 0:
+            end = min(end, size)
+        data = bytes(self.buffer[:end])
+        del self.buffer[:end]
+        return data
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+
+def _wsgi_environ(scope: dict, body: _RequestBody) -> dict:
+    """Build the WSGI environ of an ASGI HTTP request."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f"HTTP_{name}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+class AsyncApp:
+    """ASGI application: coroutine endpoints for waiting clients, the WSGI app in a thread pool for the rest."""
+
+    def __init__(self, wsgi_app, event_bus: EventBus, event_stream: Optional[EventStream] = None,
+                 long_polls: Optional[Dict[str, LongPoll]] = None, threads: int = ASGI_THREADS):
+        """
+        Args:
+            wsgi_app: The Flask app
+            event_bus: Every change is published here; waiting clients are woken by it
+            event_stream: Served at /api/events
+            long_polls: Long-poll endpoints by path (GET requests)
+            threads: Number of threads running WSGI requests
+        """
+        self.wsgi_app = wsgi_app
+        self.event_bus = event_bus
+        self.event_stream = event_stream
+        self.long_polls = long_polls or {}
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads, thread_name_prefix='asgi-wsgi')
+        self.notifier = None
+
+    def _get_notifier(self) -> _Notifier:
+        if self.notifier is None:
+            self.notifier = _Notifier(asyncio.get_running_loop())
+            self.event_bus.add_listener(self.notifier.notify)
+        return self.notifier
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        notifier = self._get_notifier()
+        if scope['method'] == 'GET':
+            try:
+                if scope['path'] == '/api/events' and self.event_stream is not None:
+                    await self._stream_events(scope, receive, send, notifier)
+                    return
+                long_poll = self.long_polls.get(scope['path'])
+                if long_poll is not None:
+                    await self._long_poll(long_poll, scope, send, notifier)
+                    return
+            except asyncio.CancelledError:
+                # Waiting clients are cancelled when the server shuts down; they reconnect by themselves
+                return
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self._run_wsgi, scope, receive, send, loop)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _long_poll(self, long_poll: LongPoll, scope, send, notifier: _Notifier):
+        loop = asyncio.get_running_loop()
+        args = dict(parse_qsl(scope.get('query_string', b'').decode('latin-1')))
+        deadline = loop.time() + long_poll.timeout
+        # Checks run in the default executor, not in the pool that may be busy rendering
+        while True:
+            generation = notifier.generation
+            if not await loop.run_in_executor(None, long_poll.pending, args):
+                break
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            await notifier.wait(generation, remaining)
+        data = await loop.run_in_executor(None, long_poll.respond, args)
+        body = json.dumps(data).encode()
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+        ]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _stream_events(self, scope, receive, send, notifier: _Notifier):
+        stream = self.event_stream
+        bus = self.event_bus
+        headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+        args = dict(parse_qsl(scope.get('query_string', b'').decode('latin-1')))
+        cursor, resync = bus.resume(headers.get('last-event-id') or args.get('last_event_id'))
+
+        disconnected = asyncio.Event()
+
+        async def watch_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            disconnected.set()
+
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            await send({'type': 'http.response.start', 'status': 200, 'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ]})
+
+            async def write(text: str):
+                await send({'type': 'http.response.body', 'body': text.encode(), 'more_body': True})
+
+            # Reconnect delay (milliseconds) of the browser's EventSource
+            await write('retry: 3000\n\n')
+            if resync:
+                await write(format_event('resync', '{}', bus.event_id(cursor)))
+            await write(format_event('hello', json.dumps(stream.hello())))
+
+            while not disconnected.is_set():
+                generation = notifier.generation
+                events = bus.events_after(cursor)
+                if events == []:
+                    await notifier.wait(generation, stream.heartbeat_interval, disconnected)
+                    events = bus.events_after(cursor)
+                    if events == []:
+                        if disconnected.is_set():
+                            break
+                        await write(': heartbeat\n\n')
+                        continue
+                if events is None:
+                    # The client fell behind the event history
+                    cursor = bus.last_seq
+                    await write(format_event('resync', '{}', bus.event_id(cursor)))
+                    continue
+                for seq, event_type, payload in coalesce(events):
+                    cursor = seq
+                    await write(format_event(event_type, payload, bus.event_id(seq)))
+        except OSError:
+            # Client went away while we were writing
+            pass
+        finally:
+            watcher.cancel()
+
+    def _run_wsgi(self, scope, receive, send, loop: asyncio.AbstractEventLoop):
+        """Run one request through the WSGI app; called in a pool thread."""
+        def call(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                   for name, value in headers]
+            return lambda data: None
+
+        result = self.wsgi_app(_wsgi_environ(scope, _RequestBody(receive, loop)), start_response)
+        try:
+            started = False
+            for chunk in result:
+                if not chunk:
+                    continue
+                if not started:
+                    call({'type': 'http.response.start', 'status': response['status'],
+                          'headers': response['headers']})
+                    started = True
+                call({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not started:
+                call({'type': 'http.response.start', 'status': response['status'], 'headers': response['headers']})
+            call({'type': 'http.response.body', 'body': b''})
+        except OSError:
+            # Client went away while we were sending
+            pass
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+
+def serve(asgi_app: AsyncApp, host: str, port: int):
+    """Serve the ASGI app with uvicorn until the process is stopped."""
+    try:
+        import uvicorn
+    except ImportError:
+        raise RuntimeError("The asgi server mode needs uvicorn: pip install 'dmscreen[asgi]'")
+    # Event streams never end by themselves; they are closed after a short grace period on shutdown
+    uvicorn.run(asgi_app, host=host, port=port, log_level='warning', lifespan='on', timeout_graceful_shutdown=5)
@@ -3,49 +3,78 @@ Background caching system for dmScreen.
 
 This module implements a job queue and worker threads to proactively cache
 images in the background when a specific image is requested with a width parameter.
+
+Request handlers never plan caching work themselves. They report lightweight
+"image X viewed at width W" events via notify_image_viewed(); a single
+long-lived dispatcher thread coalesces bursts of events, rate-limits repeated
+views and computes the prefetch set once per burst.
 """
-import json
 import os
 import time
 import threading
 import queue
-import hashlib
 from typing import Dict, List, Set, Tuple, Optional
-from PIL import Image
+
+from dmScreen import load_monitor
+from dmScreen.imaging import image_hash, cache_key_for, cache_path_for, render_to_cache, estimate_render_bytes
 
 # Global variables
 cache_queue = queue.PriorityQueue()
 active_workers = 0
-max_workers = 1  # Reduced from 3 to 1 for Raspberry Pi 3B+ (limited CPU resources)
+# Worker count scales between these bounds depending on system load
+min_workers = int(os.getenv('DM_CACHE_MIN_WORKERS', '1'))
+max_workers = int(os.getenv('DM_CACHE_MAX_WORKERS', str(max(1, load_monitor.cpu_count() // 2))))
 worker_threads = []
 cached_images = set()  # Set to track which images have been cached
 cache_lock = threading.RLock()  # Lock for thread-safe operations
 shutdown_event = threading.Event()  # Event to signal worker threads to shut down
+pending_jobs = set()  # Cache keys currently waiting in cache_queue
+dispatcher_thread = None
+
+# View events reported by request handlers: (image_path, width, crop)
+view_event_queue = queue.Queue(maxsize=1000)
+DISPATCH_BURST_WINDOW = 0.5  # Seconds to collect further events after the first one
+DISPATCH_MIN_INTERVAL = 30.0  # Seconds before the same view event is planned again
+
+# Idle-time prefetch of the folder the DM is working in
+PREFETCH_IDLE_SECONDS = float(os.getenv('DM_PREFETCH_IDLE_SECONDS', '60'))  # Quiet time before prefetching starts
+PREFETCH_CPU_BUDGET = float(os.getenv('DM_PREFETCH_CPU_BUDGET', '300'))  # CPU seconds per idle period
+PREFETCH_BYTE_BUDGET = int(os.getenv('DM_PREFETCH_BYTE_BUDGET', str(64 * 1024 * 1024)))  # Bytes written per idle period
+PREFETCH_WIDTHS = [250, 500, 1000, 1920]
+active_folder = None  # Folder the DM is currently working in (None = root)
+prefetch_thread = None
 
 # Job priority levels (lower number = higher priority)
 PRIORITY_SAME_FOLDER = 10
 PRIORITY_OTHER_IMAGES = 20
+PRIORITY_NEIGHBOUR_CROPS = 30
+
+# Crop renders of larger images than this (estimated decode memory) are not warmed
+CROP_MEMORY_CEILING = int(os.getenv('DM_CROP_MEMORY_CEILING_MB', '128')) * 1024 * 1024
 
 class CacheJob:
     """Represents a job to cache an image with specific parameters."""
     
-    def __init__(self, image_path: str, width: Optional[int], img_hash:str, crop: bool, priority: int, quality: int = 85):
+    def __init__(self, image_path: str, width: Optional[int], img_hash:str, crop: bool, priority: int, quality: int = 85,
+                 image_meta: Optional[dict] = None):
         self.image_path = image_path
+        self.image_meta = image_meta  # Metadata snapshot the crop is rendered from
         self.width = width
         self.crop = crop
         self.priority = priority
         self.quality = quality
+        self.img_hash = img_hash
 
         # Create a cache key based on the path and width
-        self.cache_key = f"{image_path}_{width}_{'crop' if crop else 'nocrop'}_{img_hash}"
+        self.cache_key = cache_key_for(image_path, width, crop, img_hash)
         
     def __lt__(self, other):
         """Compare jobs based on priority for the priority queue."""
         return self.priority < other.priority
 
-def init_cache_system(cache_folder: str, upload_folder: str):
+def init_cache_system(cache_folder: str, upload_folder: str, db):
     """Initialize the background caching system."""
-    global worker_threads, shutdown_event
+    global worker_threads, shutdown_event, dispatcher_thread, prefetch_thread
     
     # Create cache directory if it doesn't exist
     os.makedirs(cache_folder, exist_ok=True)
@@ -54,14 +83,32 @@ def init_cache_system(cache_folder: str, upload_folder: str):
     for i in range(max_workers):
         thread = threading.Thread(
             target=cache_worker,
-            args=(cache_folder, upload_folder),
+            args=(cache_folder, upload_folder, i),
             name=f"CacheWorker-{i}",
             daemon=True
         )
         thread.start()
         worker_threads.append(thread)
+
+    # Start the single dispatcher that turns view events into cache jobs
+    dispatcher_thread = threading.Thread(
+        target=cache_dispatcher,
+        args=(db,),
+        name="CacheDispatcher",
+        daemon=True
+    )
+    dispatcher_thread.start()
+
+    # Start the idle-time prefetcher
+    prefetch_thread = threading.Thread(
+        target=idle_prefetcher,
+        args=(cache_folder, upload_folder, db),
+        name="IdlePrefetcher",
+        daemon=True
+    )
+    prefetch_thread.start()
     
-    print(f"Background caching system initialized with {max_workers} workers")
+    print(f"Background caching system initialized with {min_workers}-{max_workers} workers")
 
 def shutdown_cache_system():
     """Shutdown the background caching system."""
@@ -73,25 +120,38 @@ def shutdown_cache_system():
     # Wait for all worker threads to finish
     for thread in worker_threads:
         thread.join(timeout=2.0)
+    if dispatcher_thread is not None:
+        dispatcher_thread.join(timeout=2.0)
+    if prefetch_thread is not None:
+        prefetch_thread.join(timeout=2.0)
     
     print("Background caching system shut down")
 
-def cache_worker(cache_folder: str, upload_folder: str):
-    """Worker thread that processes cache jobs from the queue."""
+def cache_worker(cache_folder: str, upload_folder: str, worker_index: int = 0):
+    """Worker thread that processes cache jobs from the queue.
+
+    Workers whose index is above the currently recommended pool size stay idle,
+    and all workers pause while foreground renders are in progress.
+    """
     global active_workers, cached_images, cache_lock
     
     while not shutdown_event.is_set():
+        if (load_monitor.background_paused()
+                or worker_index >= load_monitor.recommended_workers(min_workers, max_workers)):
+            shutdown_event.wait(0.5)
+            continue
+
         try:
             # Get a job from the queue with a timeout
             job = cache_queue.get(timeout=1.0)
             
             with cache_lock:
                 active_workers += 1
+                pending_jobs.discard(job.cache_key)
             
             try:
                 # Check if this image is already cached
-                cache_hash = hashlib.md5(job.cache_key.encode()).hexdigest()
-                cache_path = os.path.join(cache_folder, f"{cache_hash}.webp")
+                cache_path = cache_path_for(cache_folder, job.image_path, job.width, job.crop, job.img_hash)
                 
                 # Skip if already cached
                 if os.path.exists(cache_path) or job.cache_key in cached_images:
@@ -110,38 +170,18 @@ def cache_worker(cache_folder: str, upload_folder: str):
                 
                 print(f"Background caching: {job.image_path} (width={job.width}, crop={job.crop})")
                 
-                # Open and process the image
-                with Image.open(file_path) as original_img:
-                    # Handle crop if needed (simplified - actual cropping would use the same logic as in server.py)
-                    img = original_img
-                    if job.crop:
-                        # In a real implementation, we would apply the same crop logic as in server.py
-                        # For now, we'll just use the original image
-                        pass
-                    
-                    # Resize the image if width is specified
-                    if job.width and img.size[0] > job.width:
-                        h = int(job.width / (img.size[0]/img.size[1]))
-                        resized_img = img.resize((job.width, h), Image.BILINEAR)
-                        if img is not original_img:
-                            img.close()
-                        img = resized_img
-                    
-                    # Ensure height is not too large
-                    if img.size[1] > 1080:
-                        w = int(1080 * (img.size[0]/img.size[1]))
-                        resized_img = img.resize((w, 1080), Image.BILINEAR)
-                        if img is not original_img:
-                            img.close()
-                        img = resized_img
-                    
-                    # Save to cache with quality from job
-                    img.save(cache_path, format="WebP", quality=job.quality)
-                    print(f"Cached image saved: {cache_path}")
-                    
-                    # Close the final image if it's different from the original
-                    if img is not original_img:
-                        img.close()
+                if job.crop:
+                    # Stay within the memory ceiling; large maps are rendered on demand only
+                    needed = estimate_render_bytes(file_path, job.image_meta, job.crop)
+                    free_mb = load_monitor.free_memory_mb()
+                    if needed > CROP_MEMORY_CEILING or (free_mb is not None and needed > free_mb * 1024 * 1024 / 2):
+                        print(f"Skipping crop warming for {job.image_path}: needs {needed // (1024 * 1024)} MB")
+                        continue
+
+                # Render with the same code path serve_img uses
+                render_to_cache(file_path, job.image_meta, job.width, job.crop, job.quality, cache_path,
+                                foreground=False)
+                print(f"Cached image saved: {cache_path}")
             
             except Exception as e:
                 print(f"Error caching image {job.image_path}: {e}")
@@ -158,80 +198,230 @@ def cache_worker(cache_folder: str, upload_folder: str):
         except Exception as e:
             print(f"Error in cache worker: {e}")
 
-def queue_image_for_caching(image_path: str, width: Optional[int], crop: bool,
-                           db, upload_folder: str):
+def notify_image_viewed(image_path: str, width: Optional[int], crop: bool = False):
+    """
+    Report that an image was viewed so related images can be cached.
+
+    This is cheap and never blocks: the event is handed to the dispatcher
+    thread, which does the actual planning. Events are dropped if the
+    dispatcher is backlogged.
+
+    Args:
+        image_path: Path of the viewed image (relative to the upload folder)
+        width: Width the image was requested with
+        crop: Whether the cropped display variant was requested
+    """
+    try:
+        view_event_queue.put_nowait((image_path, width, crop))
+    except queue.Full:
+        pass
+
+def cache_dispatcher(db):
+    """Dispatcher thread that coalesces view events and plans cache jobs per burst."""
+    last_planned = {}  # (image_path, width, crop) -> time the event was last planned
+
+    while not shutdown_event.is_set():
+        try:
+            first_event = view_event_queue.get(timeout=1.0)
+        except queue.Empty:
+            continue
+
+        # Collect the rest of the burst so it is planned in one go
+        events = {first_event}
+        deadline = time.time() + DISPATCH_BURST_WINDOW
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                events.add(view_event_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        # Rate-limit: a client polling the same image does not trigger re-planning
+        now = time.time()
+        events = [e for e in events if now - last_planned.get(e, 0) >= DISPATCH_MIN_INTERVAL]
+        for event in events:
+            last_planned[event] = now
+        if len(last_planned) > 1000:
+            last_planned = {e: t for e, t in last_planned.items() if now - t < DISPATCH_MIN_INTERVAL}
+
+        if events:
+            try:
+                plan_cache_jobs(events, db)
+            except Exception as e:
+                print(f"Error in cache dispatcher: {e}")
+
+def plan_cache_jobs(events, db):
     """
-    Queue an image for background caching and also queue related images.
+    Queue related images for background caching for a burst of view events.
+
+    Width-only views queue the same width for all other images, starting with
+    the viewed image's folder. Crop views only queue the crop variants of the
+    image's neighbours (previous/next by name in the same folder): crop
+    settings are image-specific, and pre-caching all images with crop causes
+    massive RAM usage.
     
     Args:
-        image_path: Path to the image file
-        width: Width to resize the image to
-        crop: Whether to crop the image
+        events: Iterable of (image_path, width, crop) view events
         db: Database instance to get related images
-        upload_folder: Path to the upload folder
     """
-    # Skip if we already have too many active workers
-    global active_workers, cache_lock
-    with cache_lock:
-        if active_workers >= max_workers:
-            return
-    
-    # IMPORTANT: When crop=True, do NOT pre-cache other images!
-    # Crop settings are image-specific, and pre-caching all images with crop
-    # causes massive RAM usage and server freezing. Only pre-cache for width-only operations.
-    if crop:
-        # For crop operations, don't queue any additional images
-        # The requested image will be cached on-demand when served
+    events = list(events)
+    if not events:
         return
+
+    # One database snapshot and one hash per image for the whole burst
+    database = db.get_database()
+    all_images = database['images']
+    images_by_path = {img['path']: img for img in all_images}
+    img_hashes = {img['path']: image_hash(img) for img in all_images}
     
-    try:
-        # Get all images from the database
-        database = db.get_database()
-        all_images = database['images']
-        
-        # Get image quality setting from database (Fix #11)
-        quality = db.get_setting('image_quality', 85)
-        
-        # Find the current image in the database
-        current_image = next((img for img in all_images if img['path'] == image_path), None)
-        if not current_image:
-            return
-        
-        # Get the folder ID of the current image
-        folder_id = current_image.get('parent')
-        
-        # First, queue images in the same folder
-        same_folder_images = [img for img in all_images 
-                             if img['path'] != image_path and img.get('parent') == folder_id]
-        
-        for img in same_folder_images:
-            img_hash = hashlib.md5(json.dumps(img).encode()).hexdigest()
-            job = CacheJob(img['path'], width, img_hash, crop, PRIORITY_SAME_FOLDER, quality)
-            if job.cache_key not in cached_images:
-                cache_queue.put(job)
-        
-        # Then, queue other images with the same width parameter
-        other_images = [img for img in all_images 
-                       if img['path'] != image_path and img.get('parent') != folder_id]
-        
-        for img in other_images:
-            img_hash = hashlib.md5(json.dumps(img).encode()).hexdigest()
-            job = CacheJob(img['path'], width, img_hash, crop, PRIORITY_OTHER_IMAGES, quality)
-            if job.cache_key not in cached_images:
-                cache_queue.put(job)
-                
-    except Exception as e:
-        print(f"Error queueing images for caching: {e}")
+    # Get image quality setting from database (Fix #11)
+    quality = db.get_setting('image_quality', 85)
+
+    def queue_job(job):
+        with cache_lock:
+            if job.cache_key in cached_images or job.cache_key in pending_jobs:
+                return
+            pending_jobs.add(job.cache_key)
+        cache_queue.put(job)
+
+    width_events = [(path, width) for path, width, crop in events if not crop]
+    viewed_paths = {path for path, _ in width_events}
+    widths = {width for _, width in width_events}
+    # Folders of the viewed images are cached first
+    viewed_folders = {images_by_path[path].get('parent') for path in viewed_paths if path in images_by_path}
+
+    if viewed_folders:
+        for width in widths:
+            for img in all_images:
+                if img['path'] in viewed_paths:
+                    continue
+                priority = PRIORITY_SAME_FOLDER if img.get('parent') in viewed_folders else PRIORITY_OTHER_IMAGES
+                queue_job(CacheJob(img['path'], width, img_hashes[img['path']], False, priority, quality))
+
+    for path, width, crop in events:
+        if not crop or path not in images_by_path:
+            continue
+        for img in folder_neighbours(all_images, images_by_path[path]):
+            img_hash = img_hashes[img['path']]
+            queue_job(CacheJob(img['path'], width, img_hash, True, PRIORITY_NEIGHBOUR_CROPS, quality, img))
+            if img.get('thumb_path'):
+                queue_job(CacheJob(img['thumb_path'], None, image_hash(img, img['thumb_path']), True,
+                                   PRIORITY_NEIGHBOUR_CROPS, quality, img))
+
+def folder_neighbours(all_images: List[dict], image: dict) -> List[dict]:
+    """Return the previous and next image by name in the same folder (in gallery order)."""
+    siblings = sorted(
+        (img for img in all_images
+         if img.get('parent') == image.get('parent') and img.get('processing_status', 'completed') == 'completed'),
+        key=lambda x: x['name'].lower()
+    )
+    index = next((i for i, img in enumerate(siblings) if img['id'] == image['id']), None)
+    if index is None:
+        return []
+    return [siblings[i] for i in (index + 1, index - 1) if 0 <= i < len(siblings) and i != index]
+
+def set_active_folder(folder_id: Optional[str]):
+    """Remember the folder the DM is working in; the idle prefetcher renders its subtree."""
+    global active_folder
+    active_folder = folder_id
+
+def folder_subtree(folders: List[dict], root_id: Optional[str]) -> Set[Optional[str]]:
+    """Return the ids of a folder and all of its descendants (None is the root folder)."""
+    subtree = {root_id}
+    changed = True
+    while changed:
+        changed = False
+        for folder in folders:
+            if folder.get('parent') in subtree and folder['id'] not in subtree:
+                subtree.add(folder['id'])
+                changed = True
+    return subtree
+
+def prefetch_variants(image: dict) -> List[Tuple[str, Optional[int], bool]]:
+    """Return the (path, width, crop) variants of an image that clients are likely to request."""
+    # Player view and admin gallery use the cropped display image and thumbnail
+    variants = [(image['path'], None, True)]
+    if image.get('thumb_path'):
+        variants.append((image['thumb_path'], None, True))
+    # Width-specific renders of the uncropped image
+    variants.extend((image['path'], width, False) for width in PREFETCH_WIDTHS)
+    return variants
+
+def idle_prefetcher(cache_folder: str, upload_folder: str, db):
+    """Prefetch thread that renders the active folder's subtree whenever the server is idle."""
+    last_pass = None  # Idle period (start time) that was already prefetched
+
+    while not shutdown_event.wait(5.0):
+        idle_since = load_monitor.last_request_time
+        if idle_since == last_pass or time.time() - idle_since < PREFETCH_IDLE_SECONDS:
+            continue
+        if load_monitor.background_paused():
+            continue
+
+        try:
+            if run_idle_prefetch(cache_folder, upload_folder, db, idle_since):
+                last_pass = idle_since
+        except Exception as e:
+            print(f"Error in idle prefetch: {e}")
+            last_pass = idle_since
+
+def run_idle_prefetch(cache_folder: str, upload_folder: str, db, idle_since: float) -> bool:
+    """
+    Render all missing variants of the images in the active folder's subtree.
+
+    Stops as soon as a request arrives. Returns True if the pass is finished
+    (everything is cached or the CPU/byte budget is spent) and False if it was
+    interrupted and should be resumed in the next idle period.
+    """
+    database = db.get_database()
+    quality = db.get_setting('image_quality', 85)
+    subtree = folder_subtree(database['folders'], active_folder)
+    images = [img for img in database['images']
+              if img.get('parent') in subtree and img.get('processing_status', 'completed') == 'completed']
+
+    cpu_start = time.thread_time()
+    bytes_written = 0
+    rendered = 0
+
+    for image in images:
+        for path, width, crop in prefetch_variants(image):
+            img_hash = image_hash(image, path)
+            cache_path = cache_path_for(cache_folder, path, width, crop, img_hash)
+            if os.path.exists(cache_path):
+                continue
+            file_path = os.path.join(upload_folder, path)
+            if not os.path.exists(file_path):
+                continue
+
+            # Only run while nobody is using the server
+            if shutdown_event.is_set() or load_monitor.last_request_time != idle_since:
+                return False
+            if time.thread_time() - cpu_start >= PREFETCH_CPU_BUDGET or bytes_written >= PREFETCH_BYTE_BUDGET:
+                print(f"Idle prefetch budget spent after {rendered} renders")
+                return True
+
+            try:
+                bytes_written += render_to_cache(file_path, image, width, crop, quality, cache_path,
+                                                 foreground=False)
+                rendered += 1
+                with cache_lock:
+                    cached_images.add(cache_key_for(path, width, crop, img_hash))
+            except Exception as e:
+                print(f"Error prefetching {path}: {e}")
+
+    if rendered:
+        print(f"Idle prefetch finished: {rendered} renders, {bytes_written} bytes")
+    return True
 
 def is_image_cached(image_path: str, width: Optional[int], img_hash:str, crop: bool, cache_folder: str) -> bool:
     """Check if an image is already cached."""
-    cache_key = f"{image_path}_{width}_{'crop' if crop else 'nocrop'}_{img_hash}"
-    cache_hash = hashlib.md5(cache_key.encode()).hexdigest()
-    cache_path = os.path.join(cache_folder, f"{cache_hash}.webp")
-    return os.path.exists(cache_path)
+    return os.path.exists(cache_path_for(cache_folder, image_path, width, crop, img_hash))
 
 def clear_cached_images_tracking():
     """Clear the set of cached images (used for testing)."""
     global cached_images, cache_lock
     with cache_lock:
-        cached_images.clear()
\ No newline at end of file
+        cached_images.clear()
+        pending_jobs.clear()
\ No newline at end of file
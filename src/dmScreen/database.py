@@ -34,6 +34,8 @@ class Database:
         self._cache = None  # In-memory cache
         self._cache_timestamp = 0  # Timestamp when cache was last loaded
         self._image_index = {}  # O(1) lookup index: path -> image metadata
+        self._id_index = {}  # O(1) lookup index: id -> image metadata
+        self._content_index = {}  # content hash -> images sharing that file
         self.init_database()
 
 
@@ -100,10 +102,14 @@ class Database:
             self._cache_timestamp = 0
             # Invalidate image index so it will be rebuilt on next access
             self._image_index = {}
+            self._id_index = {}
+            self._content_index = {}
 
     def _rebuild_index(self):
-        """Rebuild the image index for O(1) path lookups."""
+        """Rebuild the image indexes for O(1) path, id and content hash lookups."""
         self._image_index = {}
+        self._id_index = {}
+        self._content_index = {}
         if self._cache and 'images' in self._cache:
             for img in self._cache.get('images', []):
                 # Index by main path
@@ -112,11 +118,24 @@ class Database:
                 # Also index by thumbnail path if it exists
                 if 'thumb_path' in img:
                     self._image_index[img['thumb_path']] = img
+                self._id_index[img['id']] = img
+                if img.get('content_hash'):
+                    self._content_index.setdefault(img['content_hash'], []).append(img)
+
+    def _ensure_index(self):
+        # Reload after save_database() invalidated the cache
+        if self._cache is None:
+            self.get_database()
+        elif not self._id_index:
+            self._rebuild_index()
 
     def get_image_by_path(self, path):
         """
         Get image metadata by path with O(1) lookup instead of O(n) linear search.
         
+        Several images may share one file (see content_hash); any one of them
+        is returned. Use get_image_by_id() where the transformation matters.
+        
         Args:
             path: Image path or thumbnail path to look up
             
@@ -124,11 +143,37 @@ class Database:
             Image metadata dictionary or None if not found
         """
         with self.lock:
-            # Ensure index is built
-            if not self._image_index and self._cache:
-                self._rebuild_index()
+            self._ensure_index()
             return self._image_index.get(path)
     
+    def get_image_by_id(self, image_id):
+        """
+        Get image metadata by id with O(1) lookup.
+        
+        Args:
+            image_id: ID of the image
+            
+        Returns:
+            Image metadata dictionary or None if not found
+        """
+        with self.lock:
+            self._ensure_index()
+            return self._id_index.get(image_id)
+    
+    def get_images_by_content_hash(self, content_hash):
+        """
+        Get all images whose file has the given content hash.
+        
+        Args:
+            content_hash: SHA-256 of the uploaded file
+            
+        Returns:
+            List of image metadata dictionaries (empty if none)
+        """
+        with self.lock:
+            self._ensure_index()
+            return list(self._content_index.get(content_hash, []))
+    
     def get_setting(self, key, default=None):
         """
         Get a single setting without copying the entire database.
@@ -178,9 +223,10 @@ class Database:
         if 'parent' not in image_data:
             image_data['parent'] = None
             
-        db = self.get_database()
-        db["images"].append(image_data)
-        self.save_database(db)
+        with self.lock:
+            db = self.get_database()
+            db["images"].append(image_data)
+            self.save_database(db)
 
     def removeImage(self, image_id):
 
@@ -312,52 +358,107 @@ class Database:
             db = self.get_database()
             updated = False
             
+            # All images sharing the file get the thumbnail
             for image in db['images']:
                 if image['path'] == image_path and 'thumb_path' not in image:
                     image['thumb_path'] = thumb_path
                     updated = True
-                    break
                     
             if updated:
                 self.save_database(db)
                 
             return updated
     
-    def update_image_processing_status(self, image_id, status):
+    def set_image_thumbnail(self, image_path, thumb_path, thumb_signature):
+        """Set the thumbnail of all images with the given path after it was regenerated
+        
+        Args:
+            image_path: Path of the image file
+            thumb_path: Path of the new thumbnail file
+            thumb_signature: Signature of the thumbnail's inputs (source file and quality)
+        """
+        with self.lock:
+            db = self.get_database()
+            for image in db['images']:
+                if image['path'] == image_path:
+                    image['thumb_path'] = thumb_path
+                    image['thumb_signature'] = thumb_signature
+            self.save_database(db)
+
+    def set_image_placeholders(self, placeholders):
+        """Store the placeholder previews of images
+
+        Args:
+            placeholders: Dictionary mapping image IDs to placeholder data URIs
+        """
+        if not placeholders:
+            return
+        with self.lock:
+            db = self.get_database()
+            for image in db['images']:
+                if image['id'] in placeholders:
+                    image['placeholder'] = placeholders[image['id']]
+            self.save_database(db)
+
+    def _processing_group(self, db, image_id):
+        """Return an image and all images sharing its file (same content_hash) from db."""
+        image = next((img for img in db['images'] if img['id'] == image_id), None)
+        if image is None:
+            return []
+        if not image.get('content_hash'):
+            return [image]
+        return [img for img in db['images'] if img.get('content_hash') == image['content_hash']]
+    
+    def update_image_processing_status(self, image_id, status, attempts=None, error=None, next_attempt=None):
         """Update the processing status of an image
         
+        The job state is kept in the image record, so unfinished processing
+        can be resumed after a restart. Images sharing the file are updated
+        along with it.
+        
         Args:
             image_id: ID of the image to update
             status: New status ('pending', 'processing', 'completed', 'failed')
+            attempts: Number of processing attempts so far (unchanged if None)
+            error: Error message of the last failed attempt
+            next_attempt: Unix time before which the image should not be retried
         """
         with self.lock:
             db = self.get_database()
             
-            for image in db['images']:
-                if image['id'] == image_id:
-                    image['processing_status'] = status
-                    break
+            for image in self._processing_group(db, image_id):
+                image['processing_status'] = status
+                if attempts is not None:
+                    image['processing_attempts'] = attempts
+                image['processing_error'] = error
+                image['processing_next_attempt'] = next_attempt
+                image['processing_updated_at'] = datetime.now().isoformat()
             
             self.save_database(db)
     
-    def update_image_after_processing(self, image_id, new_path, new_thumb_path, status):
+    def update_image_after_processing(self, image_id, new_path, new_thumb_path, status, properties=None):
         """Update image paths and status after background processing
         
+        Images sharing the file (same content_hash) are updated along with it.
+        
         Args:
             image_id: ID of the image to update
             new_path: New path to the processed image file
             new_thumb_path: New path to the thumbnail file
             status: New processing status (typically 'completed')
+            properties: Further fields to store, e.g. processing statistics
         """
         with self.lock:
             db = self.get_database()
             
-            for image in db['images']:
-                if image['id'] == image_id:
-                    image['path'] = new_path
-                    image['thumb_path'] = new_thumb_path
-                    image['processing_status'] = status
-                    break
+            for image in self._processing_group(db, image_id):
+                image.update(properties or {})
+                image['path'] = new_path
+                image['thumb_path'] = new_thumb_path
+                image['processing_status'] = status
+                image['processing_updated_at'] = datetime.now().isoformat()
+                image['processing_error'] = None
+                image['processing_next_attempt'] = None
             
             self.save_database(db)
             
@@ -0,0 +1,142 @@
+"""
+Change events pushed to dmScreen clients.
+
+Changes are published as typed events with increasing sequence numbers and
+kept in a short history. Clients receive them over a Server-Sent Events
+stream or by long polling; a client whose connection dropped resumes after
+the last event it received (Last-Event-ID, or the cursor of its last poll)
+instead of reloading everything. The payload of an event is serialized
+once when it is published, however many clients receive it.
+
+Publishing never waits for clients: each client reads the history at its
+own pace. A client that fell behind (a slow tablet) gets the events it
+missed in one batch, in which events of the LATEST_ONLY_TYPES are reduced
+to the latest one by coalesce(), so it does not show every display it
+missed one after another.
+"""
+import collections
+import json
+import threading
+from typing import Callable, Collection, List, Optional, Tuple
+
+# Number of past events kept for clients that reconnect
+HISTORY_SIZE = 256
+# Event types that carry a complete state; a later event of the type replaces the earlier ones
+LATEST_ONLY_TYPES = frozenset({'display', 'network'})
+
+
+class EventBus:
+    """Sequence-numbered event history with blocking waits for new events."""
+
+    def __init__(self, instance_id: str, history_size: int = HISTORY_SIZE):
+        """
+        Args:
+            instance_id: Id of this server process; event ids of an earlier process are not resumed
+            history_size: Number of past events kept
+        """
+        self.instance_id = instance_id
+        self.condition = threading.Condition()
+        self.history = collections.deque(maxlen=history_size)
+        self.last_seq = 0
+        self.listeners = []
+
+    def add_listener(self, callback: Callable[[], None]):
+        """Call callback (from the publishing thread) after every published event."""
+        self.listeners.append(callback)
+
+    def publish(self, event_type: str, data: Optional[dict] = None) -> int:
+        """Publish an event to all waiting clients and return its sequence number."""
+        payload = json.dumps(data if data is not None else {})
+        with self.condition:
+            self.last_seq += 1
+            self.history.append((self.last_seq, event_type, payload))
+            self.condition.notify_all()
+            seq = self.last_seq
+        for callback in self.listeners:
+            callback()
+        return seq
+
+    def interrupt(self):
+        """Wake all threads waiting in wait() without publishing an event."""
+        with self.condition:
+            self.condition.notify_all()
+
+    def event_id(self, seq: int) -> str:
+        """Return the SSE event id of a sequence number."""
+        return f"{self.instance_id}:{seq}"
+
+    def parse_event_id(self, event_id: Optional[str]) -> Optional[int]:
+        """Return the sequence number of an event id issued by this process, or None."""
+        if not event_id:
+            return None
+        instance_id, _, seq = event_id.rpartition(':')
+        if instance_id != self.instance_id or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def resume(self, last_event_id: Optional[str]) -> Tuple[int, bool]:
+        """
+        Return the sequence number a connecting client continues from.
+
+        Returns:
+            (cursor, resync); resync is True if the client sent a Last-Event-ID
+            it cannot resume from and has to reload its state
+        """
+        with self.condition:
+            cursor = self.parse_event_id(last_event_id)
+            resync = last_event_id is not None and (cursor is None or self._events_after(cursor) is None)
+            if cursor is None or resync:
+                cursor = self.last_seq
+            return cursor, resync
+
+    def _events_after(self, seq: int) -> Optional[List[Tuple[int, str, str]]]:
+        if seq > self.last_seq:
+            return None
+        oldest = self.history[0][0] if self.history else self.last_seq + 1
+        if seq < oldest - 1:
+            # Some of the events were already dropped from the history
+            return None
+        return [event for event in self.history if event[0] > seq]
+
+    def events_after(self, seq: int, types: Optional[Collection[str]] = None) -> Optional[List[Tuple[int, str, str]]]:
+        """
+        Return the events published after seq as (seq, type, JSON payload) tuples.
+
+        Args:
+            seq: Sequence number of the last event the client received
+            types: Only return events of these types (default: all)
+
+        Returns None if the client cannot resume from seq because events were
+        dropped from the history in between; it has to reload its state.
+        """
+        with self.condition:
+            events = self._events_after(seq)
+        if events is not None and types is not None:
+            events = [event for event in events if event[1] in types]
+        return events
+
+    def wait(self, seq: int, timeout: float) -> Optional[List[Tuple[int, str, str]]]:
+        """Like events_after(), but wait up to timeout seconds while there are no new events."""
+        with self.condition:
+            events = self._events_after(seq)
+            if events == []:
+                self.condition.wait(timeout)
+                events = self._events_after(seq)
+            return events
+
+
+def coalesce(events: List[Tuple[int, str, str]],
+             latest_only: Collection[str] = LATEST_ONLY_TYPES) -> List[Tuple[int, str, str]]:
+    """Drop the events of a batch that are replaced by a later event of the same latest-only type."""
+    latest = {event_type: seq for seq, event_type, _ in events if event_type in latest_only}
+    return [event for event in events if latest.get(event[1], event[0]) == event[0]]
+
+
+def format_event(event_type: str, payload: str, event_id: Optional[str] = None) -> str:
+    """Return one event in the text/event-stream format."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {payload}")
+    return '\n'.join(lines) + '\n\n'
@@ -0,0 +1,586 @@
+"""
+Image rendering helpers for dmScreen.
+
+Request handlers and the background caching workers render display variants
+(transformed, cropped, resized) of uploaded images with the same code, so a
+variant rendered in the background is byte-for-byte what serve_img would
+have produced for the same request.
+"""
+import base64
+import hashlib
+import io
+import json
+import math
+import os
+from typing import Optional
+
+from PIL import Image
+
+from dmScreen.admission import decode_budget
+
+# Player screen resolution that crop coordinates refer to
+SCREEN_SIZE = (1920, 1080)
+# Image metadata fields that change the rendered result
+RENDER_FIELDS = ('path', 'rotate', 'mirror', 'crop')
+
+# Uploads larger than this are downsampled while they are ingested
+INGEST_MAX_PIXELS = int(float(os.getenv('DM_INGEST_MAX_MP', '40')) * 1000 * 1000)
+# Largest width or height a WebP file can store
+WEBP_MAX_DIMENSION = 16383
+# Above this size the slower, memory-hungrier WebP method 6 is not used
+WEBP_METHOD6_MAX_PIXELS = 16 * 1000 * 1000
+THUMBNAIL_SIZE = (250, 250)
+# Tiny preview stored in the image record, painted while the real image loads
+PLACEHOLDER_SIZE = (32, 32)
+PLACEHOLDER_QUALITY = 40
+
+# Limits for animated images: longer animations are cut, larger ones are downscaled
+ANIMATION_MAX_FRAMES = int(os.getenv('DM_ANIMATION_MAX_FRAMES', '300'))
+ANIMATION_MAX_DURATION = int(float(os.getenv('DM_ANIMATION_MAX_SECONDS', '30')) * 1000)  # Milliseconds
+ANIMATION_MAX_PIXELS = int(float(os.getenv('DM_ANIMATION_MAX_MP', '64')) * 1000 * 1000)  # All frames together
+DEFAULT_FRAME_DURATION = 100  # Milliseconds, for frames without a duration
+
+# EXIF orientation tag and the transposition that shows an image upright for each value
+EXIF_ORIENTATION = 0x0112
+ORIENTATION_TRANSPOSE = {
+    2: Image.FLIP_LEFT_RIGHT,
+    3: Image.ROTATE_180,
+    4: Image.FLIP_TOP_BOTTOM,
+    5: Image.TRANSPOSE,
+    6: Image.ROTATE_270,
+    7: Image.TRANSVERSE,
+    8: Image.ROTATE_90,
+}
+
+
+def image_hash(image_meta: Optional[dict], image_path: Optional[str] = None) -> str:
+    """
+    Return a hash of the metadata that affects how an image is rendered.
+
+    It changes whenever the file or the transformation changes. Images that
+    share a file with the same transformation share their cached renders, and
+    renaming or moving an image keeps them.
+
+    Args:
+        image_meta: Image metadata; may be None for unknown files
+        image_path: The file that is rendered; for the image's thumbnail the
+            hash also changes when the thumbnail is regenerated
+    """
+    if not image_meta:
+        return 'default'
+    render_meta = {field: image_meta.get(field) for field in RENDER_FIELDS}
+    if image_path is not None and image_path == image_meta.get('thumb_path'):
+        render_meta['thumb_signature'] = image_meta.get('thumb_signature')
+    return hashlib.md5(json.dumps(render_meta, sort_keys=True).encode()).hexdigest()
+
+
+def cache_key_for(image_path: str, width: Optional[int], crop: bool, img_hash: str) -> str:
+    """Return the cache key of a rendered variant."""
+    return f"{image_path}_{width}_{'crop' if crop else 'nocrop'}_{img_hash}"
+
+
+def cache_path_for(cache_folder: str, image_path: str, width: Optional[int], crop: bool, img_hash: str) -> str:
+    """Return the cache file path of a rendered variant."""
+    cache_hash = hashlib.md5(cache_key_for(image_path, width, crop, img_hash).encode()).hexdigest()
+    return os.path.join(cache_folder, f"{cache_hash}.webp")
+
+
+def apply_transform(img, image_meta: dict):
+    """Apply the mirror and rotate metadata of an image. Intermediate images are closed."""
+    original_img = img
+
+    if image_meta.get("mirror", None) is not None:
+        if image_meta["mirror"].get("h", False):
+            transformed_img = img.transpose(Image.FLIP_LEFT_RIGHT)
+            if img is not original_img:
+                img.close()
+            img = transformed_img
+        if image_meta["mirror"].get("v", False):
+            transformed_img = img.transpose(Image.FLIP_TOP_BOTTOM)
+            if img is not original_img:
+                img.close()
+            img = transformed_img
+
+    if image_meta.get("rotate", None) is not None:
+        angle = {270: 90, 180: 180, 90: -90}.get(image_meta["rotate"])
+        if angle is not None:
+            rotated_img = img.rotate(angle, expand=True)
+            if img is not original_img:
+                img.close()
+            img = rotated_img
+
+    return img
+
+
+def crop_box(img_size, crop_data: dict):
+    """
+    Convert crop metadata to a crop box in image coordinates.
+
+    Crop coordinates refer to the image fitted ("contain") into a 16:9 screen
+    of SCREEN_SIZE; the crop rectangle always has a 16:9 aspect ratio.
+    """
+    screen_size = SCREEN_SIZE
+    img_pos = [0, 0]
+    if img_size[0] / img_size[1] < 16/9:
+        scale = screen_size[1] / img_size[1]
+        t_size = [img_size[0] * scale, screen_size[1]]
+        img_pos[0] = int((screen_size[0] - t_size[0]) / 2)
+    else:
+        scale = screen_size[0] / img_size[0]
+        t_size = [screen_size[0], img_size[1] * scale]
+        img_pos[1] = int((screen_size[1] - t_size[1]) / 2)
+
+    c_x = crop_data.get("x")
+    c_y = crop_data.get("y")
+    c_w = crop_data.get("w")
+    c_h = int(c_w / 16 * 9)
+
+    x1 = max(img_pos[0], c_x) - img_pos[0]
+    y1 = max(img_pos[1], c_y) - img_pos[1]
+    x2 = min(img_pos[0] + t_size[0], c_x + c_w) - img_pos[0]
+    y2 = min(img_pos[1] + t_size[1], c_y + c_h) - img_pos[1]
+
+    return (x1 / scale, y1 / scale, x2 / scale, y2 / scale)
+
+
+def fit_to_width(img, width: Optional[int]):
+    """Downscale an image to at most the given width (default 1920) and 1080 pixels height."""
+    original_img = img
+    w = width if width is not None else SCREEN_SIZE[0]
+
+    # Use BILINEAR filter for faster resizing
+    if img.size[0] > w:
+        h = int(w / (img.size[0]/img.size[1]))
+        resized_img = img.resize((w, h), Image.BILINEAR)
+        if img is not original_img:
+            img.close()
+        img = resized_img
+    if img.size[1] > SCREEN_SIZE[1]:
+        w = int(SCREEN_SIZE[1] * (img.size[0]/img.size[1]))
+        resized_img = img.resize((w, SCREEN_SIZE[1]), Image.BILINEAR)
+        if img is not original_img:
+            img.close()
+        img = resized_img
+
+    return img
+
+
+def rendered_size(size, image_meta: Optional[dict], width: Optional[int], crop: bool):
+    """
+    Return (width, height) of a display variant without rendering it.
+
+    Args:
+        size: (width, height) of the stored image
+        image_meta: Image metadata (rotate, crop); may be None
+        width: Maximum width of the variant (None means full screen width)
+        crop: Whether the transformation and crop metadata are applied
+
+    Returns:
+        The size render_variant() produces for the same arguments
+    """
+    w, h = size
+    if crop and image_meta:
+        if image_meta.get("rotate") in (90, 270):
+            w, h = h, w
+        # PIL rounds the crop box to whole pixels
+        x1, y1, x2, y2 = (int(round(c)) for c in crop_box((w, h), image_meta['crop']))
+        w, h = x2 - x1, y2 - y1
+
+    max_w = width if width is not None else SCREEN_SIZE[0]
+    if w > max_w:
+        w, h = max_w, int(max_w / (w / h))
+    if h > SCREEN_SIZE[1]:
+        w, h = int(SCREEN_SIZE[1] * (w / h)), SCREEN_SIZE[1]
+    return (w, h)
+
+
+def stored_size(file_path: str, image_meta: Optional[dict]):
+    """
+    Return (width, height) of an image file.
+
+    Images ingested with metadata carry their dimensions in the record, so
+    the file is not touched; otherwise only the header is read.
+    """
+    if image_meta and image_meta.get('width') and os.path.basename(file_path) == image_meta.get('path'):
+        return (image_meta['width'], image_meta['height'])
+    with Image.open(file_path) as img:
+        return img.size
+
+
+def frame_count(image_meta: Optional[dict]) -> int:
+    """Return the number of frames of an image (1 for still images and unknown files)."""
+    if image_meta and image_meta.get('animated'):
+        return image_meta.get('frame_count', 1)
+    return 1
+
+
+def is_animated(img) -> bool:
+    """Return True if an opened image has more than one frame."""
+    return getattr(img, 'is_animated', False) and getattr(img, 'n_frames', 1) > 1
+
+
+def animation_frames(img, max_frames: int = ANIMATION_MAX_FRAMES, max_duration: int = ANIMATION_MAX_DURATION):
+    """
+    Yield (frame, duration) for the frames of an animated image within the limits.
+
+    The frame is the image itself, seeked to the frame; callers must convert
+    or copy it before the next frame is read.
+    """
+    total_duration = 0
+    for index in range(min(img.n_frames, max_frames)):
+        img.seek(index)
+        duration = img.info.get('duration') or DEFAULT_FRAME_DURATION
+        if index and total_duration + duration > max_duration:
+            break
+        total_duration += duration
+        yield img, duration
+
+
+def save_animation(frames, durations, path: str, quality: int, loop: int = 0):
+    """Save frames as an animated WebP."""
+    frames[0].save(path, format="WebP", quality=quality, method=4, save_all=True,
+                   append_images=frames[1:], duration=durations, loop=loop)
+
+
+def estimate_render_bytes(file_path: str, image_meta: Optional[dict], crop: bool) -> int:
+    """Estimate the peak memory of rendering a variant from metadata or the image header."""
+    width, height = stored_size(file_path, image_meta)
+    # Stored images are RGB; animations hold all rendered frames
+    decoded = width * height * 3 * frame_count(image_meta)
+    # Mirroring and rotating hold a transformed full-size copy next to the decoded image
+    if crop and image_meta and (image_meta.get('rotate') or any((image_meta.get('mirror') or {}).values())):
+        return decoded * 2
+    return decoded
+
+
+def render_variant(file_path: str, image_meta: Optional[dict], width: Optional[int], crop: bool):
+    """
+    Render a display variant of an image file.
+
+    Args:
+        file_path: Path to the source image file
+        image_meta: Image metadata (rotate, mirror, crop); may be None for unknown files
+        width: Maximum width of the result (None means full screen width)
+        crop: Whether to apply the transformation and crop metadata
+
+    Returns:
+        A new PIL image owned by the caller
+    """
+    with Image.open(file_path) as original_img:
+        return render_frame(original_img, image_meta, width, crop)
+
+
+def render_frame(original_img, image_meta: Optional[dict], width: Optional[int], crop: bool):
+    """Render one (still or animation) frame; returns a new image and leaves original_img open."""
+    img = original_img
+    if crop and image_meta:
+        img = apply_transform(img, image_meta)
+        cropped_img = img.crop(crop_box(img.size, image_meta['crop']))
+        if img is not original_img:
+            img.close()
+        img = cropped_img
+
+    resized_img = fit_to_width(img, width)
+    if resized_img is not img and img is not original_img:
+        img.close()
+    img = resized_img
+
+    if img is original_img:
+        img = original_img.copy()
+    return img
+
+
+def render_animation(file_path: str, image_meta: Optional[dict], width: Optional[int], crop: bool):
+    """
+    Render a display variant of an animated image file frame by frame.
+
+    Returns:
+        (frames, durations, loop); the frames are owned by the caller
+    """
+    frames = []
+    durations = []
+    try:
+        with Image.open(file_path) as original_img:
+            loop = original_img.info.get('loop', 0)
+            for frame, duration in animation_frames(original_img):
+                rendered = render_frame(frame, image_meta, width, crop)
+                frames.append(flatten_transparency(rendered))
+                durations.append(duration)
+    except Exception:
+        for frame in frames:
+            frame.close()
+        raise
+    return frames, durations, loop
+
+
+def save_to_cache(img, cache_path: str, quality: int, frames=None, durations=None, loop: int = 0):
+    """Save a rendered variant (or the frames of an animated one) to the cache.
+
+    The file is written under a temporary name and moved into place, so
+    concurrent readers never see a partially written cache file.
+    """
+    tmp_path = f"{cache_path}.{os.getpid()}.{id(img)}.tmp"
+    try:
+        if frames:
+            save_animation(frames, durations, tmp_path, quality, loop)
+        else:
+            img.save(tmp_path, format="WebP", quality=quality)
+        os.replace(tmp_path, cache_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def render_to_cache(file_path: str, image_meta: Optional[dict], width: Optional[int], crop: bool,
+                    quality: int, cache_path: str, foreground: bool = True, timeout: Optional[float] = None) -> int:
+    """
+    Render a display variant into the cache and return the size of the cache file in bytes.
+
+    Animated images are rendered into an animated variant, cached per width
+    like still ones. The decode is admitted through the global pixel budget;
+    BudgetExhausted is raised if it could not be acquired within the timeout.
+    """
+    stored_width, stored_height = stored_size(file_path, image_meta)
+    if frame_count(image_meta) > 1:
+        with decode_budget.reserve(stored_width * stored_height * frame_count(image_meta), foreground, timeout):
+            frames, durations, loop = render_animation(file_path, image_meta, width, crop)
+        try:
+            save_to_cache(frames[0], cache_path, quality, frames, durations, loop)
+        finally:
+            for frame in frames:
+                frame.close()
+        return os.path.getsize(cache_path)
+
+    with decode_budget.reserve(stored_width * stored_height, foreground, timeout):
+        img = render_variant(file_path, image_meta, width, crop)
+    try:
+        save_to_cache(img, cache_path, quality)
+    finally:
+        img.close()
+    return os.path.getsize(cache_path)
+
+
+def image_bytes(img) -> int:
+    """Return the size of an image's decoded pixel buffer in bytes."""
+    return img.size[0] * img.size[1] * len(img.getbands())
+
+
+def ingest_target_size(size, max_pixels: int):
+    """Return the size an upload is stored at: within max_pixels and the WebP dimension limit."""
+    width, height = size
+    scale = min(1.0, math.sqrt(max_pixels / (width * height)),
+                WEBP_MAX_DIMENSION / width, WEBP_MAX_DIMENSION / height)
+    return (max(1, int(width * scale)), max(1, int(height * scale)))
+
+
+def flatten_transparency(img):
+    """Return the image on a white background if it has transparency; a replaced input is closed."""
+    if img.mode == 'P':
+        if 'transparency' not in img.info:
+            flat_img = img.convert('RGB')
+            img.close()
+            return flat_img
+        rgba_img = img.convert('RGBA')
+        img.close()
+        img = rgba_img
+    if img.mode in ('RGBA', 'LA'):
+        flat_img = Image.new('RGB', img.size, (255, 255, 255))
+        # The image is its own mask: no separate alpha band is split off
+        flat_img.paste(img, (0, 0), img)
+        img.close()
+        return flat_img
+    return img
+
+
+def placeholder_data_uri(img) -> str:
+    """Shrink an image in place to PLACEHOLDER_SIZE and return it as a base64 WebP data URI."""
+    img.thumbnail(PLACEHOLDER_SIZE, Image.BILINEAR)
+    buffer = io.BytesIO()
+    img.save(buffer, format="WebP", quality=PLACEHOLDER_QUALITY, method=6)
+    return 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def has_transformation(image_meta: Optional[dict]) -> bool:
+    """Return True if the displayed (cropped) image differs from the stored one."""
+    if not image_meta:
+        return False
+    crop = image_meta.get('crop') or {}
+    return (bool(image_meta.get('rotate')) or any((image_meta.get('mirror') or {}).values())
+            or (crop.get('x', 0), crop.get('y', 0), crop.get('w', SCREEN_SIZE[0])) != (0, 0, SCREEN_SIZE[0]))
+
+
+def make_placeholder(thumb_path: str, image_meta: Optional[dict]) -> str:
+    """
+    Return the placeholder of an image as it is displayed (transformed and cropped).
+
+    It is rendered from the thumbnail: crop coordinates do not depend on the
+    image resolution, and a thumbnail decodes in a few milliseconds.
+    """
+    with Image.open(thumb_path) as thumb_img:
+        img = flatten_transparency(render_frame(thumb_img, image_meta, None, crop=bool(image_meta)))
+    try:
+        return placeholder_data_uri(img)
+    finally:
+        img.close()
+
+
+def make_thumbnail(file_path: str, thumb_path: str, quality: int, size=THUMBNAIL_SIZE, foreground: bool = False,
+                   timeout: Optional[float] = None):
+    """
+    Write a WebP thumbnail of an image file.
+
+    The image is decoded at reduced scale where the format allows it (JPEG
+    draft mode) and shrunk in place, without intermediate copies.
+    """
+    with Image.open(file_path) as img:
+        if is_animated(img):
+            _thumbnail_animation(img, thumb_path, quality, size, foreground, timeout)
+            return
+        img.draft('RGB', size)
+        with decode_budget.reserve(img.size[0] * img.size[1], foreground, timeout):
+            img.thumbnail(size, Image.BILINEAR)
+        thumb_img = flatten_transparency(img)
+        try:
+            thumb_img.save(thumb_path, format="WebP", quality=quality, method=6)
+        finally:
+            thumb_img.close()
+
+
+def _thumbnail_animation(img, thumb_path: str, quality: int, size, foreground: bool, timeout: Optional[float]):
+    """Write an animated thumbnail of an opened animated image."""
+    frames = []
+    durations = []
+    with decode_budget.reserve(img.size[0] * img.size[1], foreground, timeout):
+        try:
+            for frame, duration in animation_frames(img):
+                thumb_frame = frame.convert('RGBA')
+                thumb_frame.thumbnail(size, Image.BILINEAR)
+                frames.append(flatten_transparency(thumb_frame))
+                durations.append(duration)
+            save_animation(frames, durations, thumb_path, quality, img.info.get('loop', 0))
+        finally:
+            for frame in frames:
+                frame.close()
+
+
+def ingest_animation(source_img, webp_path: str, thumb_path: str, quality: int, max_pixels: int) -> dict:
+    """
+    Convert an opened animated upload to an animated WebP and an animated thumbnail.
+
+    Frames beyond ANIMATION_MAX_FRAMES or ANIMATION_MAX_DURATION are dropped,
+    and frames are downscaled so that all of them together stay within
+    ANIMATION_MAX_PIXELS. Returns the statistics described in ingest_image().
+    """
+    count = min(source_img.n_frames, ANIMATION_MAX_FRAMES)
+    target_size = ingest_target_size(source_img.size, min(max_pixels, ANIMATION_MAX_PIXELS // count))
+    loop = source_img.info.get('loop', 0)
+    frames = []
+    durations = []
+
+    frame_pixels = source_img.size[0] * source_img.size[1]
+    with decode_budget.reserve(frame_pixels + target_size[0] * target_size[1] * count, foreground=False):
+        try:
+            for frame, duration in animation_frames(source_img):
+                # Composited frame, independent from the decoder state
+                img = frame.convert('RGBA')
+                if img.size != target_size:
+                    resized_img = img.resize(target_size, Image.BILINEAR, reducing_gap=2.0)
+                    img.close()
+                    img = resized_img
+                frames.append(flatten_transparency(img))
+                durations.append(duration)
+
+            peak_memory = sum(image_bytes(frame) for frame in frames) + frame_pixels * 4
+            save_animation(frames, durations, webp_path, quality, loop)
+
+            # Thumbnail frames in place
+            for frame in frames:
+                frame.thumbnail(THUMBNAIL_SIZE, Image.BILINEAR)
+            save_animation(frames, durations, thumb_path, quality, loop)
+            placeholder = placeholder_data_uri(frames[0])
+        finally:
+            for frame in frames:
+                frame.close()
+
+    return {'original_size': source_img.size, 'size': target_size, 'mode': source_img.mode, 'orientation': 1,
+            'peak_memory': peak_memory, 'placeholder': placeholder, 'frame_count': len(frames),
+            'duration': sum(durations)}
+
+
+def ingest_image(file_path: str, webp_path: str, thumb_path: str, quality: int,
+                 max_pixels: int = INGEST_MAX_PIXELS) -> dict:
+    """
+    Convert an upload to the stored WebP and its thumbnail with bounded memory.
+
+    Oversized images are downsampled to max_pixels. JPEGs are downsampled by
+    the decoder itself (draft mode), so their full resolution is never held
+    in memory; other formats are reduced right after decoding. The EXIF
+    orientation is applied (after downsampling, where it is cheap) so phone
+    photos are stored upright. At most two pixel buffers exist at a time,
+    and the thumbnail is made in place from the stored image instead of
+    from a copy.
+
+    Args:
+        file_path: Path of the uploaded file
+        webp_path: Path to write the stored WebP to
+        thumb_path: Path to write the thumbnail to
+        quality: WebP quality
+        max_pixels: Pixel limit of the stored image
+
+    Returns:
+        Statistics and metadata of the job: original_size, size (upright),
+        mode (of the upload), orientation (EXIF value that was applied),
+        peak_memory (estimated bytes of pixel buffers held at the same time)
+        and placeholder (data URI, see placeholder_data_uri()); for
+        animations also frame_count and duration (milliseconds)
+    """
+    with Image.open(file_path) as source_img:
+        if is_animated(source_img):
+            return ingest_animation(source_img, webp_path, thumb_path, quality, max_pixels)
+
+        original_size = source_img.size
+        mode = source_img.mode
+        orientation = source_img.getexif().get(EXIF_ORIENTATION, 1)
+        target_size = ingest_target_size(original_size, max_pixels)
+        if target_size != original_size and source_img.format == 'JPEG':
+            # Decode at 1/2, 1/4 or 1/8 scale, the smallest that is still >= target_size
+            source_img.draft('RGB', target_size)
+
+        with decode_budget.reserve(source_img.size[0] * source_img.size[1], foreground=False):
+            img = source_img
+            try:
+                img.load()
+                peak_memory = image_bytes(img)
+
+                if img.size[0] > target_size[0] or img.size[1] > target_size[1]:
+                    resized_img = img.resize(target_size, Image.BILINEAR, reducing_gap=2.0)
+                    peak_memory = max(peak_memory, image_bytes(img) + image_bytes(resized_img))
+                    img.close()
+                    img = resized_img
+
+                if orientation in ORIENTATION_TRANSPOSE:
+                    upright_img = img.transpose(ORIENTATION_TRANSPOSE[orientation])
+                    peak_memory = max(peak_memory, image_bytes(img) + image_bytes(upright_img))
+                    img.close()
+                    img = upright_img
+
+                flat_bytes = image_bytes(img)
+                flat_img = flatten_transparency(img)
+                if flat_img is not img:
+                    peak_memory = max(peak_memory, flat_bytes + image_bytes(flat_img))
+                img = flat_img
+
+                pixels = img.size[0] * img.size[1]
+                method = 6 if pixels <= WEBP_METHOD6_MAX_PIXELS else 4
+                img.save(webp_path, format="WebP", quality=quality, method=method)
+                size = img.size
+
+                # Thumbnail in place; the stored image is not needed anymore
+                img.thumbnail(THUMBNAIL_SIZE, Image.BILINEAR)
+                img.save(thumb_path, format="WebP", quality=quality, method=6)
+                placeholder = placeholder_data_uri(img)
+            finally:
+                img.close()
+
+    return {'original_size': original_size, 'size': size, 'mode': mode, 'orientation': orientation,
+            'peak_memory': peak_memory, 'placeholder': placeholder}
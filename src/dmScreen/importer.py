@@ -0,0 +1,183 @@
+"""
+Bulk import of images from a local directory for dmScreen.
+
+A directory on the server, e.g. a mounted USB stick, is scanned and its
+folder structure is mirrored into dmScreen folders. Files are copied into the
+upload folder while they are hashed and handed to the image processing pool
+one by one; the import waits while the processing queue is full, so it never
+gets far ahead of the workers. Files whose content was already imported into
+the same folder are skipped, so an import can be repeated after new files
+were added to the stick.
+"""
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Callable, Optional
+
+from dmScreen.uploads import save_stream
+
+# Directories the import endpoint may read from (the command line flag is not restricted)
+IMPORT_ROOTS = [p for p in os.getenv('DM_IMPORT_ROOTS', os.pathsep.join(['/media', '/mnt', '/run/media'])).split(os.pathsep) if p]
+# The import waits while this many images are waiting for processing
+MAX_QUEUED = int(os.getenv('DM_IMPORT_MAX_QUEUED', '4'))
+
+
+def is_importable_path(path: str) -> bool:
+    """Return True if path lies within one of the IMPORT_ROOTS."""
+    real_path = os.path.realpath(path)
+    for root in IMPORT_ROOTS:
+        real_root = os.path.realpath(root)
+        if real_path == real_root or real_path.startswith(real_root.rstrip(os.sep) + os.sep):
+            return True
+    return False
+
+
+class DirectoryImport:
+    """Runs one directory import at a time in a background thread and tracks its progress."""
+
+    def __init__(self, db, register: Callable, queue_size: Callable[[], int], staging_folder: str,
+                 allowed_file: Callable[[str], bool], on_change: Optional[Callable] = None):
+        """
+        Args:
+            db: Database instance
+            register: register_upload(received_path, filename, content_hash, name, folder_id, quality)
+            queue_size: Returns the number of jobs waiting for the processing pool
+            staging_folder: Folder (on the upload file system) files are copied to before registration
+            allowed_file: Returns True for filenames with a supported image extension
+            on_change: Called when folders or images were added
+        """
+        self.db = db
+        self.register = register
+        self.queue_size = queue_size
+        self.staging_folder = staging_folder
+        self.allowed_file = allowed_file
+        self.on_change = on_change
+        self.lock = threading.Lock()
+        self.thread = None
+        self.state = {'state': 'idle'}
+
+    def is_running(self) -> bool:
+        return self.state.get('state') == 'running'
+
+    def status(self) -> dict:
+        with self.lock:
+            return dict(self.state)
+
+    def start(self, source: str, folder_id: Optional[str] = None) -> dict:
+        """
+        Start importing source into folder_id in the background.
+
+        Raises:
+            ValueError: If source is not a directory or an import is already running
+        """
+        if not os.path.isdir(source):
+            raise ValueError(f"Not a directory: {source}")
+        with self.lock:
+            if self.is_running():
+                raise ValueError('An import is already running')
+            self.state = {
+                'state': 'running',
+                'source': source,
+                'folder': folder_id,
+                'found': 0,
+                'imported': 0,
+                'skipped': 0,
+                'errors': 0,
+                'folders_created': 0,
+                'current': None,
+                'started_at': time.time(),
+                'finished_at': None
+            }
+        self.thread = threading.Thread(target=self.run, args=(source, folder_id), name="DirectoryImport", daemon=True)
+        self.thread.start()
+        return self.status()
+
+    def _update(self, **changes):
+        with self.lock:
+            for key, value in changes.items():
+                if key in ('found', 'imported', 'skipped', 'errors', 'folders_created'):
+                    self.state[key] += value
+                else:
+                    self.state[key] = value
+
+    def _folder_for(self, name: str, parent_id: Optional[str]) -> str:
+        """Return the id of the folder called name in parent_id, creating it if needed."""
+        for folder in self.db.get_database()['folders']:
+            if folder['name'] == name and folder.get('parent') == parent_id:
+                return folder['id']
+        folder_data = {
+            'id': str(uuid.uuid4()),
+            'name': name,
+            'parent': parent_id,
+            'created_at': datetime.now().isoformat()
+        }
+        result = self.db.createFolder(folder_data)
+        if isinstance(result, tuple):
+            raise ValueError(result[0].get('error', 'Could not create folder'))
+        self._update(folders_created=1)
+        if self.on_change:
+            self.on_change()
+        return folder_data['id']
+
+    def _wait_for_queue(self):
+        """Backpressure: wait while the processing pool has enough work queued."""
+        while self.queue_size() >= MAX_QUEUED:
+            time.sleep(0.2)
+
+    def run(self, source: str, folder_id: Optional[str]):
+        """Import all images below source; runs in the import thread."""
+        folder_ids = {'.': folder_id}
+        try:
+            for dirpath, dirnames, filenames in os.walk(source):
+                # Hidden directories (.Trashes, .thumbnails, ...) are not imported
+                dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+                rel_dir = os.path.relpath(dirpath, source)
+                if rel_dir not in folder_ids:
+                    parent_rel = os.path.dirname(rel_dir) or '.'
+                    folder_ids[rel_dir] = self._folder_for(os.path.basename(rel_dir), folder_ids[parent_rel])
+                target_folder = folder_ids[rel_dir]
+
+                for filename in sorted(filenames):
+                    if filename.startswith('.') or not self.allowed_file(filename):
+                        continue
+                    self._update(found=1, current=os.path.join(rel_dir, filename))
+                    try:
+                        self._import_file(os.path.join(dirpath, filename), filename, target_folder)
+                    except Exception as e:
+                        print(f"Error importing {os.path.join(dirpath, filename)}: {e}")
+                        self._update(errors=1)
+            self._update(state='finished', current=None, finished_at=time.time())
+        except Exception as e:
+            print(f"Import of {source} failed: {e}")
+            self._update(state='failed', error=str(e), current=None, finished_at=time.time())
+        if self.on_change:
+            self.on_change()
+        status = self.status()
+        print(f"Import of {source} {status['state']}: {status['imported']} imported, "
+              f"{status['skipped']} skipped, {status['errors']} errors")
+
+    def _import_file(self, file_path: str, filename: str, folder_id: Optional[str]):
+        self._wait_for_queue()
+
+        # Copy while hashing: the source is read exactly once
+        received_path = os.path.join(self.staging_folder, f"{uuid.uuid4().hex}.import")
+        try:
+            with open(file_path, 'rb') as f:
+                content_hash = save_stream(f, received_path)
+
+            already_imported = any(img.get('parent') == folder_id
+                                   for img in self.db.get_images_by_content_hash(content_hash))
+            if already_imported:
+                os.remove(received_path)
+                self._update(skipped=1)
+                return
+
+            quality = self.db.get_setting('image_quality', 85)
+            self.register(received_path, filename, content_hash, os.path.splitext(filename)[0], folder_id, quality)
+            self._update(imported=1)
+        except Exception:
+            if os.path.exists(received_path):
+                os.remove(received_path)
+            raise
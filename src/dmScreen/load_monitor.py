@@ -0,0 +1,142 @@
+"""
+Load monitoring for dmScreen.
+
+This module tracks in-flight HTTP requests and foreground renders and samples
+the system load (CPU count, load average, free memory), so the background
+worker pools can scale the number of active workers between a minimum and a
+maximum instead of using a fixed count.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+# Below this much available memory, pools drop to their minimum worker count
+MIN_FREE_MEMORY_MB = int(os.getenv('DM_MIN_FREE_MEMORY_MB', '150'))
+# How long a load sample is reused before the system is queried again
+SAMPLE_TTL = 2.0
+
+_lock = threading.Lock()
+_inflight_requests = 0
+_foreground_renders = 0
+last_request_time = time.time()  # Time the most recent HTTP request started
+
+_sample_lock = threading.Lock()
+_sample = None  # (load_average, free_memory_mb)
+_sample_ts = 0.0
+
+
+def request_started():
+    """Register the start of an HTTP request."""
+    global _inflight_requests, last_request_time
+    with _lock:
+        _inflight_requests += 1
+        last_request_time = time.time()
+
+
+def request_finished():
+    """Register the end of an HTTP request."""
+    global _inflight_requests
+    with _lock:
+        _inflight_requests = max(0, _inflight_requests - 1)
+
+
+def inflight_requests() -> int:
+    """Return the number of HTTP requests currently being handled."""
+    return _inflight_requests
+
+
+@contextmanager
+def foreground_render():
+    """Mark a render that a client is waiting for; background warming pauses meanwhile."""
+    global _foreground_renders
+    with _lock:
+        _foreground_renders += 1
+    try:
+        yield
+    finally:
+        with _lock:
+            _foreground_renders -= 1
+
+
+def background_paused() -> bool:
+    """Return True while foreground renders are queued or running."""
+    return _foreground_renders > 0
+
+
+def cpu_count() -> int:
+    """Return the number of CPUs this process may run on."""
+    try:
+        return len(os.sched_getaffinity(0)) or 1
+    except (AttributeError, OSError):
+        return os.cpu_count() or 1
+
+
+def load_average() -> Optional[float]:
+    """Return the 1-minute load average, or None if unavailable."""
+    try:
+        return os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return None
+
+
+def free_memory_mb() -> Optional[float]:
+    """Return the available memory in MB from /proc/meminfo, or None if unavailable."""
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Return the peak resident memory of this process in MB from /proc/self/status, or None if unavailable."""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _system_sample():
+    """Return a (load_average, free_memory_mb) sample, refreshed at most every SAMPLE_TTL seconds."""
+    global _sample, _sample_ts
+    with _sample_lock:
+        now = time.time()
+        if _sample is None or now - _sample_ts > SAMPLE_TTL:
+            _sample = (load_average(), free_memory_mb())
+            _sample_ts = now
+        return _sample
+
+
+def recommended_workers(min_workers: int, max_workers: int) -> int:
+    """
+    Return how many workers of a pool should currently be active.
+
+    Starts from the CPU count and subtracts the current load average and the
+    number of in-flight requests, so background work backs off while the
+    server is busy. Low free memory drops the pool to its minimum.
+
+    Args:
+        min_workers: Lower bound for the result
+        max_workers: Upper bound for the result
+    """
+    load, free_mb = _system_sample()
+
+    if free_mb is not None and free_mb < MIN_FREE_MEMORY_MB:
+        return min_workers
+
+    cpus = cpu_count()
+    target = cpus
+    if load is not None:
+        target = min(target, int(cpus - load + 0.5))
+    target -= inflight_requests()
+
+    return max(min_workers, min(max_workers, target))
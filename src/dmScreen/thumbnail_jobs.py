@@ -0,0 +1,134 @@
+"""
+Thumbnail regeneration as a background job for dmScreen.
+
+A regeneration run is planned in the request that starts it and then carried
+out image by image by the image processing workers. Its progress is kept in
+a small JSON state file, so a run that was interrupted by a restart is
+continued where it stopped, and clients can follow it through a long-polling
+status endpoint.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from typing import List, Optional
+
+# Minimum seconds between writes of the state file while a run progresses
+SAVE_INTERVAL = 1.0
+
+
+def thumbnail_signature(file_path: str, quality: int) -> str:
+    """Return a signature of a thumbnail's inputs; it changes when the source file or the quality changes."""
+    stat = os.stat(file_path)
+    return f"{int(stat.st_mtime)}-{stat.st_size}-{quality}"
+
+
+class ThumbnailRegeneration:
+    """State of the current (or last) thumbnail regeneration run, persisted to a JSON file."""
+
+    def __init__(self, state_file: str):
+        self.state_file = state_file
+        self.condition = threading.Condition()
+        self._last_save = 0.0
+        self._run_started = None  # Time the current process started (or resumed) the run, for the ETA
+        self._done_at_start = 0
+        self.state = self._load()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.state_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'state': 'idle'}
+
+    def _save(self, force: bool = False):
+        now = time.time()
+        if not force and now - self._last_save < SAVE_INTERVAL:
+            return
+        self._last_save = now
+        tmp_path = f"{self.state_file}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.state_file)
+
+    def start(self, paths: List[str], quality: int, full: bool, skipped: int) -> dict:
+        """
+        Start a new run over the given image paths, replacing any previous run.
+
+        Args:
+            paths: Image paths whose thumbnails are regenerated
+            quality: WebP quality for the whole run
+            full: Whether all thumbnails are regenerated (and the cache was cleared)
+            skipped: Number of images whose thumbnails were up to date
+
+        Returns:
+            The new state
+        """
+        with self.condition:
+            self.state = {
+                'state': 'running' if paths else 'finished',
+                'run_id': uuid.uuid4().hex,
+                'quality': quality,
+                'full': full,
+                'total': len(paths),
+                'done': 0,
+                'errors': 0,
+                'skipped': skipped,
+                'started_at': time.time(),
+                'finished_at': None if paths else time.time(),
+                'pending': list(paths)
+            }
+            self._run_started = time.time()
+            self._done_at_start = 0
+            self._save(force=True)
+            self.condition.notify_all()
+            return self.status()
+
+    def resume(self) -> Optional[dict]:
+        """Return the state of an unfinished run to re-enqueue its pending paths, or None."""
+        with self.condition:
+            if self.state.get('state') != 'running':
+                return None
+            self._run_started = time.time()
+            self._done_at_start = self.state['done']
+            return dict(self.state, pending=list(self.state['pending']))
+
+    def is_current(self, run_id: str) -> bool:
+        """Return True if run_id belongs to the run in progress."""
+        return self.state.get('state') == 'running' and self.state.get('run_id') == run_id
+
+    def item_done(self, run_id: str, path: str, error: bool = False):
+        """Record that the thumbnail of path was regenerated (or failed)."""
+        with self.condition:
+            if not self.is_current(run_id) or path not in self.state['pending']:
+                return
+            self.state['pending'].remove(path)
+            self.state['done'] += 1
+            if error:
+                self.state['errors'] += 1
+            finished = not self.state['pending']
+            if finished:
+                self.state['state'] = 'finished'
+                self.state['finished_at'] = time.time()
+            self._save(force=finished)
+            self.condition.notify_all()
+
+    def status(self) -> dict:
+        """Return the progress of the run with an ETA in seconds (None if unknown)."""
+        with self.condition:
+            status = {k: v for k, v in self.state.items() if k != 'pending'}
+            status['eta_seconds'] = None
+            if status.get('state') == 'running' and self._run_started is not None:
+                done_here = status['done'] - self._done_at_start
+                if done_here > 0:
+                    per_item = (time.time() - self._run_started) / done_here
+                    status['eta_seconds'] = round(per_item * (status['total'] - status['done']), 1)
+            return status
+
+    def wait_for_change(self, known_done: int, timeout: float = 30.0) -> dict:
+        """Long poll: wait until the number of finished images differs from known_done, then return the status."""
+        with self.condition:
+            if self.state.get('state') == 'running' and self.state.get('done') == known_done:
+                self.condition.wait(timeout)
+            return self.status()
@@ -0,0 +1,240 @@
+"""
+Resumable chunked uploads for dmScreen.
+
+An upload session is created with the file's name and size, the client then
+PUTs the file in chunks at explicit byte offsets, and finally asks the server
+to finalize it. Chunks are streamed straight into a partial file inside the
+upload folder, so nothing is spooled in memory or temporary files and an
+interrupted transfer can continue from the last received byte, even after a
+server restart.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Optional
+
+# Block size used when streaming request bodies to disk
+STREAM_BLOCK_SIZE = 1024 * 1024
+# Chunk size suggested to clients
+CHUNK_SIZE = 4 * 1024 * 1024
+# Unfinished sessions older than this are removed
+SESSION_MAX_AGE = 24 * 3600
+
+
+class UploadError(Exception):
+    """Raised for invalid upload requests; carries the HTTP status code."""
+
+    def __init__(self, message: str, status: int = 400, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+class UploadSessions:
+    """Stores upload sessions as <id>.part/<id>.json file pairs in a partial folder."""
+
+    def __init__(self, partial_folder: str):
+        self.partial_folder = partial_folder
+        self.lock = threading.Lock()
+        # One lock per session, so slow chunks of one upload don't block the others
+        self._session_locks = {}
+        # Running hash per session while chunks arrive in order: id -> (offset, sha256)
+        self._hashers = {}
+        os.makedirs(partial_folder, exist_ok=True)
+
+    def _meta_path(self, upload_id: str) -> str:
+        return os.path.join(self.partial_folder, f"{upload_id}.json")
+
+    def part_path(self, upload_id: str) -> str:
+        """Return the path of the partial file of a session."""
+        return os.path.join(self.partial_folder, f"{upload_id}.part")
+
+    def _session_lock(self, upload_id: str) -> threading.Lock:
+        """Return the lock of an existing session; unknown ids raise UploadError (404) and get no lock.
+
+        Sessions are ended by removing their files before their lock, so a
+        lock is never created again for a session that is gone.
+        """
+        # Session ids are generated hex strings; reject anything else before touching the disk
+        if not upload_id.isalnum():
+            raise UploadError('Upload not found', 404)
+        with self.lock:
+            if not os.path.exists(self._meta_path(upload_id)):
+                raise UploadError('Upload not found', 404)
+            return self._session_locks.setdefault(upload_id, threading.Lock())
+
+    def _save_meta(self, meta: dict):
+        with open(self._meta_path(meta['id']), 'w') as f:
+            json.dump(meta, f)
+
+    def create(self, filename: str, size: int, name: Optional[str] = None, folder: Optional[str] = None,
+               sha256: Optional[str] = None) -> dict:
+        """Create a new upload session and return its metadata."""
+        self.cleanup()
+        meta = {
+            'id': uuid.uuid4().hex,
+            'filename': filename,
+            'size': int(size),
+            'name': name,
+            'folder': folder,
+            'sha256': sha256.lower() if sha256 else None,
+            'created_at': time.time()
+        }
+        open(self.part_path(meta['id']), 'wb').close()
+        self._save_meta(meta)
+        self._hashers[meta['id']] = (0, hashlib.sha256())
+        return meta
+
+    def get(self, upload_id: str) -> dict:
+        """Return session metadata including the number of bytes received so far."""
+        # Session ids are generated hex strings; reject anything else before touching the disk
+        if not upload_id.isalnum():
+            raise UploadError('Upload not found', 404)
+        try:
+            with open(self._meta_path(upload_id), 'r') as f:
+                meta = json.load(f)
+            meta['offset'] = os.path.getsize(self.part_path(upload_id))
+        except (OSError, ValueError):
+            raise UploadError('Upload not found', 404)
+        return meta
+
+    def write_chunk(self, upload_id: str, offset: int, stream) -> int:
+        """
+        Stream a chunk into the partial file at the given offset.
+
+        A chunk may start at or before the current end of the file (a resent
+        chunk overwrites what was there); gaps are rejected with 409 and the
+        current offset so the client can resume from there.
+
+        Returns:
+            The new number of bytes received
+        """
+        with self._session_lock(upload_id):
+            meta = self.get(upload_id)
+            if offset < 0 or offset > meta['offset']:
+                raise UploadError('Offset does not match received data', 409, offset=meta['offset'])
+
+            # Taken out while writing, so an interrupted chunk never leaves a stale hash behind
+            hasher = self._hashers.pop(upload_id, None)
+            if hasher is None or hasher[0] != offset:
+                # Out-of-order write (resume, retry or restart): hash the file at finalize instead
+                hasher = None
+
+            part_path = self.part_path(upload_id)
+            with open(part_path, 'r+b') as f:
+                f.seek(offset)
+                f.truncate()
+                written = 0
+                while True:
+                    block = stream.read(STREAM_BLOCK_SIZE)
+                    if not block:
+                        break
+                    if offset + written + len(block) > meta['size']:
+                        f.truncate(offset + written)
+                        raise UploadError('Chunk exceeds declared file size', 413, offset=offset + written)
+                    f.write(block)
+                    if hasher is not None:
+                        hasher[1].update(block)
+                    written += len(block)
+
+            new_offset = offset + written
+            if hasher is not None:
+                self._hashers[upload_id] = (new_offset, hasher[1])
+            return new_offset
+
+    def finalize(self, upload_id: str, destination: str, sha256: Optional[str] = None) -> dict:
+        """
+        Verify a completed upload, move it to destination and end the session.
+
+        The file is moved and the session removed under the session's lock, so a
+        repeated finalize of the same upload fails with 404 instead of finding
+        half a session.
+
+        Args:
+            upload_id: Id of the session
+            destination: Path the received file is moved to
+            sha256: Expected SHA-256 of the content (the one given at create() if None)
+
+        Returns:
+            The session metadata with the 'sha256' of the content
+        """
+        with self._session_lock(upload_id):
+            meta = self.get(upload_id)
+            if meta['offset'] != meta['size']:
+                raise UploadError('Upload incomplete', 409, offset=meta['offset'])
+
+            hasher = self._hashers.pop(upload_id, None)
+            if hasher is not None and hasher[0] == meta['size']:
+                digest = hasher[1].hexdigest()
+            else:
+                digest = file_sha256(self.part_path(upload_id))
+
+            expected = (sha256 or meta.get('sha256') or '').lower()
+            if expected and expected != digest:
+                # Start over; the received data is corrupt
+                open(self.part_path(upload_id), 'wb').close()
+                self._hashers[upload_id] = (0, hashlib.sha256())
+                raise UploadError('Content hash mismatch', 422, offset=0)
+
+            meta['sha256'] = digest
+            os.replace(self.part_path(upload_id), destination)
+            try:
+                os.remove(self._meta_path(upload_id))
+            except OSError:
+                pass
+        with self.lock:
+            self._session_locks.pop(upload_id, None)
+        return meta
+
+    def discard(self, upload_id: str):
+        """Remove a session and its partial file; unknown sessions are ignored."""
+        try:
+            session_lock = self._session_lock(upload_id)
+        except UploadError:
+            return
+        with session_lock:
+            self._hashers.pop(upload_id, None)
+            for path in (self.part_path(upload_id), self._meta_path(upload_id)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        with self.lock:
+            self._session_locks.pop(upload_id, None)
+
+    def cleanup(self, max_age: float = SESSION_MAX_AGE):
+        """Remove sessions that were not finished within max_age seconds."""
+        now = time.time()
+        try:
+            for filename in os.listdir(self.partial_folder):
+                if not filename.endswith('.json'):
+                    continue
+                upload_id = filename[:-5]
+                paths = [self._meta_path(upload_id), self.part_path(upload_id)]
+                last_activity = max(os.path.getmtime(p) for p in paths if os.path.exists(p))
+                if now - last_activity > max_age:
+                    self.discard(upload_id)
+        except OSError as e:
+            print(f"Error cleaning up upload sessions: {e}")
+
+
+def save_stream(stream, file_path: str) -> str:
+    """Stream a file-like object to file_path and return the SHA-256 of its content."""
+    hasher = hashlib.sha256()
+    with open(file_path, 'wb') as f:
+        for block in iter(lambda: stream.read(STREAM_BLOCK_SIZE), b''):
+            f.write(block)
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def file_sha256(file_path: str) -> str:
+    """Return the SHA-256 hex digest of a file."""
+    hasher = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(STREAM_BLOCK_SIZE), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
@@ -42,13 +42,17 @@ def _dbg(msg: str):
 
 change_callback = None
 
-# Cache for throttling system checks
+# Cache for throttling system checks: results of read-only queries (see run_cmd)
 _WIFI_CACHE_TTL = float(os.getenv('DM_WIFI_CACHE_TTL', '5'))  # seconds
 _wifi_cache_lock = Lock()
-_cached_ssid = None
-_cached_ssid_ts = 0.0
-_cached_adhoc = None  # bool or None
-_cached_adhoc_ts = 0.0
+_cmd_cache = {}  # (args, shell) -> (expiry time, CompletedProcess)
+_cmd_metrics = {}  # Command name -> counters, see command_metrics()
+
+# Commands are killed after these many seconds: queries and quick changes, and connecting, hotspot and scans
+_CMD_TIMEOUT = float(os.getenv('DM_WIFI_CMD_TIMEOUT', '10'))
+_CMD_LONG_TIMEOUT = float(os.getenv('DM_WIFI_CMD_LONG_TIMEOUT', '60'))
+# Commands running at the same time
+_cmd_slots = threading.BoundedSemaphore(int(os.getenv('DM_WIFI_CMD_CONCURRENCY', '2')))
 
 # Polling configuration for connection attempts
 _WIFI_POLL_INTERVAL = float(os.getenv('DM_WIFI_POLL_INTERVAL', '5'))  # seconds
@@ -57,6 +61,29 @@ _WIFI_POLL_TRIES = int(os.getenv('DM_WIFI_POLL_TRIES', '10'))
 # Control whether we temporarily pause AP to perform scans (helps when interface is busy)
 _WIFI_SCAN_PAUSE_AP = not (os.getenv('DM_WIFI_SCAN_PAUSE_AP', '0').lower() in ('0', 'false', 'no', 'off', ''))
 
+# Event-driven monitor: configuration changes wake it at once, the interval is only a safety net
+_WIFI_RECONCILE_INTERVAL = float(os.getenv('DM_WIFI_RECONCILE_INTERVAL', '60'))  # seconds
+# While not connected to the target network, connecting is retried this often
+_WIFI_RETRY_INTERVAL = float(os.getenv('DM_WIFI_RETRY_INTERVAL', '10'))  # seconds
+# Seconds to wait for NetworkManager to report the device connected after an activation
+_WIFI_ACTIVATION_TIMEOUT = float(os.getenv('DM_WIFI_ACTIVATION_TIMEOUT', '15'))
+_monitor_wakeup = threading.Event()
+
+# Device state as reported by `nmcli monitor`
+_device_state = None
+_device_connection = None  # Profile the device was last activated with ('using connection')
+_device_activations = 0  # Number of times the device was reported connected
+_device_state_cv = threading.Condition()
+_nm_monitor_running = False
+state_callback = None  # Called on every NetworkManager change
+
+# Stand-in for NetworkManager on machines without nmcli or WiFi (see wifi_fake.py)
+_WIFI_FAKE = not (os.getenv('DM_WIFI_FAKE', '0').lower() in ('0', 'false', 'no', 'off', ''))
+fake_network_manager = None
+if _WIFI_FAKE:
+    from dmScreen.wifi_fake import FakeNetworkManager
+    fake_network_manager = FakeNetworkManager(IFACE)
+
 target_wifi = None
 current_wifi = None
 
@@ -69,7 +96,7 @@ def get_lan_ip():
     """Get IP address of wlan0 interface using nmcli or fallback to ifconfig"""
     try:
         # Try nmcli first
-        p = run_cmd(['nmcli', '-t', '-f', 'IP4.ADDRESS', 'dev', 'show', 'wlan0'])
+        p = run_cmd(['nmcli', '-t', '-f', 'IP4.ADDRESS', 'dev', 'show', 'wlan0'], cache_ttl=_WIFI_CACHE_TTL)
         if p.returncode == 0 and p.stdout:
             # Output format: IP4.ADDRESS[1]:192.168.1.100/24
             for line in p.stdout.strip().split('\n'):
@@ -79,7 +106,8 @@ def get_lan_ip():
                         return ip
         
         # Fallback to ifconfig
-        p = run_cmd("ifconfig | grep -A 1 wlan0 | grep -o 'inet [0-9]*\.[0-9]*\.[0-9]*\.[0-9]*' | grep -o '[0-9]*\.[0-9]*\.[0-9]*\.[0-9]*' | head -n 1", shell=True)
+        p = run_cmd("ifconfig | grep -A 1 wlan0 | grep -o 'inet [0-9]*\.[0-9]*\.[0-9]*\.[0-9]*' | grep -o '[0-9]*\.[0-9]*\.[0-9]*\.[0-9]*' | head -n 1", shell=True,
+                cache_ttl=_WIFI_CACHE_TTL)
         if p.returncode == 0 and p.stdout.strip():
             return p.stdout.strip()
     except Exception as e:
@@ -89,11 +117,17 @@ def get_lan_ip():
 def set_target_wifi(ssid: str):
     global target_wifi
     target_wifi = ssid
+    _monitor_wakeup.set()
 
 def set_change_callback(cb):
     global change_callback
     change_callback = cb
 
+def set_state_callback(cb):
+    """Call cb (from the monitor thread) whenever NetworkManager reports a change."""
+    global state_callback
+    state_callback = cb
+
 def _load_known_networks():
     try:
         with _os_lock:
@@ -137,7 +171,7 @@ def list_known_networks():
     networks = []
     try:
         # Try to get WiFi connections from nmcli
-        res = run_cmd(['nmcli', '-t', '-f', 'NAME,TYPE', 'connection', 'show'])
+        res = run_cmd(['nmcli', '-t', '-f', 'NAME,TYPE', 'connection', 'show'], cache_ttl=_WIFI_CACHE_TTL)
         if res.returncode == 0 and res.stdout:
             _dbg("Lese bekannte Netzwerke aus nmcli...")
             for line in res.stdout.strip().split('\n'):
@@ -180,19 +214,114 @@ def remove_known_network(ssid):
 # WiFi/OS utilities
 # -----------------------------
 
-def run_cmd(args, check=False, shell=False):
-    """Run a system command and return CompletedProcess. Adds detailed debug logging.
-    - Redacts secrets from args (password/psk/passphrase)
-    - Logs duration, rc, and trimmed outputs.
+def _command_name(args, shell=False):
+    """Return the name commands are counted under, e.g. 'nmcli connection show' (without SSIDs or passwords)."""
+    if shell or isinstance(args, str):
+        words = str(args).split()
+        words = words[1:] if words[:1] == ['sudo'] else words
+        return words[0] if words else ''
+    words = [a for a in args if not a.startswith('-')]
+    words = words[1:] if words[:1] == ['sudo'] else words
+    if words[:1] != ['nmcli']:
+        return words[0] if words else ''
+    # Option values (-f NAME,TYPE) are upper case; verbs are lower case
+    verbs = [w for w in words[1:] if w.islower()]
+    depth = 3 if verbs[:2] in (['device', 'wifi'], ['dev', 'wifi']) else 2
+    return ' '.join(['nmcli'] + verbs[:depth])
+
+def _redact(args):
+    """Return the command as text with passwords replaced by ****."""
+    if isinstance(args, str):
+        return args
+    words = list(args)
+    for i, word in enumerate(words[:-1]):
+        if word in ('password', 'psk', 'wifi-sec.psk', 'passphrase'):
+            words[i + 1] = '****'
+    return ' '.join(words)
+
+def _record_command(name, duration_ms, returncode=0, cache_hit=False, timed_out=False):
+    with _wifi_cache_lock:
+        m = _cmd_metrics.setdefault(name, {'runs': 0, 'cache_hits': 0, 'failures': 0, 'timeouts': 0,
+                                           'total_ms': 0.0, 'max_ms': 0.0})
+        if cache_hit:
+            m['cache_hits'] += 1
+            return
+        m['runs'] += 1
+        m['total_ms'] += duration_ms
+        m['max_ms'] = max(m['max_ms'], duration_ms)
+        if returncode != 0:
+            m['failures'] += 1
+        if timed_out:
+            m['timeouts'] += 1
+
+def command_metrics():
+    """Return per-command counters: runs, cache hits, failures, timeouts and latency (ms)."""
+    with _wifi_cache_lock:
+        return {name: dict(m, avg_ms=round(m['total_ms'] / m['runs'], 1) if m['runs'] else None,
+                           total_ms=round(m['total_ms'], 1), max_ms=round(m['max_ms'], 1))
+                for name, m in _cmd_metrics.items()}
+
+def clear_command_cache():
+    """Forget cached query results, e.g. after the network configuration changed."""
+    with _wifi_cache_lock:
+        _cmd_cache.clear()
+
+def run_cmd(args, check=False, shell=False, timeout=None, cache_ttl=0):
+    """Run a system command and return CompletedProcess.
+
+    At most DM_WIFI_CMD_CONCURRENCY commands run at a time; a command that
+    does not finish (or get a slot) within timeout is killed and returns
+    code 124. Durations are counted per command (command_metrics()), and
+    failures are logged with passwords redacted.
+
+    Args:
+        args: Argument list, or a command line with shell=True
+        check: Raise CalledProcessError on a non-zero exit status (logged and returned as code 1)
+        shell: Run args through the shell
+        timeout: Seconds (default DM_WIFI_CMD_TIMEOUT)
+        cache_ttl: For read-only queries: seconds a successful result is reused. Every
+            other command clears the cache, as it may change what the queries return.
     """
-    start = time.time()
+    timeout = _CMD_TIMEOUT if timeout is None else timeout
+    name = _command_name(args, shell)
+    key = (args if isinstance(args, str) else tuple(args), shell)
+    if cache_ttl > 0:
+        with _wifi_cache_lock:
+            cached = _cmd_cache.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            _record_command(name, 0, cache_hit=True)
+            return cached[1]
+    else:
+        clear_command_cache()
+
+    start = time.monotonic()
+    if not _cmd_slots.acquire(timeout=timeout):
+        _dbg(f"CMD kein freier Slot nach {timeout:g}s: {_redact(args)}")
+        _record_command(name, (time.monotonic() - start) * 1000, 124, timed_out=True)
+        return subprocess.CompletedProcess(args=args, returncode=124, stdout='', stderr='too many commands running')
+    timed_out = False
     try:
-        res = subprocess.run(args, capture_output=True, text=True, check=check, shell=shell)
-        return res
+        if fake_network_manager is not None:
+            res = fake_network_manager.run(args, shell=shell)
+        else:
+            res = subprocess.run(args, capture_output=True, text=True, check=check, shell=shell,
+                                 timeout=max(0.1, timeout - (time.monotonic() - start)))
+    except subprocess.TimeoutExpired:
+        timed_out = True
+        _dbg(f"CMD Zeitüberschreitung nach {timeout:g}s: {_redact(args)}")
+        res = subprocess.CompletedProcess(args=args, returncode=124, stdout='', stderr=f'timed out after {timeout:g}s')
     except Exception as e:
-        duration = int((time.time() - start) * 1000)
-        _dbg(f"CMD Ausnahme nach {duration} ms: {type(e).__name__}: {e}")
-        return subprocess.CompletedProcess(args=args, returncode=1, stdout='', stderr=str(e))
+        duration = int((time.monotonic() - start) * 1000)
+        _dbg(f"CMD Ausnahme nach {duration} ms: {type(e).__name__}: {e} ({_redact(args)})")
+        res = subprocess.CompletedProcess(args=args, returncode=1, stdout='', stderr=str(e))
+    finally:
+        _cmd_slots.release()
+
+    _record_command(name, (time.monotonic() - start) * 1000, res.returncode, timed_out=timed_out)
+    if cache_ttl > 0 and res.returncode == 0:
+        with _wifi_cache_lock:
+            _cmd_cache[key] = (time.monotonic() + cache_ttl, res)
+    return res
 
 
 
@@ -215,12 +344,13 @@ def _start_ap_services():
         
         # Create hotspot on wlan0
         # nmcli device wifi hotspot ifname wlan0 ssid dmscreen password dmscreen
+        activations = _device_activations
         res = run_cmd(['sudo', 'nmcli', 'device', 'wifi', 'hotspot', 
-                      'ifname', 'wlan0', 'ssid', ssid, 'password', password])
+                      'ifname', 'wlan0', 'ssid', ssid, 'password', password], timeout=_CMD_LONG_TIMEOUT)
         
         if res.returncode == 0:
             _dbg(f"AP erfolgreich gestartet: SSID='{ssid}'")
-            time.sleep(2)  # Give it time to stabilize
+            _wait_for_activation(activations, fallback=2)
             return True
         else:
             _dbg(f"AP-Start fehlgeschlagen: {res.stderr}")
@@ -246,7 +376,7 @@ def _forget_network_everywhere(ssid: str):
             return False
         
         # Get all connections with this SSID
-        res = run_cmd(['nmcli', '-t', '-f', 'NAME,TYPE', 'connection', 'show'])
+        res = run_cmd(['nmcli', '-t', '-f', 'NAME,TYPE', 'connection', 'show'], cache_ttl=_WIFI_CACHE_TTL)
         if res.returncode == 0 and res.stdout:
             for line in res.stdout.strip().split('\n'):
                 if ':' in line:
@@ -291,12 +421,9 @@ def _scan_visible_ssids():
     
     ssids_local = set()
     try:
-        # Request a fresh scan
-        run_cmd(['sudo', 'nmcli', 'device', 'wifi', 'rescan'], check=False)
-        time.sleep(1)  # Give it time to complete
-        
-        # Get scan results
-        res = run_cmd(['nmcli', '-t', '-f', 'SSID', 'device', 'wifi', 'list'])
+        # Scan and list the results; nmcli returns when the scan is complete
+        res = run_cmd(['sudo', 'nmcli', '-t', '-f', 'SSID', 'device', 'wifi', 'list', '--rescan', 'yes'],
+                      timeout=_CMD_LONG_TIMEOUT)
         if res.returncode == 0 and res.stdout:
             _dbg("Nutze Ergebnisse von 'nmcli device wifi list' ...")
             for line in res.stdout.strip().split('\n'):
@@ -322,6 +449,7 @@ def configure_wifi(ssid, password):
         _dbg(f"Konfiguriere WLAN: gewünschte SSID='{ssid}' ...")
         add_known_network(ssid, password)
         target_wifi = ssid
+        _monitor_wakeup.set()
         return True
     except Exception as e:
         _dbg(f"Error configuring WiFi: {type(e).__name__}: {e}")
@@ -353,27 +481,28 @@ def connect_network():
             _dbg("Stoppe eventuell laufenden Hotspot...")
             run_cmd(['sudo', 'nmcli', 'connection', 'delete', 'Hotspot'], check=False)
             
+            activations = _device_activations
             # Check if connection already exists
-            res_check = run_cmd(['nmcli', '-t', '-f', 'NAME', 'connection', 'show'])
+            res_check = run_cmd(['nmcli', '-t', '-f', 'NAME', 'connection', 'show'], cache_ttl=_WIFI_CACHE_TTL)
             if res_check.returncode == 0 and ssid in res_check.stdout:
                 _dbg(f"Verbindung '{ssid}' existiert bereits, versuche Aktivierung...")
-                res = run_cmd(['sudo', 'nmcli', 'connection', 'up', ssid])
+                res = run_cmd(['sudo', 'nmcli', 'connection', 'up', ssid], timeout=_CMD_LONG_TIMEOUT)
                 # If activation failed (e.g., wrong interface), delete and recreate
                 if res.returncode != 0:
                     _dbg(f"Aktivierung fehlgeschlagen, erstelle Verbindung neu...")
                     run_cmd(['sudo', 'nmcli', 'connection', 'delete', ssid], check=False)
                     res = run_cmd(['sudo', 'nmcli', 'device', 'wifi', 'connect', ssid, 
-                                  'password', password, 'ifname', IFACE])
+                                  'password', password, 'ifname', IFACE], timeout=_CMD_LONG_TIMEOUT)
             else:
                 _dbg(f"Erstelle neue Verbindung für '{ssid}'...")
                 # Connect to WiFi network (creates connection if it doesn't exist)
                 res = run_cmd(['sudo', 'nmcli', 'device', 'wifi', 'connect', ssid, 
-                              'password', password, 'ifname', IFACE])
+                              'password', password, 'ifname', IFACE], timeout=_CMD_LONG_TIMEOUT)
             
             if res.returncode == 0:
                 _dbg(f"Erfolgreich mit '{ssid}' verbunden.")
                 current_wifi = target_wifi
-                time.sleep(2)  # Give it time to get IP
+                _wait_for_activation(activations, fallback=2)
                 return True
             else:
                 _dbg(f"Verbindung fehlgeschlagen: {res.stderr}")
@@ -418,7 +547,6 @@ def disconnect_and_forget_current():
             # Start AP so user can reconnect/configure
             _dbg("Starte AP-Modus nach Disconnect...")
             _start_ap_services()
-            time.sleep(2)
             
             _dbg("Disconnect abgeschlossen.")
             return True, ssid
@@ -486,12 +614,103 @@ def wifi_monitor(ssid=None):
         except Exception as e:
             _dbg(f"WiFi-Monitor Fehler in Hauptschleife: {type(e).__name__}: {e}")
         
-        time.sleep(10)  # Increased from 1 to 10 seconds to reduce CPU load on Raspberry Pi 3B+
+        # Woken at once by configure_wifi()/set_target_wifi() and NetworkManager state changes;
+        # a failed connection is retried soon, otherwise the interval is only a safety net
+        if target_wifi is not None and current_wifi != target_wifi:
+            _monitor_wakeup.wait(_WIFI_RETRY_INTERVAL)
+        else:
+            _monitor_wakeup.wait(_WIFI_RECONCILE_INTERVAL)
+        _monitor_wakeup.clear()
+
+
+
+def _open_nm_monitor():
+    """Start `nmcli monitor` (or the fake's equivalent) and return (lines, close)."""
+    if fake_network_manager is not None:
+        lines = fake_network_manager.monitor()
+        return lines, lines.close
+    proc = subprocess.Popen(['nmcli', 'monitor'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                            text=True, bufsize=1)
+
+    def close():
+        proc.kill()
+        proc.wait()
+    return proc.stdout, close
 
+def _handle_nm_line(line: str):
+    """Take over one line of `nmcli monitor`, e.g. 'wlan0: connected'.
 
+    Connecting and disconnecting of the device update current_wifi and wake
+    the WiFi monitor, so it reacts to a lost or changed connection at once.
+    """
+    global _device_state, _device_activations, _device_connection, current_wifi
+    # Cached query results may be outdated now
+    clear_command_cache()
+    prefix = f"{IFACE}: "
+    if line.startswith(f"{prefix}using connection"):
+        _device_connection = line[len(prefix):].split(' ', 2)[-1].strip("'")
+    elif line.startswith(prefix):
+        state = line[len(prefix):].split(' ', 1)[0]
+        with _device_state_cv:
+            previous = _device_state
+            _device_state = state
+            if state == 'connected':
+                _device_activations += 1
+            _device_state_cv.notify_all()
+        if state != previous and state in ('connected', 'disconnected'):
+            if state == 'disconnected':
+                current_wifi = None
+            elif _device_connection is not None:
+                # Profiles are named after their SSID; the access point is not a WiFi connection
+                current_wifi = None if _device_connection == 'Hotspot' else _device_connection
+            _dbg(f"NetworkManager: {IFACE} {state} -> aktuelles WLAN '{current_wifi}'")
+            _monitor_wakeup.set()
+    if state_callback:
+        try:
+            state_callback()
+        except Exception:
+            pass
+
+def _wait_for_activation(activations: int, fallback: float) -> bool:
+    """Wait until the device was reported connected more often than activations.
+
+    Without a running `nmcli monitor`, sleeps fallback seconds instead.
+    """
+    if not _nm_monitor_running:
+        time.sleep(fallback)
+        return True
+    with _device_state_cv:
+        activated = _device_state_cv.wait_for(lambda: _device_activations > activations, _WIFI_ACTIVATION_TIMEOUT)
+    if not activated:
+        _dbg(f"Kein 'connected' von NetworkManager nach {_WIFI_ACTIVATION_TIMEOUT:g}s")
+    return activated
+
+def nm_monitor():
+    """Background thread following NetworkManager changes; restarts `nmcli monitor` when it ends."""
+    global _nm_monitor_running
+    backoff = 1
+    while True:
+        try:
+            lines, close = _open_nm_monitor()
+        except Exception as e:
+            _dbg(f"nmcli monitor nicht verfügbar: {type(e).__name__}: {e}")
+        else:
+            _nm_monitor_running = True
+            try:
+                for line in lines:
+                    backoff = 1
+                    _handle_nm_line(line.rstrip('\n'))
+            except Exception as e:
+                _dbg(f"nmcli monitor Fehler: {type(e).__name__}: {e}")
+            finally:
+                _nm_monitor_running = False
+                close()
+        time.sleep(backoff)
+        backoff = min(backoff * 2, 60)
 
 def start_wifi_monitor(ssid=None):
     """Start the WiFi monitoring thread"""
     _dbg("Starte WiFi-Monitor-Thread ...")
+    threading.Thread(target=nm_monitor, name="NetworkManagerMonitor", daemon=True).start()
     threading.Thread(target=wifi_monitor, kwargs={'ssid': ssid}, daemon=True).start()
     _dbg("WiFi-Monitor-Thread gestartet.")
\ No newline at end of file
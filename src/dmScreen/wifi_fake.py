@@ -0,0 +1,168 @@
+"""
+Stand-in for NetworkManager, so the WiFi state machine in wifi.py runs on a
+machine without nmcli or a WiFi card (DM_WIFI_FAKE=1).
+
+It answers the nmcli commands wifi.py issues, keeps the connection profiles
+and the active connection in memory, and reports changes as `nmcli monitor`
+lines. Connecting takes DM_WIFI_FAKE_DELAY seconds, like a real association.
+"""
+import os
+import queue
+import subprocess
+import threading
+import time
+from typing import Iterator, List
+
+# Networks in range
+FAKE_SSIDS = [s.strip() for s in os.getenv('DM_WIFI_FAKE_SSIDS', 'FakeNet,Tavern').split(',') if s.strip()]
+# Seconds an activation takes
+FAKE_DELAY = float(os.getenv('DM_WIFI_FAKE_DELAY', '0.5'))
+
+WIRELESS = '802-11-wireless'
+HOTSPOT_ADDRESS = '10.42.0.1/24'  # NetworkManager's default for shared connections
+CLIENT_ADDRESS = '192.168.1.50/24'
+
+
+class FakeNetworkManager:
+    """In-memory NetworkManager with one WiFi device."""
+
+    def __init__(self, iface: str = 'wlan0', ssids: List[str] = None, delay: float = FAKE_DELAY):
+        """
+        Args:
+            iface: Name of the WiFi device
+            ssids: Visible networks; any password of at least 8 characters is accepted
+            delay: Seconds an activation takes
+        """
+        self.iface = iface
+        self.ssids = list(FAKE_SSIDS if ssids is None else ssids)
+        self.delay = delay
+        self.lock = threading.RLock()
+        self.connections = {}  # Profile name -> {'ssid', 'password', 'hotspot'}
+        self.active = None  # Name of the active profile
+        self.subscribers = []
+
+    # -- nmcli --------------------------------------------------------------
+
+    def run(self, args, shell: bool = False) -> subprocess.CompletedProcess:
+        """Answer an nmcli command like subprocess.run(..., capture_output=True, text=True) would."""
+        if shell or isinstance(args, str):
+            # Shell pipelines (ifconfig, rm of profile files) have no effect here
+            return self._result(args, 1, stderr='not available with the fake NetworkManager')
+        argv = list(args)
+        if argv and argv[0] == 'sudo':
+            argv = argv[1:]
+        if not argv or argv[0] != 'nmcli':
+            return self._result(args, 127, stderr=f"{argv[0] if argv else ''}: command not found")
+
+        # Options: -t (terse) and -f <fields>
+        fields = None
+        rest = []
+        i = 1
+        while i < len(argv):
+            if argv[i] == '-t':
+                i += 1
+            elif argv[i] == '-f' and i + 1 < len(argv):
+                fields = argv[i + 1].split(',')
+                i += 2
+            else:
+                rest.append(argv[i])
+                i += 1
+
+        with self.lock:
+            if rest[:2] in (['dev', 'show'], ['device', 'show']):
+                return self._result(args, 0, self._device_show(fields))
+            if rest[:2] in (['connection', 'show'], ['con', 'show']):
+                lines = [':'.join(name if field == 'NAME' else WIRELESS for field in (fields or ['NAME', 'TYPE']))
+                         for name in self.connections]
+                return self._result(args, 0, '\n'.join(lines) + ('\n' if lines else ''))
+            if rest[:2] == ['connection', 'delete'] and len(rest) > 2:
+                return self._delete(args, rest[2])
+            if rest[:2] == ['connection', 'up'] and len(rest) > 2:
+                return self._up(args, rest[2])
+            if rest[:3] == ['device', 'wifi', 'list']:
+                return self._result(args, 0, ''.join(f"{ssid}\n" for ssid in self.ssids))
+            if rest[:3] == ['device', 'wifi', 'rescan']:
+                return self._result(args, 0)
+            if rest[:3] == ['device', 'wifi', 'connect'] and len(rest) > 3:
+                options = dict(zip(rest[4::2], rest[5::2]))
+                return self._connect(args, rest[3], options.get('password', ''))
+            if rest[:3] == ['device', 'wifi', 'hotspot']:
+                options = dict(zip(rest[3::2], rest[4::2]))
+                return self._hotspot(args, options.get('ssid', 'Hotspot'), options.get('password', ''))
+        return self._result(args, 2, stderr=f"Error: unsupported command {' '.join(rest)}")
+
+    def _device_show(self, fields) -> str:
+        if self.active is None:
+            return ''
+        address = HOTSPOT_ADDRESS if self.connections[self.active]['hotspot'] else CLIENT_ADDRESS
+        return f"IP4.ADDRESS[1]:{address}\n" if fields in (None, ['IP4.ADDRESS']) else ''
+
+    def _delete(self, args, name):
+        if name not in self.connections:
+            return self._result(args, 10, stderr=f"Error: unknown connection '{name}'.")
+        del self.connections[name]
+        if self.active == name:
+            self.active = None
+            self._emit(f"{self.iface}: disconnected")
+        self._emit(f"{name}: connection profile removed")
+        return self._result(args, 0, f"Connection '{name}' successfully deleted.\n")
+
+    def _up(self, args, name):
+        profile = self.connections.get(name)
+        if profile is None:
+            return self._result(args, 10, stderr=f"Error: unknown connection '{name}'.")
+        if not profile['hotspot'] and profile['ssid'] not in self.ssids:
+            return self._result(args, 4, stderr='Error: Connection activation failed: No network with SSID found.')
+        self._activate(name)
+        return self._result(args, 0, 'Connection successfully activated\n')
+
+    def _connect(self, args, ssid, password):
+        if ssid not in self.ssids:
+            return self._result(args, 10, stderr=f"Error: No network with SSID '{ssid}' found.")
+        if len(password) < 8:
+            return self._result(args, 4, stderr='Error: Connection activation failed: Secrets were required, '
+                                                'but not provided.')
+        self.connections[ssid] = {'ssid': ssid, 'password': password, 'hotspot': False}
+        self._emit(f"{ssid}: connection profile created")
+        self._activate(ssid)
+        return self._result(args, 0, f"Device '{self.iface}' successfully activated.\n")
+
+    def _hotspot(self, args, ssid, password):
+        self.connections['Hotspot'] = {'ssid': ssid, 'password': password, 'hotspot': True}
+        self._emit('Hotspot: connection profile created')
+        self._activate('Hotspot')
+        return self._result(args, 0, f"Hotspot password: {password}\n")
+
+    def _activate(self, name):
+        """Switch the device to a profile; blocks like nmcli does until it is activated."""
+        if self.active is not None:
+            self._emit(f"{self.iface}: disconnected")
+        self.active = None
+        self._emit(f"{self.iface}: connecting (prepare)")
+        self._emit(f"{self.iface}: using connection '{name}'")
+        time.sleep(self.delay)
+        self.active = name
+        self._emit(f"{self.iface}: connected")
+
+    @staticmethod
+    def _result(args, returncode, stdout='', stderr=''):
+        return subprocess.CompletedProcess(args=args, returncode=returncode, stdout=stdout, stderr=stderr)
+
+    # -- nmcli monitor ------------------------------------------------------
+
+    def _emit(self, line: str):
+        for subscriber in list(self.subscribers):
+            subscriber.put(line)
+
+    def monitor(self) -> Iterator[str]:
+        """Yield change lines like `nmcli monitor`, forever."""
+        lines = queue.Queue()
+        with self.lock:
+            self.subscribers.append(lines)
+            state = 'connected' if self.active is not None else 'disconnected'
+        try:
+            yield f"{self.iface}: {state}"
+            while True:
+                yield lines.get()
+        finally:
+            self.subscribers.remove(lines)
@@ -0,0 +1,96 @@
+"""
+Production (WSGI) serving mode for dmScreen.
+
+The Flask app is served by waitress: a fixed pool of threads runs the
+requests while one event loop thread accepts connections, reads requests
+and writes responses, so slow or idle keep-alive connections hold no
+thread. Every open event stream and waiting long poll does hold one,
+which is what DM_WSGI_THREADS has to allow for.
+
+On SIGINT or SIGTERM the server drains: it stops accepting connections,
+tells waiting clients to finish, gives running requests up to
+DM_WSGI_DRAIN_SECONDS to complete and then returns, so the caller can shut
+down the worker systems cleanly.
+"""
+import os
+import signal
+import threading
+import time
+from typing import Callable, Optional
+
+# Threads running requests
+WSGI_THREADS = int(os.getenv('DM_WSGI_THREADS', '16'))
+# Connections waiting to be accepted
+WSGI_BACKLOG = int(os.getenv('DM_WSGI_BACKLOG', '128'))
+# Open connections at most; further clients wait in the backlog
+WSGI_CONNECTION_LIMIT = int(os.getenv('DM_WSGI_CONNECTION_LIMIT', '100'))
+# Seconds an idle (keep-alive) or stalled connection is kept open
+WSGI_CHANNEL_TIMEOUT = int(os.getenv('DM_WSGI_CHANNEL_TIMEOUT', '60'))
+# Seconds running requests get to complete on shutdown
+WSGI_DRAIN_SECONDS = float(os.getenv('DM_WSGI_DRAIN_SECONDS', '10'))
+
+
+def _busy_channels(server) -> int:
+    """Return the number of connections with a request running or a response left to send."""
+    return sum(1 for channel in list(server.active_channels.values())
+               if channel.requests or channel.total_outbufs_len)
+
+
+def serve(wsgi_app, host: str, port: int, on_stop: Optional[Callable[[], None]] = None):
+    """
+    Serve the WSGI app with waitress until SIGINT or SIGTERM, then drain.
+
+    Args:
+        wsgi_app: The Flask app
+        host: Address to listen on
+        port: Port to listen on
+        on_stop: Called when the server starts draining; ends event streams and long polls
+    """
+    try:
+        import waitress
+        from waitress import wasyncore
+    except ImportError:
+        raise RuntimeError("The waitress server mode needs waitress: pip install 'dmscreen[waitress]'")
+
+    server = waitress.create_server(
+        wsgi_app,
+        host=host,
+        port=port,
+        threads=WSGI_THREADS,
+        backlog=WSGI_BACKLOG,
+        connection_limit=WSGI_CONNECTION_LIMIT,
+        channel_timeout=WSGI_CHANNEL_TIMEOUT,
+        cleanup_interval=min(30, WSGI_CHANNEL_TIMEOUT),
+        asyncore_use_poll=True,
+        ident='dmScreen',
+    )
+    socket_map = server._map
+    stopping = threading.Event()
+
+    def request_stop(signum, frame):
+        stopping.set()
+        server.pull_trigger()
+
+    previous_handlers = {signum: signal.signal(signum, request_stop) for signum in (signal.SIGINT, signal.SIGTERM)}
+    try:
+        while not stopping.is_set():
+            wasyncore.loop(timeout=1.0, use_poll=True, map=socket_map, count=1)
+
+        print(f'draining connections (at most {WSGI_DRAIN_SECONDS:g}s)')
+        # Stop accepting; the trigger stays open to wake the loop for responses
+        wasyncore.dispatcher.close(server)
+        if on_stop is not None:
+            on_stop()
+        deadline = time.monotonic() + WSGI_DRAIN_SECONDS
+        while _busy_channels(server) and time.monotonic() < deadline:
+            wasyncore.loop(timeout=0.2, use_poll=True, map=socket_map, count=1)
+        busy = _busy_channels(server)
+        if busy:
+            print(f'closing {busy} connection(s) with unfinished requests')
+    finally:
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
+        for channel in list(server.active_channels.values()):
+            channel.close()
+        server.task_dispatcher.shutdown(timeout=1)
+        server.close()
@@ -29,6 +29,8 @@ const adminTitleInput = document.getElementById('admin-title');
 const saveAdminTitleBtn = document.getElementById('save-admin-title');
 const pageTitleEl = document.getElementById('page-title');
 const regenerateThumbnailsBtn = document.getElementById('regenerate-thumbnails-btn');
+const uploadDownscaleInput = document.getElementById('upload-downscale');
+const uploadMaxDimensionInput = document.getElementById('upload-max-dimension');
 
 // Color utility functions
 function hexToRgb(hex) {
@@ -282,10 +284,6 @@ async function showConfirm(message, title = 'Confirmation') {
 
 }
 
-// Polling variables
-let lastUpdateTimestamp = 0;
-// Long polling is now used instead of fixed interval polling
-
 // Track previous network signature to detect changes
 let _prevNetworkSignature = null;
 
@@ -296,8 +294,21 @@ document.addEventListener('DOMContentLoaded', () => {
     // Request current state from server
     fetchCurrentState();
 
-    // Start polling for updates
-    startPolling();
+    // Follow changes pushed by the server (long polling where event streams are not available)
+    const handlers = {
+        hello: handleNetworkStatus,
+        resync: () => fetchCurrentState(),
+        state: () => fetchCurrentState(),
+        image: () => fetchCurrentState(),
+        display: (data) => updateSettings(data.settings),
+        processing: () => {
+            if (processingPollingActive) {
+                checkImageProcessingStatus();
+            }
+        },
+        network: handleNetworkStatus
+    };
+    connectEventStream(handlers, () => pollEvents(handlers));
 
     // Check networking status and conditionally initialize WiFi features
     checkNetworkingStatus().then(networkingEnabled => {
@@ -376,43 +387,49 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
 
-    // Regenerate thumbnails
+    // Regenerate thumbnails (background job on the server)
     if (regenerateThumbnailsBtn) {
         regenerateThumbnailsBtn.addEventListener('click', async () => {
-            // Ask for confirmation before starting
-            const confirmed = confirm('This will clear the cache and regenerate all thumbnails. This may take a few moments depending on the number of images. Continue?');
-            if (!confirmed) return;
+            const fullCheckbox = document.getElementById('regenerate-thumbnails-full');
+            const full = !!(fullCheckbox && fullCheckbox.checked);
+            if (full) {
+                // Ask for confirmation before clearing the cache
+                const confirmed = confirm('This will clear the cache and regenerate all thumbnails in the background. Continue?');
+                if (!confirmed) return;
+            }
 
             try { if (typeof showBackdrop === 'function') showBackdrop('Regenerating thumbnails...'); } catch (_) {}
             try {
                 const response = await fetch('/api/regenerate-thumbnails', {
                     method: 'POST',
-                    headers: { 'Content-Type': 'application/json' }
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ full })
                 });
-                const data = await response.json();
+                let status = await response.json();
+                if (!response.ok) {
+                    throw new Error(status.error || 'Failed to regenerate thumbnails');
+                }
+
+                // Follow the progress with long polling until the run is finished
+                while (status.state === 'running') {
+                    const eta = status.eta_seconds != null ? `, ~${Math.ceil(status.eta_seconds)}s left` : '';
+                    try { if (typeof showBackdrop === 'function') showBackdrop(`Regenerating thumbnails ${status.done}/${status.total}${eta}`); } catch (_) {}
+                    const poll = await fetch(`/api/regenerate-thumbnails?done=${status.done}`);
+                    status = await poll.json();
+                }
                 try { if (typeof hideBackdrop === 'function') hideBackdrop(); } catch (_) {}
-                
-                if (response.ok && data.success) {
-                    const message = `Successfully regenerated thumbnails!\n\n` +
-                                  `Cache cleared: ${data.cache_cleared} files\n` +
-                                  `Thumbnails regenerated: ${data.thumbnails_regenerated} of ${data.total_images}\n` +
-                                  `Errors: ${data.errors}`;
-                    if (typeof showAlert === 'function') {
-                        showAlert(message, 'Success');
-                    } else {
-                        alert(message);
-                    }
-                    // Refresh the gallery to show updated thumbnails
-                    if (typeof fetchCurrentState === 'function') {
-                        fetchCurrentState();
-                    }
+
+                const message = `Thumbnails regenerated: ${status.done - status.errors} of ${status.total}\n` +
+                              `Up to date: ${status.skipped}\n` +
+                              `Errors: ${status.errors}`;
+                if (typeof showAlert === 'function') {
+                    showAlert(message, 'Success');
                 } else {
-                    const errorMsg = data.error || 'Failed to regenerate thumbnails';
-                    if (typeof showAlert === 'function') {
-                        showAlert(errorMsg, 'Error');
-                    } else {
-                        alert('Error: ' + errorMsg);
-                    }
+                    alert(message);
+                }
+                // Refresh the gallery to show updated thumbnails
+                if (typeof fetchCurrentState === 'function') {
+                    fetchCurrentState();
                 }
             } catch (e) {
                 try { if (typeof hideBackdrop === 'function') hideBackdrop(); } catch (_) {}
@@ -428,75 +445,49 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 });
 
-// Long polling functions
-function startPolling() {
-    // Start long polling loop
-    fetchUpdates();
-}
-
-async function fetchUpdates() {
-    try {
-        // Long polling: pass current timestamp to server
-        const response = await fetch(`/api/updates?timestamp=${lastUpdateTimestamp}`);
-        const data = await response.json();
-
-        // Detect network change signature
-        const netSig = JSON.stringify({
-            instance_id: data.instance_id || null,
-            wifi_connected: data.wifi_connected || false,
-            ssid: data.ssid || null,
-            adhoc_active: data.adhoc_active || false,
-            ip: data.ip || null
-        });
-        if (_prevNetworkSignature === null) {
-            _prevNetworkSignature = netSig;
-        } else if (_prevNetworkSignature !== netSig) {
-            _prevNetworkSignature = netSig;
-            // Network conditions changed: refresh WiFi status in admin area
-            if (typeof checkWifiStatus === 'function') {
-                try { checkWifiStatus(); } catch (_) {}
-            }
-        }
-
-        // If AP/Adhoc is active, populate the SSID datalist for combo input
-        if (data.adhoc_active && Array.isArray(data.scanned_ssids) && wifiSSIDList) {
-            // Clear existing options
-            if (wifiSSIDList.children.length === 0){
-                const seen = new Set();
-                data.scanned_ssids.forEach(ssid => {
-                    const s = String(ssid || '').trim();
-                    if (!s || seen.has(s)) return;
-                    seen.add(s);
-                    const opt = document.createElement('option');
-                    opt.value = s;
-                    wifiSSIDList.appendChild(opt);
-                });
-            }
-        }
-
-        // If there's a new update, fetch the current state
-        if (data.timestamp > lastUpdateTimestamp) {
-            lastUpdateTimestamp = data.timestamp;
-            fetchCurrentState();
+// Refresh the WiFi section when the server's network status changed
+function handleNetworkStatus(data) {
+    // Detect network change signature
+    const netSig = JSON.stringify({
+        instance_id: data.instance_id || null,
+        wifi_connected: data.wifi_connected || false,
+        ssid: data.ssid || null,
+        adhoc_active: data.adhoc_active || false,
+        ip: data.ip || null
+    });
+    if (_prevNetworkSignature === null) {
+        _prevNetworkSignature = netSig;
+    } else if (_prevNetworkSignature !== netSig) {
+        _prevNetworkSignature = netSig;
+        // Network conditions changed: refresh WiFi status in admin area
+        if (typeof checkWifiStatus === 'function') {
+            try { checkWifiStatus(); } catch (_) {}
+        }
+    }
+
+    // If AP/Adhoc is active, populate the SSID datalist for combo input
+    if (data.adhoc_active && Array.isArray(data.scanned_ssids) && wifiSSIDList) {
+        // Clear existing options
+        if (wifiSSIDList.children.length === 0){
+            const seen = new Set();
+            data.scanned_ssids.forEach(ssid => {
+                const s = String(ssid || '').trim();
+                if (!s || seen.has(s)) return;
+                seen.add(s);
+                const opt = document.createElement('option');
+                opt.value = s;
+                wifiSSIDList.appendChild(opt);
+            });
         }
-    } catch (error) {
-        console.error('Error checking for updates:', error);
-        // Wait a bit before retrying on error
-        await new Promise(resolve => setTimeout(resolve, 5000));
     }
-    
-    // Immediately start next long poll request
-    fetchUpdates();
 }
 
 async function fetchCurrentState() {
     try {
-        const response = await fetch('/api/current_state');
+        // Tell the server which folder we are working in so it can prepare its images
+        const response = await fetch(`/api/current_state?folder=${encodeURIComponent(currentFolderId || '')}`);
         const data = await response.json();
 
-        // Update last timestamp
-        lastUpdateTimestamp = data.timestamp;
-
         // Store all folders for reference
         if (data.folders) {
             allFolders = data.folders;
@@ -1138,6 +1129,82 @@ function convertImageToWebP(file, quality = 0.8) {
     });
 }
 
+// Client-side downscaling: images are decoded and shrunk in Web Workers
+// (OffscreenCanvas), so the page stays responsive during big batches
+const RESIZE_WORKER_COUNT = Math.min(2, navigator.hardwareConcurrency || 1);
+let resizeWorkers = null;
+let resizeJobId = 0;
+const resizeJobs = new Map();
+
+function supportsWorkerResize() {
+    return typeof Worker !== 'undefined' && typeof OffscreenCanvas !== 'undefined' &&
+        typeof createImageBitmap !== 'undefined';
+}
+
+function getResizeWorker(jobId) {
+    if (!resizeWorkers) {
+        resizeWorkers = [];
+        for (let i = 0; i < RESIZE_WORKER_COUNT; i++) {
+            const worker = new Worker('js/resize-worker.js');
+            worker.onmessage = (e) => {
+                const job = resizeJobs.get(e.data.id);
+                resizeJobs.delete(e.data.id);
+                if (!job) return;
+                if (e.data.error) {
+                    job.reject(new Error(e.data.error));
+                } else {
+                    job.resolve(e.data);
+                }
+            };
+            resizeWorkers.push(worker);
+        }
+    }
+    return resizeWorkers[jobId % resizeWorkers.length];
+}
+
+// True if file is an animated WebP: an extended (VP8X) file with the animation flag set
+async function isAnimatedWebP(file) {
+    const header = new Uint8Array(await file.slice(0, 21).arrayBuffer());
+    const text = (start, end) => String.fromCharCode(...header.slice(start, end));
+    return header.length === 21 && text(0, 4) === 'RIFF' && text(8, 16) === 'WEBPVP8X' && (header[20] & 0x02) !== 0;
+}
+
+// Resolve with a copy of file that is at most maxDimension pixels wide and high,
+// or with the file itself if that would not make it smaller
+async function resizeForUpload(file, maxDimension, quality = 0.85) {
+    if (file.type === 'image/gif' || (file.type === 'image/webp' && await isAnimatedWebP(file))) {
+        // A canvas only keeps the first frame of an animation
+        return file;
+    }
+    const id = ++resizeJobId;
+    const result = await new Promise((resolve, reject) => {
+        resizeJobs.set(id, { resolve, reject });
+        getResizeWorker(id).postMessage({ id, file, maxDimension, quality });
+    });
+    if (!result.resized && result.blob.size >= file.size) {
+        return file;
+    }
+    const extension = result.blob.type === 'image/webp' ? '.webp' : '.jpg';
+    return new File([result.blob], file.name.replace(/\.[^/.]+$/, extension), {
+        type: result.blob.type,
+        lastModified: Date.now()
+    });
+}
+
+// Remember the downscaling settings in this browser
+uploadDownscaleInput.checked = localStorage.getItem('uploadDownscale') === 'true';
+uploadMaxDimensionInput.value = localStorage.getItem('uploadMaxDimension') || uploadMaxDimensionInput.value;
+if (!supportsWorkerResize()) {
+    uploadDownscaleInput.checked = false;
+    uploadDownscaleInput.disabled = true;
+}
+uploadDownscaleInput.addEventListener('change', () => {
+    localStorage.setItem('uploadDownscale', uploadDownscaleInput.checked);
+});
+uploadMaxDimensionInput.addEventListener('change', () => {
+    localStorage.setItem('uploadMaxDimension', uploadMaxDimensionInput.value);
+});
+
 // Überprüfe WebP-Unterstützung des Browsers
 function checkWebPSupport() {
     return new Promise((resolve) => {
@@ -1151,7 +1218,8 @@ function checkWebPSupport() {
 
 // Batch-Konvertierung mehrerer Bilder
 async function convertImagesToWebP(files, quality = 0.8, onProgress = null) {
-    const supportedFormats = ['image/jpeg', 'image/jpg', 'image/png', 'image/gif', 'image/bmp'];
+    // GIFs are uploaded as they are, so animations stay animated
+    const supportedFormats = ['image/jpeg', 'image/jpg', 'image/png', 'image/bmp'];
     const convertedFiles = [];
 
     for (let i = 0; i < files.length; i++) {
@@ -1195,13 +1263,17 @@ uploadForm.addEventListener('submit', async (e) => {
         return;
     }
 
+    // Downscaling in workers replaces the WebP conversion on the page
+    const downscale = uploadDownscaleInput.checked && supportsWorkerResize();
+    const maxDimension = Math.max(256, parseInt(uploadMaxDimensionInput.value) || 4096);
+
     // WebP-Unterstützung prüfen
-    const supportsWebP = await checkWebPSupport();
-    if (!supportsWebP) {
+    const supportsWebP = !downscale && await checkWebPSupport();
+    if (!downscale && !supportsWebP) {
         console.warn('Browser unterstützt WebP nicht vollständig, verwende Originalformate');
     }
 
-    showBackdrop('Konvertiere Bilder zu WebP...');
+    showBackdrop(downscale ? 'Verkleinere Bilder...' : 'Konvertiere Bilder zu WebP...');
 
     imagePreviewContainer.style.display = 'none';
     imagePreviewList.innerHTML = '';
@@ -1231,31 +1303,42 @@ uploadForm.addEventListener('submit', async (e) => {
 
         showBackdrop('Lade Bilder hoch...');
 
-        const formData = new FormData();
-
-        // Add folder ID if selected
-        if (folderSelect.value) {
-            formData.append('folder', folderSelect.value);
-        }
+        // Upload the files in resumable chunks, several at a time. When downscaling,
+        // the next images are shrunk in the workers while earlier ones are uploading.
+        const sentBytes = entries.map(() => 0);
+        const totalBytes = entries.map(entry => entry.file.size);
+        let uploadedCount = 0;
+        const showUploadProgress = () => {
+            const total = totalBytes.reduce((a, b) => a + b, 0);
+            const percent = total ? Math.round(sentBytes.reduce((a, b) => a + b, 0) / total * 100) : 100;
+            showBackdrop(`Lade Bilder hoch: ${uploadedCount}/${entries.length} fertig (${percent}%)`);
+        };
 
-        // Add each converted file and its name to the form data, keeping order of entries
-        entries.forEach((entry, i) => {
-            const file = convertedFiles[i];
+        const folder = folderSelect.value || null;
+        await runWithConcurrency(entries, UPLOAD_CONCURRENCY, async (entry, i) => {
+            let file = convertedFiles[i];
+            if (downscale) {
+                try {
+                    file = await resizeForUpload(file, maxDimension);
+                } catch (error) {
+                    console.error(`Fehler beim Verkleinern von ${file.name}:`, error);
+                }
+                totalBytes[i] = file.size;
+            }
             const nameInput = entry.row.querySelector('.image-name-input');
-            const name = (nameInput.value || '').trim() || file.name.replace(/\.[^\/.]+$/, "");
-            formData.append('files[]', file);
-            formData.append('names[]', name);
-        });
-
-        const response = await fetch('/api/images', {
-            method: 'POST',
-            body: formData
+            const name = (nameInput.value || '').trim() || entry.file.name.replace(/\.[^\/.]+$/, "");
+            await uploadFileChunked(file, {
+                name,
+                folder,
+                onProgress: (sent) => {
+                    sentBytes[i] = sent;
+                    showUploadProgress();
+                }
+            });
+            uploadedCount++;
+            showUploadProgress();
         });
 
-        if (!response.ok) {
-            throw new Error('Fehler beim Upload der Bilder');
-        }
-
         // Reset form and preview
         uploadForm.reset();
         selectedFiles = [];
@@ -1726,7 +1809,7 @@ function addImageToGallery(image) {
 
     item.innerHTML = `
         <div class="thumb-container">
-        <img src="/img/crop_${imagePath}?t=${Date.now()}" alt="${image.name}" class="gallery-image" data-original-path="${image.path}" data-thumb-path="${imagePath}">
+        <img src="${imageUrl(image.id, 'thumb')}" alt="${image.name}" class="gallery-image" data-original-path="${image.path}" data-thumb-path="${imagePath}">
         </div>
         <div class="gallery-controls">
             <div class="gallery-title" data-id="${image.id}">${image.name}</div>
@@ -1741,6 +1824,15 @@ function addImageToGallery(image) {
         </div>
     `;
 
+    // Paint the placeholder from the image record until the thumbnail has loaded
+    if (image.placeholder) {
+        const thumbContainer = item.querySelector('.thumb-container');
+        thumbContainer.style.backgroundImage = `url("${image.placeholder}")`;
+        item.querySelector('.gallery-image').addEventListener('load', () => {
+            thumbContainer.style.backgroundImage = '';
+        }, { once: true });
+    }
+
     gallery.appendChild(item);
 
     // Add event listeners
@@ -1895,30 +1987,19 @@ function updateSettings(settings) {
         const screensaverImg = document.getElementById('screensaver-preview-img');
         const screensaverText = document.getElementById('screensaver-preview-text');
 
-        // Fetch the image URL from the server
-        fetch(`/api/image/${settings.screensaver}/url?thumb=true&t=${Date.now()}`)
-            .then(response => {
-                if (!response.ok) {
-                    throw new Error('Failed to fetch screensaver image URL');
-                }
-                return response.json();
-            })
-            .then(data => {
-                const imgUrl = data.url;
-                const imageName = data.name;
-                
-                screensaverImg.src = imgUrl;
-                screensaverImg.alt = imageName;
-                screensaverImg.style.display = 'block';
-                screensaverText.style.display = 'none';
-            })
-            .catch(error => {
-                console.error('Error fetching screensaver image URL:', error);
-                // If image not found, show text
-                screensaverText.textContent = 'Selected screensaver image not found';
-                screensaverText.style.display = 'block';
-                screensaverImg.style.display = 'none';
-            });
+        const screensaverImage = allImages.find(img => img.id === settings.screensaver);
+        screensaverImg.onload = () => {
+            screensaverImg.style.display = 'block';
+            screensaverText.style.display = 'none';
+        };
+        screensaverImg.onerror = () => {
+            // If image not found, show text
+            screensaverText.textContent = 'Selected screensaver image not found';
+            screensaverText.style.display = 'block';
+            screensaverImg.style.display = 'none';
+        };
+        screensaverImg.alt = screensaverImage ? screensaverImage.name : '';
+        screensaverImg.src = imageUrl(settings.screensaver, 'thumb');
     } else {
         screensaverSelect.value = '';
 
@@ -1964,65 +2045,43 @@ function updateSettings(settings) {
     updatePreview(settings);
 }
 
-async function updatePreview(settings) {
+function updatePreview(settings) {
     // Clear the canvas
     previewCtx.clearRect(0, 0, previewCanvas.width, previewCanvas.height);
     const w = previewCanvas.clientWidth;
 
-    if (settings.current_image) {
-        try {
-            // Fetch the image URL from the server with cache-busting timestamp
-            const response = await fetch(`/api/image/${settings.current_image}/url?w=${w}&t=${Date.now()}`);
-            if (!response.ok) {
-                throw new Error('Failed to fetch image URL');
-            }
-            
-            const data = await response.json();
-            const imgUrl = data.url;
-            const imageName = data.name;
-
-            // Load the image and draw it on the canvas
-            const img = new Image();
-            img.onload = function () {
-                drawImageContain(previewCtx, img, previewCanvas.width, previewCanvas.height);
-            };
-            img.src = imgUrl;
+    const imageId = settings.current_image || settings.screensaver;
+    if (imageId) {
+        const image = allImages.find(img => img.id === imageId);
+        const imageName = image ? image.name : '';
 
-            previewStatus.textContent = `Currently displaying: ${imageName}`;
-        } catch (error) {
-            console.error('Error fetching image URL:', error);
-            previewStatus.textContent = 'Error loading preview';
-        }
-    } else if (settings.screensaver) {
-        try {
-            // Fetch the image URL from the server with cache-busting timestamp
-            const response = await fetch(`/api/image/${settings.screensaver}/url?w=${w}&t=${Date.now()}`);
-            if (!response.ok) {
-                throw new Error('Failed to fetch screensaver image URL');
-            }
-            
-            const data = await response.json();
-            const imgUrl = data.url;
-            const imageName = data.name;
-
-            // Load the image and draw it on the canvas
-            const img = new Image();
-            img.onload = function () {
-                drawImageContain(previewCtx, img, previewCanvas.width, previewCanvas.height);
-            };
-            img.src = imgUrl;
+        // Load the image and draw it on the canvas
+        const img = new Image();
+        img.onload = function () {
+            drawImageContain(previewCtx, img, previewCanvas.width, previewCanvas.height);
+        };
+        img.onerror = function () {
+            console.error('Error loading preview of image', imageId);
+            previewStatus.textContent = settings.current_image ? 'Error loading preview' : 'Error loading screensaver preview';
+        };
+        img.src = imageUrl(imageId, 'crop', w);
 
-            previewStatus.textContent = `Showing screensaver: ${imageName}`;
-        } catch (error) {
-            console.error('Error fetching screensaver image URL:', error);
-            previewStatus.textContent = 'Error loading screensaver preview';
-        }
+        previewStatus.textContent = settings.current_image
+            ? `Currently displaying: ${imageName}`
+            : `Showing screensaver: ${imageName}`;
     } else {
         // No image is displayed
         previewStatus.textContent = 'No image is currently displayed.';
     }
 }
 
+// URL of a variant ('crop', 'full' or 'thumb') of an image, optionally at most w pixels wide;
+// the timestamp makes the browser load it again after the image was changed
+function imageUrl(imageId, variant, w) {
+    const width = w ? `&w=${w}` : '';
+    return `/img/by-id/${imageId}/${variant}?t=${Date.now()}${width}`;
+}
+
 async function displayImage(imageId) {
     try {
         const response = await fetch('/api/display', {
@@ -2188,7 +2247,7 @@ async function openCropModal(imageId) {
             // Load the image into the crop preview
             // Use fixed 500px width to load the thumbnail instead of full size
             // This prevents RAM spike and loads much faster
-            const imgUrl = `/img/${currentImageData.path}?t=${Date.now()}&w=500`;
+            const imgUrl = imageUrl(currentImageData.id, 'full', 500);
 
             // Create a new Image object
             currentImageElement = new Image();
@@ -2679,48 +2738,42 @@ async function saveCropSettings() {
     }
 }
 
-// Image processing status long polling
+// Image processing status; checked again on every 'processing' event
 let processingPollingActive = false;
 
 async function checkImageProcessingStatus() {
     try {
-        // Get current count for long polling
-        let currentCount = -1;
-        
-        while (processingPollingActive) {
-            const response = await fetch(`/api/images/processing-status?count=${currentCount}`);
-            if (!response.ok) {
-                await new Promise(resolve => setTimeout(resolve, 5000));
-                continue;
-            }
-            
-            const data = await response.json();
-            const processingImages = data.processing_images || [];
-            currentCount = processingImages.length;
-            
-            // If there are still images being processed, update UI and continue
-            if (processingImages.length > 0) {
-                const pendingCount = processingImages.filter(img => img.status === 'pending').length;
-                const processingCount = processingImages.filter(img => img.status === 'processing').length;
-                const failedCount = processingImages.filter(img => img.status === 'failed').length;
-                
-                let message = 'Bilder werden verarbeitet...';
-                if (processingCount > 0) {
-                    message = `Verarbeite ${processingCount} Bild(er)...`;
-                } else if (pendingCount > 0) {
-                    message = `${pendingCount} Bild(er) warten auf Verarbeitung...`;
-                }
-                
-                showBackdrop(message);
-                // Continue long polling loop
-            } else {
-                // All processing complete
-                stopImageProcessingPolling();
-                hideBackdrop();
-                showAlert('Bilder erfolgreich hochgeladen und verarbeitet!', 'Erfolg');
-                fetchCurrentState();
-                break;
+        const response = await fetch('/api/images/processing-status');
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+
+        const data = await response.json();
+        if (!processingPollingActive) {
+            // Finished by a check that was triggered in the meantime
+            return;
+        }
+        const processingImages = data.processing_images || [];
+
+        // If there are still images being processed, update UI and wait for the next event
+        if (processingImages.length > 0) {
+            const pendingCount = processingImages.filter(img => img.status === 'pending').length;
+            const processingCount = processingImages.filter(img => img.status === 'processing').length;
+
+            let message = 'Bilder werden verarbeitet...';
+            if (processingCount > 0) {
+                message = `Verarbeite ${processingCount} Bild(er)...`;
+            } else if (pendingCount > 0) {
+                message = `${pendingCount} Bild(er) warten auf Verarbeitung...`;
             }
+
+            showBackdrop(message);
+        } else {
+            // All processing complete
+            stopImageProcessingPolling();
+            hideBackdrop();
+            showAlert('Bilder erfolgreich hochgeladen und verarbeitet!', 'Erfolg');
+            fetchCurrentState();
         }
     } catch (error) {
         console.error('Error checking processing status:', error);
@@ -2736,10 +2789,8 @@ async function checkImageProcessingStatus() {
 }
 
 function startImageProcessingPolling() {
-    // Set flag to start long polling loop
+    // 'processing' events trigger further checks while the flag is set
     processingPollingActive = true;
-    
-    // Start long polling
     checkImageProcessingStatus();
 }
 
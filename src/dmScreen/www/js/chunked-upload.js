@@ -0,0 +1,209 @@
+// Resumable chunked uploads (POST /api/uploads -> PUT chunks -> POST /api/uploads/<id>/finalize)
+
+// Minimal incremental SHA-256. crypto.subtle is not available on plain-http
+// origins such as the screen's LAN address, and it cannot hash incrementally.
+const SHA256_K = new Uint32Array([
+    0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+    0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+    0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+    0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+    0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+    0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+    0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+    0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2
+]);
+
+class Sha256 {
+    constructor() {
+        this.h = new Uint32Array([
+            0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a, 0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19
+        ]);
+        this.w = new Uint32Array(64);
+        this.buffer = new Uint8Array(64);
+        this.bufferLength = 0;
+        this.bytes = 0;
+    }
+
+    update(data) {
+        let i = 0;
+        this.bytes += data.length;
+        if (this.bufferLength > 0) {
+            const n = Math.min(64 - this.bufferLength, data.length);
+            this.buffer.set(data.subarray(0, n), this.bufferLength);
+            this.bufferLength += n;
+            i = n;
+            if (this.bufferLength === 64) {
+                this.block(this.buffer, 0);
+                this.bufferLength = 0;
+            }
+        }
+        for (; i + 64 <= data.length; i += 64) {
+            this.block(data, i);
+        }
+        if (i < data.length) {
+            this.buffer.set(data.subarray(i), 0);
+            this.bufferLength = data.length - i;
+        }
+        return this;
+    }
+
+    hex() {
+        // Padding: 0x80, zeros, then the message length in bits (64-bit big endian)
+        const bitsHigh = Math.floor(this.bytes / 0x20000000);
+        const bitsLow = (this.bytes << 3) >>> 0;
+        const padding = new Uint8Array((this.bufferLength < 56 ? 56 : 120) - this.bufferLength + 8);
+        padding[0] = 0x80;
+        const view = new DataView(padding.buffer);
+        view.setUint32(padding.length - 8, bitsHigh);
+        view.setUint32(padding.length - 4, bitsLow);
+        this.update(padding);
+        return Array.from(this.h, x => x.toString(16).padStart(8, '0')).join('');
+    }
+
+    block(data, offset) {
+        const w = this.w;
+        const ror = (x, n) => (x >>> n) | (x << (32 - n));
+        for (let t = 0; t < 16; t++) {
+            const j = offset + t * 4;
+            w[t] = ((data[j] << 24) | (data[j + 1] << 16) | (data[j + 2] << 8) | data[j + 3]) >>> 0;
+        }
+        for (let t = 16; t < 64; t++) {
+            const s0 = ror(w[t - 15], 7) ^ ror(w[t - 15], 18) ^ (w[t - 15] >>> 3);
+            const s1 = ror(w[t - 2], 17) ^ ror(w[t - 2], 19) ^ (w[t - 2] >>> 10);
+            w[t] = (w[t - 16] + s0 + w[t - 7] + s1) >>> 0;
+        }
+        let [a, b, c, d, e, f, g, h] = this.h;
+        for (let t = 0; t < 64; t++) {
+            const t1 = (h + (ror(e, 6) ^ ror(e, 11) ^ ror(e, 25)) + ((e & f) ^ (~e & g)) + SHA256_K[t] + w[t]) >>> 0;
+            const t2 = ((ror(a, 2) ^ ror(a, 13) ^ ror(a, 22)) + ((a & b) ^ (a & c) ^ (b & c))) >>> 0;
+            h = g;
+            g = f;
+            f = e;
+            e = (d + t1) >>> 0;
+            d = c;
+            c = b;
+            b = a;
+            a = (t1 + t2) >>> 0;
+        }
+        this.h[0] = (this.h[0] + a) >>> 0;
+        this.h[1] = (this.h[1] + b) >>> 0;
+        this.h[2] = (this.h[2] + c) >>> 0;
+        this.h[3] = (this.h[3] + d) >>> 0;
+        this.h[4] = (this.h[4] + e) >>> 0;
+        this.h[5] = (this.h[5] + f) >>> 0;
+        this.h[6] = (this.h[6] + g) >>> 0;
+        this.h[7] = (this.h[7] + h) >>> 0;
+    }
+}
+
+const UPLOAD_MAX_RETRIES = 8;
+// Number of files uploaded at the same time
+const UPLOAD_CONCURRENCY = 3;
+
+function uploadDelay(attempt) {
+    // Exponential backoff capped at 15 seconds
+    return new Promise(resolve => setTimeout(resolve, Math.min(15000, 500 * Math.pow(2, attempt))));
+}
+
+// Upload one file in chunks. Network errors are retried from the offset the
+// server reports, so a dropped connection only costs the chunk in flight.
+// Resolves with the created image record.
+async function uploadFileChunked(file, { name = null, folder = null, onProgress = null } = {}) {
+    const createResponse = await fetch('/api/uploads', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ filename: file.name, size: file.size, name, folder })
+    });
+    if (!createResponse.ok) {
+        const data = await createResponse.json().catch(() => ({}));
+        throw new Error(data.error || `Upload of ${file.name} failed`);
+    }
+    const { upload_id: uploadId, chunk_size: chunkSize } = await createResponse.json();
+
+    const hasher = new Sha256();
+    let hashedUpTo = 0;
+    let offset = 0;
+    let attempt = 0;
+
+    while (offset < file.size) {
+        const end = Math.min(file.size, offset + chunkSize);
+        const chunk = new Uint8Array(await file.slice(offset, end).arrayBuffer());
+        try {
+            const response = await fetch(`/api/uploads/${uploadId}?offset=${offset}`, {
+                method: 'PUT',
+                headers: { 'Content-Type': 'application/octet-stream' },
+                body: chunk
+            });
+            const data = await response.json();
+            if (response.status === 409 || response.status === 413) {
+                // Server has a different view of the received data; continue from there
+                offset = data.offset;
+            } else if (!response.ok) {
+                throw new Error(data.error || 'Chunk upload failed');
+            } else {
+                if (offset === hashedUpTo) {
+                    hasher.update(chunk.subarray(0, data.offset - offset));
+                    hashedUpTo = data.offset;
+                }
+                offset = data.offset;
+                attempt = 0;
+            }
+        } catch (error) {
+            if (++attempt > UPLOAD_MAX_RETRIES) {
+                throw error;
+            }
+            await uploadDelay(attempt);
+            // Ask the server how much it actually received before retrying
+            try {
+                const status = await fetch(`/api/uploads/${uploadId}`);
+                if (status.ok) {
+                    offset = (await status.json()).offset;
+                }
+            } catch (_) {}
+        }
+
+        // Hash any part we skipped past (e.g. when the server already had it)
+        while (hashedUpTo < offset) {
+            const hashEnd = Math.min(offset, hashedUpTo + chunkSize);
+            hasher.update(new Uint8Array(await file.slice(hashedUpTo, hashEnd).arrayBuffer()));
+            hashedUpTo = hashEnd;
+        }
+
+        if (onProgress) {
+            onProgress(offset, file.size);
+        }
+    }
+
+    const finalizeResponse = await fetch(`/api/uploads/${uploadId}/finalize`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ sha256: hasher.hex() })
+    });
+    const result = await finalizeResponse.json();
+    if (!finalizeResponse.ok) {
+        throw new Error(result.error || `Upload of ${file.name} failed`);
+    }
+    return result;
+}
+
+// Run task(item, index) for all items, at most limit at a time. After a
+// failure no new tasks are started; rejects with the first error once the
+// running tasks have finished.
+async function runWithConcurrency(items, limit, task) {
+    let next = 0;
+    let failure = null;
+    const runner = async () => {
+        while (next < items.length && !failure) {
+            const index = next++;
+            try {
+                await task(items[index], index);
+            } catch (error) {
+                failure = failure || error;
+            }
+        }
+    };
+    await Promise.all(Array.from({ length: Math.min(limit, items.length) }, runner));
+    if (failure) {
+        throw failure;
+    }
+}
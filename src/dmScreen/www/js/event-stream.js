@@ -0,0 +1,92 @@
+// Change events from the server (GET /api/events, Server-Sent Events).
+// Browsers without EventSource, or connections that never get through
+// (e.g. a proxy that buffers the stream), fall back to long polling
+// /api/updates, which returns the same events (see pollEvents).
+
+const EVENT_TYPES = ['hello', 'resync', 'state', 'display', 'image', 'processing', 'network'];
+// Failed connection attempts before falling back, if the stream never opened
+const EVENT_STREAM_MAX_FAILURES = 3;
+
+// Connect to the event stream. handlers maps event types to functions called
+// with the event's data; fallback() is called once if the stream is not usable.
+// Returns the EventSource, or null if the browser has none.
+function connectEventStream(handlers, fallback) {
+    if (typeof EventSource === 'undefined') {
+        fallback();
+        return null;
+    }
+
+    const source = new EventSource('/api/events');
+    let opened = false;
+    let failures = 0;
+
+    source.onopen = () => {
+        opened = true;
+    };
+    source.onerror = () => {
+        // EventSource reconnects by itself and resumes with Last-Event-ID;
+        // it only gives up (CLOSED) on responses that are not an event stream
+        if (source.readyState === EventSource.CLOSED || (!opened && ++failures >= EVENT_STREAM_MAX_FAILURES)) {
+            source.close();
+            fallback();
+        }
+    };
+
+    EVENT_TYPES.forEach(type => {
+        if (!handlers[type]) return;
+        source.addEventListener(type, (e) => {
+            try {
+                handlers[type](JSON.parse(e.data));
+            } catch (error) {
+                console.error(`Error handling ${type} event:`, error);
+            }
+        });
+    });
+    return source;
+}
+
+// Long polling fallback: GET /api/updates?since=<cursor> returns the events
+// after the cursor of the previous response, so handlers receive the same
+// events as from the stream. 'hello' is called with the server status on the
+// first response and whenever the server instance changed, 'resync' whenever
+// the client has to reload its state (not on the first response).
+function pollEvents(handlers) {
+    let cursor = null;
+    let instanceId = null;
+
+    const dispatch = (type, data) => {
+        if (!handlers[type]) return;
+        try {
+            handlers[type](data);
+        } catch (error) {
+            console.error(`Error handling ${type} event:`, error);
+        }
+    };
+
+    const poll = async () => {
+        try {
+            const query = cursor ? `?since=${encodeURIComponent(cursor)}` : '';
+            const response = await fetch(`/api/updates${query}`);
+            const data = await response.json();
+
+            // On the first response the page is still loading its state; after that,
+            // resync (e.g. the server restarted) tells it to reload
+            if (data.resync && instanceId !== null) {
+                dispatch('resync', {});
+            }
+            if (data.instance_id !== instanceId) {
+                instanceId = data.instance_id;
+                dispatch('hello', data);
+            }
+            (data.events || []).forEach(event => dispatch(event.type, event.data));
+            cursor = data.cursor;
+        } catch (error) {
+            console.error('Error checking for updates:', error);
+            // Wait a bit before retrying on error
+            await new Promise(resolve => setTimeout(resolve, 5000));
+        }
+        // Immediately start next long poll request
+        poll();
+    };
+    poll();
+}
@@ -0,0 +1,42 @@
+// Decodes and downsizes images off the main thread before they are uploaded
+// (see resizeForUpload in admin.js).
+// In:  { id, file, maxDimension, quality }
+// Out: { id, blob, width, height, resized } or { id, error }
+
+// Images are handled one after another, so at most one decoded image per worker is held in memory
+let queue = Promise.resolve();
+
+self.onmessage = (e) => {
+    queue = queue.then(() => resize(e.data));
+};
+
+async function resize({ id, file, maxDimension, quality }) {
+    let bitmap = null;
+    try {
+        // Applies the EXIF orientation; the re-encoded file carries no EXIF data anymore
+        bitmap = await createImageBitmap(file, { imageOrientation: 'from-image' });
+        const scale = Math.min(1, maxDimension / Math.max(bitmap.width, bitmap.height));
+        const width = Math.max(1, Math.round(bitmap.width * scale));
+        const height = Math.max(1, Math.round(bitmap.height * scale));
+
+        const canvas = new OffscreenCanvas(width, height);
+        const ctx = canvas.getContext('2d');
+        ctx.imageSmoothingQuality = 'high';
+        ctx.drawImage(bitmap, 0, 0, width, height);
+        bitmap.close();
+        bitmap = null;
+
+        let blob = await canvas.convertToBlob({ type: 'image/webp', quality });
+        if (blob.type !== 'image/webp') {
+            // Browsers without a WebP encoder fall back to PNG, which would be larger than the original
+            blob = await canvas.convertToBlob({ type: 'image/jpeg', quality });
+        }
+        self.postMessage({ id, blob, width, height, resized: scale < 1 });
+    } catch (error) {
+        self.postMessage({ id, error: error.message || String(error) });
+    } finally {
+        if (bitmap) {
+            bitmap.close();
+        }
+    }
+}
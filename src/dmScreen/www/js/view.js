@@ -2,6 +2,7 @@
 const displayCanvas1 = document.getElementById('display-canvas-1');
 const displayCanvas2 = document.getElementById('display-canvas-2');
 const imageContainer = document.getElementById('image-container');
+const animationOverlay = document.getElementById('animation-overlay');
 const ipOverlay = document.getElementById('ip-overlay');
 
 // Canvas contexts
@@ -47,6 +48,15 @@ function drawImageContain(ctx, img, canvasWidth, canvasHeight) {
     ctx.drawImage(img, offsetX, offsetY, drawWidth, drawHeight);
 }
 
+// A canvas only draws the first frame of an animated image, so animated images
+// are shown in an <img> element over the canvases, which the browser animates
+function hideAnimation() {
+    animationOverlay.classList.add('hidden');
+    animationOverlay.onload = animationOverlay.onerror = null;
+    // Stops decoding the animation
+    animationOverlay.removeAttribute('src');
+}
+
 // Add CSS for fade transitions
 const style = document.createElement('style');
 style.textContent = `
@@ -81,155 +91,81 @@ resizeCanvas();
 window.addEventListener('resize', resizeCanvas);
 
 // Variables
-let settings = {
-    screensaver: null,
-    current_image: null
-};
-let images = [];
+// The image shown: the 'view' part of a display event (URLs, placeholder and size);
+// undefined until the first state is loaded
+let currentView;
 let isTransitioning = false;
-let lastUpdateTimestamp = 0;
-// Long polling is now used instead of fixed interval polling
 
 // Initialize
 document.addEventListener('DOMContentLoaded', () => {
-    // Request current state from server
-    fetchCurrentState();
-
-    // Start polling for updates
-    startPolling();
+    // Changes are pushed by the server; the state is loaded on the first 'hello'
+    const handlers = {
+        hello: (data) => {
+            if (!INSTANCE_ID) {
+                INSTANCE_ID = data.instance_id;
+                fetchView();
+            } else if (INSTANCE_ID !== data.instance_id) {
+                // server restarted -> reload view to reinitialize state
+                location.reload();
+            }
+            updateOverlay(data);
+        },
+        resync: () => fetchView(),
+        state: () => fetchView(),
+        // The event carries everything needed to show the image; only the image itself is loaded
+        display: (data) => applyView(data.view),
+        network: updateOverlay
+    };
+    connectEventStream(handlers, () => pollEvents(handlers));
 });
 
-// Long polling functions
-function startPolling() {
-    // Start long polling loop
-    fetchUpdates();
+// Shows the server address and WiFi details until an admin has connected
+function updateOverlay(data) {
+    if (data.admin_connected) {
+        ipOverlay.classList.add('hidden')
+    } else {
+        const parts = ["Server: " + data.ip];
+        if (data.wifi_connected && data.ssid) {
+            parts.push("WLAN: " + data.ssid);
+        } else if (data.adhoc_active) {
+            parts.push("Ad-hoc: SSID " + (data.adhoc_ssid || 'dmscreen') + " | Passwort " + (data.adhoc_password || 'dmscreen'));
+        }
+        ipOverlay.textContent = parts.join(' | ');
+        ipOverlay.classList.remove('hidden')
+    }
 }
 
-async function fetchUpdates() {
+// Load what to show in one request; the image is loaded right after it
+async function fetchView() {
     try {
-        // Long polling: pass current timestamp to server
-        const response = await fetch(`/api/updates?timestamp=${lastUpdateTimestamp}`);
-        const data = await response.json();
-
-        if (!INSTANCE_ID) {
-            // initialize instance id on first response
-            INSTANCE_ID = data.instance_id;
-        } else if (INSTANCE_ID !== data.instance_id) {
-            // server restarted -> reload view to reinitialize state
-            location.reload();
-        }
-
-
-        // If there's a new update, fetch the current state
-        if (data.timestamp > lastUpdateTimestamp) {
-            lastUpdateTimestamp = data.timestamp;
-            fetchCurrentState();
-        }
-        if (data.admin_connected) {
-            ipOverlay.classList.add('hidden')
-        } else {
-            const parts = ["Server: " + data.ip];
-            if (data.wifi_connected && data.ssid) {
-                parts.push("WLAN: " + data.ssid);
-            } else if (data.adhoc_active) {
-                parts.push("Ad-hoc: SSID " + (data.adhoc_ssid || 'dmscreen') + " | Passwort " + (data.adhoc_password || 'dmscreen'));
-            }
-            ipOverlay.textContent = parts.join(' | ');
-            ipOverlay.classList.remove('hidden')
-        }
+        const response = await fetch('/api/view/display', { cache: 'no-store' });
+        applyView(await response.json());
     } catch (error) {
-        console.error('Error checking for updates:', error);
-        // Wait a bit before retrying on error
-        await new Promise(resolve => setTimeout(resolve, 5000));
+        console.error('Error fetching view:', error);
     }
-    
-    // Immediately start next long poll request
-    fetchUpdates();
 }
 
-async function fetchCurrentState() {
-    try {
-        const response = await fetch('/api/current_state?t=' + Date.now());
-        const data = await response.json();
-
-        // Update last timestamp
-        lastUpdateTimestamp = data.timestamp;
-
-        // Check if images have changed
-        const oldImages = images;
-        const oldSettings = settings;
-
-        // Update data
-        settings = data.settings;
-        images = data.images;
-
-        // Handle image deletion
-        if (oldImages.length > 0 && oldSettings.current_image) {
-            const oldImage = oldImages.find(img => img.id === oldSettings.current_image);
-            const newImage = images.find(img => img.id === oldSettings.current_image);
-
-            if (oldImage && !newImage) {
-                // Image was deleted, update display
-                updateDisplay();
-                return;
-            }
-        }
-
-        // Handle settings changes
-        if (oldSettings.current_image !== settings.current_image ||
-            oldSettings.screensaver !== settings.screensaver) {
-            updateDisplay();
-            return;
-        }
-
-        // Handle image updates
-        if (settings.current_image) {
-            const oldImage = oldImages.find(img => img.id === settings.current_image);
-            const newImage = images.find(img => img.id === settings.current_image);
-
-            if (oldImage && newImage) {
-                // Check if path or name changed
-                if (oldImage.path !== newImage.path || oldImage.name !== newImage.name) {
-                    updateDisplay(true);
-                    return;
-                }
-
-                // If timestamp changed significantly and we're displaying this image,
-                // force a refresh to handle rotated images
-                if (settings.current_image) {
-                    updateDisplay(true);
-                    return;
-                }
-            }
-        }
-
-        // If this is the first load, update display
-        if (oldImages.length === 0) {
-            updateDisplay();
-        }
-    } catch (error) {
-        console.error('Error fetching current state:', error);
+// Take over a new view and update the display if another image (or another
+// version of it, after a transformation) is to be shown
+function applyView(view) {
+    const oldImage = currentView ? currentView.image : undefined;
+    currentView = view;
+    const newImage = view.image;
+    if (oldImage === undefined || !oldImage !== !newImage ||
+        (newImage && (oldImage.id !== newImage.id || oldImage.url !== newImage.url))) {
+        updateDisplay();
     }
 }
 
 // Functions
-function updateDisplay(forceRefresh = false) {
+function updateDisplay() {
     // If already transitioning, don't start another transition
     if (isTransitioning) return;
 
     isTransitioning = true;
 
-    // Determine which image to display
-    let imageToShow = null;
-
-    if (settings.current_image) {
-        // Show the currently selected image
-        imageToShow = images.find(img => img.id === settings.current_image);
-
-    } else if (settings.screensaver) {
-        // Show the screensaver image
-        imageToShow = images.find(img => img.id === settings.screensaver);
-    }
+    // The current image, or else the screensaver
+    const imageToShow = currentView.image;
 
     // Track if we're switching from thumbnail to full image (no cross-fade needed)
     const isSwitchingToFullImage = activeCanvas.dataset.loadingFullImage === 'true';
@@ -242,14 +178,10 @@ function updateDisplay(forceRefresh = false) {
 
             try {
                 if (!isSwitchingToFullImage) {
-                    // First load the thumbnail by fetching the URL from the server
-                    const response = await fetch(`/api/image/${imageToShow.id}/url?thumb=true&crop=true&t=${Date.now()}`);
-                    if (!response.ok) {
-                        throw new Error('Failed to fetch thumbnail URL');
-                    }
-
-                    const data = await response.json();
-                    const thumbnailUrl = data.url;
+                    hideAnimation();
+                    // First show a preview: the placeholder paints without a request;
+                    // older images without one fall back to the thumbnail
+                    const thumbnailUrl = imageToShow.placeholder || imageToShow.thumb_url;
 
                     // Create a new Image object for the thumbnail
                     const thumbnailImg = new Image();
@@ -299,16 +231,25 @@ function updateDisplay(forceRefresh = false) {
 
                     // Start loading the thumbnail
                     thumbnailImg.src = thumbnailUrl;
+                } else if (imageToShow.animated) {
+                    // Show the animation over the thumbnail once it has loaded
+                    const imageUrl = imageToShow.url;
+                    animationOverlay.onload = () => {
+                        animationOverlay.classList.remove('hidden');
+                        isTransitioning = false;
+                        delete activeCanvas.dataset.loadingFullImage;
+                    };
+                    animationOverlay.onerror = () => {
+                        console.error('Failed to load image:', imageUrl);
+                        // Keep showing the thumbnail
+                        hideAnimation();
+                        isTransitioning = false;
+                        delete activeCanvas.dataset.loadingFullImage;
+                    };
+                    animationOverlay.src = imageUrl;
                 } else {
                     // Now load the full-size image - draw on same canvas, no cross-fade
-                    const forceParam = forceRefresh ? '&force=1' : '';
-                    const response = await fetch(`/api/image/${imageToShow.id}/url?crop=true&t=${Date.now()}${forceParam}`);
-                    if (!response.ok) {
-                        throw new Error('Failed to fetch image URL');
-                    }
-
-                    const data = await response.json();
-                    const imageUrl = data.url;
+                    const imageUrl = imageToShow.url;
 
                     // Create a new Image object for the full image
                     const fullImg = new Image();
@@ -336,12 +277,13 @@ function updateDisplay(forceRefresh = false) {
                     fullImg.src = imageUrl;
                 }
             } catch (error) {
-                console.error('Error fetching image URL:', error);
+                console.error('Error loading image:', error);
                 isTransitioning = false;
                 delete activeCanvas.dataset.loadingFullImage;
             }
         } else {
             // No image to display - hide the container
+            hideAnimation();
             imageContainer.style.display = 'none';
             // Clear both canvases
             activeCtx.clearRect(0, 0, activeCanvas.width, activeCanvas.height);